@@ -6,8 +6,27 @@ Created on Mon Oct 12 13:37:39 2020
 @author: Camila Lozano
 """
 
+import time
+
 import vtk
 
+from isoband import GradientBandClipper, GradientBandMask
+from isobrick import BrickContourFilter, BrickPool
+from isocache import copyOutput
+from isocontour import (BACKENDS, ContourTimer, configureThreads,
+                        createContourFilter)
+from isocrop import VolumeCrop
+from isograd import openGradientMagnitude
+from isolatency import LatencyTracer
+from isolod import LevelOfDetail
+from isometa import loadMetadata, metadataBricks
+from isommap import openVolume, readVolume
+from isoprobe import createProbeFilter
+from isoprofile import PipelineProfiler
+from isopyramid import ProgressiveContour
+from isoschedule import InteractionScheduler
+from isospan import BRICK_SIZE, buildSpanSpaceIndex
+
 # Get Program Parameters
 def get_program_parameters():
     import argparse
@@ -15,13 +34,70 @@ def get_program_parameters():
     parser.add_argument('data_file', nargs='?', 
                         default=None, help='isosurface data vti file')
     parser.add_argument('grad_file', nargs='?', 
-                        default=None, help='gradient magnitude vti file')
+                        default=None, 
+                        help='gradient magnitude vti file (computed if omitted)')
     parser.add_argument('--val', dest='value', type=int, 
                         default=None, help='initial isovalue')
     parser.add_argument('--clip', dest='clip', nargs=3, 
                         type=int, default=None)
+    parser.add_argument('--span', dest='span', action='store_true', 
+                        help='contour with a span space index')
+    parser.add_argument('--progressive', dest='progressive', 
+                        action='store_true', 
+                        help='contour a coarser volume while dragging')
+    parser.add_argument('--frame-ms', dest='frame_ms', type=float, 
+                        default=50, help='target drag frame time (ms)')
+    parser.add_argument('--crop', dest='crop', action='store_true', 
+                        help='crop the volume to the clip box before contouring')
+    parser.add_argument('--render-clip', dest='render_clip', 
+                        action='store_true', 
+                        help='clip with the X/Y/Z planes while rendering')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS), 
+                        default='contour', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int, 
+                        default=None, help='contouring threads (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true', 
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--mask-grad', dest='mask_grad', action='store_true', 
+                        help='mask the gradient range instead of clipping')
+    parser.add_argument('--commit-clip', dest='commit_clip', 
+                        action='store_true', 
+                        help='clip the masked gradient range on release '
+                        '(needs --mask-grad)')
+    parser.add_argument('--fast-probe', dest='fast_probe', 
+                        action='store_true', 
+                        help='sample the computed gradient along contour edges')
+    parser.add_argument('--grad-cache', dest='grad_cache', type=str, 
+                        default=None, help='computed gradient cache directory')
+    parser.add_argument('--bricks', dest='bricks', type=int, 
+                        default=None, 
+                        help='contour and probe in bricks across this many processes')
+    parser.add_argument('--brick-size', dest='brick_size', type=int, 
+                        default=64, help='cells per brick side')
+    parser.add_argument('--profile', dest='profile', type=str, 
+                        default=None, 
+                        help='write per-stage pipeline timings (.json or .csv)')
+    parser.add_argument('--profile-overlay', dest='profile_overlay', 
+                        action='store_true', 
+                        help='show per-stage pipeline timings on screen')
+    parser.add_argument('--latency-log', dest='latency_log', type=str, 
+                        default=None, 
+                        help='write per-event slider latency records (.csv)')
+    parser.add_argument('--fps', dest='fps', type=float, default=30, 
+                        help='target frame rate of slider updates, skipping '
+                        'the values in between (0 updates on every event)')
+    parser.add_argument('--lod', dest='lod', action='store_true', 
+                        help='draw decimated proxies of the surfaces while '
+                        'the view moves, to hold the --fps frame rate')
     args = parser.parse_args()
-    return args.data_file, args.grad_file, args.value, args.clip
+    if args.commit_clip and not args.mask_grad:
+        parser.error("--commit-clip needs --mask-grad")
+    return (args.data_file, args.grad_file, args.value, args.clip, args.span, 
+            args.progressive, args.frame_ms, args.crop, args.render_clip, 
+            args.grad_cache, args.fast_probe, args.mask_grad, args.commit_clip, 
+            args.backend, args.threads, args.mmap, args.bricks, args.brick_size, 
+            args.profile, args.profile_overlay, 
+            args.latency_log, args.fps, args.lod)
 
 
 """
@@ -56,13 +132,15 @@ def createSlideBar(min_, max_, val, x1, x2, y, name):
     slideBar.SetLabelHeight(0.02)
     return slideBar
 
-# Create Slider Widget Method
-def createSliderWidget(slideBar, interactor):
+# Create Slider Widget Method (traces its latency when given a tracer)
+def createSliderWidget(slideBar, interactor, tracer=None):
     sliderWidget = vtk.vtkSliderWidget()
     sliderWidget.SetInteractor(interactor)
     sliderWidget.SetRepresentation(slideBar)
     sliderWidget.SetAnimationModeToAnimate()
     sliderWidget.SetEnabled(True)
+    if tracer is not None:
+        tracer.watchSlider(sliderWidget)
     return sliderWidget
 
 # Create Scalar Bar Method
@@ -86,16 +164,66 @@ def createScalarBarWidget(scalarBar, interactor):
     return scalarBarWidget
 
 
+"""
+- Pipeline Methods
+"""
+
+# Extract Isosurface Method
+def extractIsosurface(value):
+    global contours, surface, progressive, isovalue
+    isovalue = value
+    start = time.perf_counter()
+    contours.SetValue(0, value)
+    contours.Update()
+    surface.SetOutput(copyOutput(contours))
+    if progressive is not None:
+        progressive.recordTime(0, time.perf_counter() - start)
+
+# Extract Draft Isosurface Method (coarser pyramid level while dragging)
+def extractDraftIsosurface(value):
+    global surface, progressive, isovalue
+    level = progressive.chooseLevel()
+    if level == 0:
+        extractIsosurface(value)
+    else:
+        isovalue = value
+        surface.SetOutput(progressive.extract(value, level))
+
+# Update Gradient Range Method (masks instead of clipping when enabled)
+def updateGradRange():
+    global gradClipper, gradMask, valMinGrad, valMaxGrad
+    if gradMask is None:
+        gradClipper.SetRange(valMinGrad, valMaxGrad)
+    else:
+        gradMask.setRange(valMinGrad, valMaxGrad)
+
+# Move Crop Box Method (re-extracts the isosurface when cropping)
+def moveCrop(axis, value):
+    global crop, isovalue
+    if crop is not None:
+        crop.setLower(axis, value)
+        extractIsosurface(isovalue)
+
+
 """
 - Callback Methods
 """
 
 # Isovalue Slide Bar Callback Method
 def vtkIsovalueSlideBarCallback(obj, event):
-    global contours
+    global progressive
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
-    contours.SetValue(0, value)
+    if progressive is None:
+        extractIsosurface(value)
+    else:
+        extractDraftIsosurface(value)
+
+# Isovalue Slide Bar End Callback Method (refine to full resolution)
+def vtkIsovalueSlideBarEndCallback(obj, event):
+    slideBar = obj.GetRepresentation()
+    value = slideBar.GetValue()
+    extractIsosurface(value)
 
 # X Plane Value Slider Bar Callback Method
 def vtkXSlideBarCallback(obj, event):
@@ -103,6 +231,7 @@ def vtkXSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     xPlane.SetOrigin(value, 0, 0)
+    moveCrop(0, value)
     
 # Y Plane Value Slider Bar Callback Method
 def vtkYSlideBarCallback(obj, event):
@@ -110,6 +239,7 @@ def vtkYSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     yPlane.SetOrigin(0, value, 0)
+    moveCrop(1, value)
 
 # Z Plane Value Slider Bar Callback Method
 def vtkZSlideBarCallback(obj, event):
@@ -117,24 +247,35 @@ def vtkZSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     zPlane.SetOrigin(0, 0, value)
+    moveCrop(2, value)
 
 # Min Grad Value Slide Bar Callback Method
 def vtkGradMinSlideBarCallback(obj, event):
-    global valMinGrad, valMaxGrad, gradMinSlideBar, gradClipper1
+    global valMinGrad, valMaxGrad, gradMinSlideBar
     valMinGrad = obj.GetRepresentation().GetValue()
     if valMinGrad >= valMaxGrad:
         valMinGrad = valMaxGrad - 1
         gradMinSlideBar.SetValue(valMinGrad)
-    gradClipper1.SetValue(valMinGrad)
+    updateGradRange()
 
 # Max Grad Value Slide Bar Callback Method
 def vtkGradMaxSlideBarCallback(obj, event):
-    global valMinGrad, valMaxGrad, gradMaxSlideBar, gradClipper2
+    global valMinGrad, valMaxGrad, gradMaxSlideBar
     valMaxGrad = obj.GetRepresentation().GetValue()
     if valMaxGrad <= valMinGrad:
         valMaxGrad = valMinGrad + 1
         gradMaxSlideBar.SetValue(valMaxGrad)
-    gradClipper2.SetValue(valMaxGrad)
+    updateGradRange()
+
+# Grad Value Slide Bar Start Callback Method (uncommit the clip)
+def vtkGradSlideBarStartCallback(obj, event):
+    global gradClipper, gradRange
+    gradClipper.SetRange(*gradRange)
+
+# Grad Value Slide Bar End Callback Method (commit the masked range)
+def vtkGradSlideBarEndCallback(obj, event):
+    global gradClipper, valMinGrad, valMaxGrad
+    gradClipper.SetRange(valMinGrad, valMaxGrad)
 
 
 """
@@ -142,28 +283,44 @@ def vtkGradMaxSlideBarCallback(obj, event):
 """
 
 def main():
-    global contours, xPlane, yPlane, zPlane, gradClipper1, gradClipper2, valMinGrad, valMaxGrad, gradMinSlideBar, gradMaxSlideBar
+    global contours, surface, progressive, crop, xPlane, yPlane, zPlane, gradClipper, gradMask, gradRange, valMinGrad, valMaxGrad, gradMinSlideBar, gradMaxSlideBar
+    
+    (data_file, grad_file, val, clip, span, progressive, frame_ms, crop, 
+     render_clip, grad_cache, fast_probe, mask_grad, commit_clip, backend, 
+     threads, mmap, bricks, brick_size, profile, 
+     profile_overlay, latency_log, fps, lod) = get_program_parameters()
     
-    data_file, grad_file, val, clip = get_program_parameters()
+    # Pipeline Profiler (does nothing unless profiling)
+    profiler = PipelineProfiler(profile, profile_overlay)
     
-    # Load Data
-    reader = vtk.vtkXMLImageDataReader()
-    reader.SetFileName(data_file)
-    reader.Update()
+    # Slider Latency Tracer
+    tracer = LatencyTracer(latency_log)
+    
+    # Open Data (memory mapped with --mmap)
+    reader = openVolume(data_file, mmap)
+    
+    # Volume Metadata (sidecar file, the volumes are only read here when they
+    # have to be measured on the first load)
+    meta = loadMetadata(data_file, lambda: readVolume(reader))
     
     # Get Min and Max Values
-    range_ = reader.GetOutput().GetScalarRange()
+    range_ = meta['range']
     min_val = int(range_[0])
     max_val = int(range_[1])
     mid_val = (min_val + max_val) // 2
     
-    #Load Gradient Magnitude
-    gradReader = vtk.vtkXMLImageDataReader()
-    gradReader.SetFileName(grad_file)
-    gradReader.Update()
+    #Open Gradient Magnitude (computed from the data when no file is given)
+    with profiler.stage('open gradient'):
+        gradReader = openGradientMagnitude(reader, data_file, grad_file, 
+                                           grad_cache, mmap)
     
-    # Get Min and Max Gradient Values
-    range_ = gradReader.GetOutput().GetScalarRange()
+    # Get Min and Max Gradient Values (computed gradient kept with the data)
+    if grad_file is None:
+        gradMeta = loadMetadata(data_file, lambda: readVolume(gradReader), 
+                                'gradient')
+    else:
+        gradMeta = loadMetadata(grad_file, lambda: readVolume(gradReader))
+    range_ = gradMeta['range']
     min_grad = range_[0]
     max_grad = range_[1]
     
@@ -177,28 +334,90 @@ def main():
     else:
         xVal, yVal, zVal = clip[0], clip[1], clip[2]
     
-    # Get Bounds of Input Data Actor
-    m = vtk.vtkDataSetMapper()
-    m.SetInputConnection(reader.GetOutputPort())
-    
-    a = vtk.vtkActor()
-    a.SetMapper(m)
-    aBo = a.GetBounds()
+    # Get Bounds of Input Data (from the metadata)
+    aBo = meta['bounds']
     xMax, yMax, zMax = int(aBo[1] + 1), int(aBo[3] + 1), int(aBo[5] + 1)
     
     # Isovalue Color Transfer Function
     colorFunction = defaultCTF(min_grad, max_grad)
     
-    # Generate Contours
-    contours = vtk.vtkContourFilter()
-    contours.SetInputConnection(reader.GetOutputPort())
+    # Load Data (after the sliders and colours are set up from the metadata)
+    with profiler.stage('read'):
+        readVolume(reader)
+    profiler.watch(reader, 'read')
+    with profiler.stage('read gradient'):
+        readVolume(gradReader)
+    profiler.watch(gradReader, 'read gradient')
+    
+    # Contouring Backend and Threads
+    configureThreads(threads)
+    timer = ContourTimer(backend)
+    
+    # Span Space Index (the brick pool skips inactive bricks itself, both
+    # take the brick ranges of the metadata)
+    if bricks:
+        span = False
+    index = None
+    if span:
+        index = buildSpanSpaceIndex(reader.GetOutput(), 
+                                    ranges=metadataBricks(meta, BRICK_SIZE))
+    
+    # Crop Volume to Clip Box
+    if crop:
+        crop = VolumeCrop((xVal, yVal, zVal))
+        volumePort = crop.addVolume(reader)
+    else:
+        crop = None
+        volumePort = reader.GetOutputPort()
+    
+    # Sample Gradient along Contour Edges (only for the computed gradient)
+    edgeProbe = fast_probe and grad_file is None
+    if fast_probe and grad_file is not None:
+        print("--fast-probe needs the gradient computed from the data, "
+              "probing grad_file instead")
+    
+    # Generate Contours (contoured and probed in bricks across a pool)
+    brickPool = None
+    if bricks:
+        ranges = metadataBricks(meta, brick_size)
+        brickPool = BrickPool(bricks, brick_size, 
+                              {tuple(meta['extent']): ranges})
+        contours = timer.watch(BrickContourFilter(brickPool, backend, 
+                                                  gradReader.GetOutput(), 
+                                                  edgeProbe))
+        if progressive:
+            print("--bricks probes in the pool, ignoring --progressive")
+            progressive = False
+    else:
+        contours = timer.watch(createContourFilter(index, backend))
+    contours.SetInputConnection(volumePort)
     contours.ComputeNormalsOn()
-    contours.SetValue(0, val)
+    if edgeProbe:
+        contours.ComputeGradientsOn()
+    profiler.watch(contours, 'contour')
+    tracer.watch(contours)
+    surface = vtk.vtkTrivialProducer()
+    
+    # Progressive Contouring while Dragging
+    if progressive:
+        progressive = ProgressiveContour(reader.GetOutput(), frame_ms / 1000.0, 
+                                         crop=crop, computeGradients=edgeProbe, 
+                                         backend=backend)
+        profiler.watch(progressive.contours, 'contour draft')
+        tracer.watch(progressive.contours)
+    else:
+        progressive = None
+    
+    extractIsosurface(val)
     
-    # Apply Probe Filter
-    probe = vtk.vtkProbeFilter()
-    probe.SetInputConnection(contours.GetOutputPort())
-    probe.SetSourceConnection(gradReader.GetOutputPort())
+    # Apply Probe Filter (already probed in the brick pool)
+    if brickPool is not None:
+        probe = surface
+    else:
+        probe = createProbeFilter(edgeProbe)
+        probe.SetInputConnection(surface.GetOutputPort())
+        if not edgeProbe:
+            probe.SetSourceConnection(gradReader.GetOutputPort())
     
     # Define Planes Origins
     origins = vtk.vtkPoints()
@@ -244,28 +463,39 @@ def main():
     
     valMinGrad = int(min_grad)
     valMaxGrad = int(max_grad)
+    gradRange = (min_grad, max_grad)
     
-    # Clip by Gradient Magnitude Range
-    gradClipper1 = vtk.vtkClipPolyData()
-    gradClipper1.SetInputConnection(zClipper.GetOutputPort())
-    gradClipper1.InsideOutOff()
-    gradClipper1.SetValue(valMinGrad)
-    gradClipper1.Update()
-
-    gradClipper2 = vtk.vtkClipPolyData()
-    gradClipper2.SetInputConnection(gradClipper1.GetOutputPort())
-    gradClipper2.InsideOutOn()
-    gradClipper2.SetValue(valMaxGrad)
-    gradClipper2.Update()
+    # Clip by Gradient Magnitude Range (single pass, none while masking)
+    gradClipper = GradientBandClipper(valMinGrad, valMaxGrad)
+    if mask_grad and not commit_clip:
+        gradClipper.SetRange(*gradRange)
+    clipped = probe if crop or render_clip else zClipper
+    gradClipper.SetInputConnection(clipped.GetOutputPort())
+    profiler.watchUpstream(gradClipper)
+    gradClipper.Update()
     
     # Create Mapper and Actor
     mapper = vtk.vtkDataSetMapper()
-    mapper.SetInputConnection(gradClipper2.GetOutputPort())
+    mapper.SetInputConnection(gradClipper.GetOutputPort())
     mapper.SetLookupTable(colorFunction)
     
+    # Clip with the Planes while Rendering
+    if render_clip:
+        mapper.AddClippingPlane(xPlane)
+        mapper.AddClippingPlane(yPlane)
+        mapper.AddClippingPlane(zPlane)
+    
     actor = vtk.vtkActor()
     actor.SetMapper(mapper)
     
+    # Mask the Gradient Range while Rendering
+    if mask_grad:
+        gradMask = GradientBandMask(colorFunction, min_grad, max_grad)
+        gradMask.setRange(valMinGrad, valMaxGrad)
+        gradMask.apply(mapper, actor)
+    else:
+        gradMask = None
+    
     # Create Renderer, Render Window and Render Window Interactor
     ren = vtk.vtkRenderer()
     renWin = vtk.vtkRenderWindow()
@@ -273,7 +503,20 @@ def main():
     iren = vtk.vtkRenderWindowInteractor()
     iren.SetRenderWindow(renWin)
     
+    # Slider Interaction Scheduler (coalesces events to the frame rate)
+    scheduler = InteractionScheduler(iren, fps)
+    tracer.watchScheduler(scheduler)
+    
+    # Level of Detail Proxies while the View Moves (held to the frame rate)
+    levelOfDetail = LevelOfDetail(iren, fps) if lod else None
+    if levelOfDetail is not None:
+        levelOfDetail.add(actor)
+    
     ren.AddActor(actor)
+    profiler.watchUpstream(mapper)
+    tracer.watchPipeline(mapper)
+    profiler.watchRenderer(ren)
+    tracer.watchWindow(renWin)
     ren.ResetCamera()
     ren.GetActiveCamera().Elevation(270)
     ren.GetActiveCamera().SetRoll(360)
@@ -286,38 +529,46 @@ def main():
     # Isovalue Slider Bar
     isovalueSlideBar = createSlideBar(min_val, max_val, val, 
                                       0.05, 0.25, 0.85, "Isovalue")
-    isovalueSliderWidget = createSliderWidget(isovalueSlideBar, iren)
-    isovalueSliderWidget.AddObserver("InteractionEvent", 
-                                     vtkIsovalueSlideBarCallback)
+    isovalueSliderWidget = createSliderWidget(isovalueSlideBar, iren, tracer)
+    scheduler.observe(isovalueSliderWidget, vtkIsovalueSlideBarCallback, 
+                      vtkIsovalueSlideBarEndCallback)
     
     # Min Gradiente Magnitude Slide Bar
     gradMinSlideBar = createSlideBar(min_grad, int(max_grad), valMinGrad, 
                                      0.05, 0.25, 0.70, "Min Gradient Magnitude")
-    gradMinSliderWidget = createSliderWidget(gradMinSlideBar, iren)
-    gradMinSliderWidget.AddObserver("InteractionEvent", 
-                                     vtkGradMinSlideBarCallback)
+    gradMinSliderWidget = createSliderWidget(gradMinSlideBar, iren, tracer)
+    scheduler.observe(gradMinSliderWidget, vtkGradMinSlideBarCallback)
+    if gradMask is not None and commit_clip:
+        gradMinSliderWidget.AddObserver("StartInteractionEvent", 
+                                         vtkGradSlideBarStartCallback)
+        gradMinSliderWidget.AddObserver("EndInteractionEvent", 
+                                         vtkGradSlideBarEndCallback)
     
     # Max Gradiente Magnitude Slide Bar
     gradMaxSlideBar = createSlideBar(min_grad, int(max_grad), valMaxGrad, 
                                      0.05, 0.25, 0.55, "Max Gradient Magnitude")
-    gradMaxSliderWidget = createSliderWidget(gradMaxSlideBar, iren)
-    gradMaxSliderWidget.AddObserver("InteractionEvent", 
-                                     vtkGradMaxSlideBarCallback)
+    gradMaxSliderWidget = createSliderWidget(gradMaxSlideBar, iren, tracer)
+    scheduler.observe(gradMaxSliderWidget, vtkGradMaxSlideBarCallback)
+    if gradMask is not None and commit_clip:
+        gradMaxSliderWidget.AddObserver("StartInteractionEvent", 
+                                         vtkGradSlideBarStartCallback)
+        gradMaxSliderWidget.AddObserver("EndInteractionEvent", 
+                                         vtkGradSlideBarEndCallback)
     
     # X Plane Value Slider Bar
     xSlideBar = createSlideBar(0, xMax, xVal, 0.05, 0.25, 0.40, "X")
-    xSliderWidget = createSliderWidget(xSlideBar, iren)
-    xSliderWidget.AddObserver("InteractionEvent", vtkXSlideBarCallback)
+    xSliderWidget = createSliderWidget(xSlideBar, iren, tracer)
+    scheduler.observe(xSliderWidget, vtkXSlideBarCallback)
     
     # Y Plane Value Slider Bar
     ySlideBar = createSlideBar(0, yMax, yVal, 0.05, 0.25, 0.25, "Y")
-    ySliderWidget = createSliderWidget(ySlideBar, iren)
-    ySliderWidget.AddObserver("InteractionEvent", vtkYSlideBarCallback)
+    ySliderWidget = createSliderWidget(ySlideBar, iren, tracer)
+    scheduler.observe(ySliderWidget, vtkYSlideBarCallback)
     
     # Z Plane Value Slider Bar
     zSlideBar = createSlideBar(0, zMax, zVal, 0.05, 0.25, 0.10, "Z")
-    zSliderWidget = createSliderWidget(zSlideBar, iren)
-    zSliderWidget.AddObserver("InteractionEvent", vtkZSlideBarCallback)
+    zSliderWidget = createSliderWidget(zSlideBar, iren, tracer)
+    scheduler.observe(zSliderWidget, vtkZSlideBarCallback)
     
     # Gradient Magnitude Scalar Bar
     scalarBar = createScalarBar(mapper, "Gradient Magnitude", 6)
@@ -328,6 +579,22 @@ def main():
     iren.Initialize()
     renWin.Render()
     iren.Start()
+    
+    if brickPool is not None:
+        brickPool.close()
+    
+    profiler.dump()
+    
+    scheduler.printStats()
+    
+    tracer.printStats()
+    tracer.dump()
+    
+    timer.printStats()
+    
+    if levelOfDetail is not None:
+        levelOfDetail.close()
+        levelOfDetail.printStats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Gradient magnitude band clipping.
+
+GradientBandClipper keeps the part of the surface whose scalars lie in the
+[min, max] band in one pass over the triangles. Triangles inside the band
+are kept as they are and those wholly below or above it dropped. Each of
+the others is clipped against both thresholds at once: walking its edges,
+the vertices in the band and the points where an edge crosses the minimum
+or the maximum (both, in order, for an edge crossing the whole band) make
+up the convex band polygon, which is split into a fan of triangles. The
+crossing points are shared by the triangles on both sides of their edge,
+and the point data is interpolated on them. Only the points the band uses
+are output, and the surface is passed through untouched when it lies in
+the band.
+
+Run as a script to check the clipper against two chained vtkClipPolyData
+filters on narrow bands:
+
+    python isoband.py
+"""
+
+import sys
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+
+"""
+- Band Clip Methods
+"""
+
+# Band Polygon Slots Method (per clipped triangle, in walking order: each
+# edge's first vertex when in the band, then the threshold crossings of the
+# edge nearest that vertex first; as start point, end point, threshold
+# index and valid arrays, the end being the start for a vertex)
+def bandSlots(triangles, scalars, thresholds):
+    inBand = (scalars >= thresholds[0]) & (scalars <= thresholds[1])
+    slots = list()
+    for edge in range(3):
+        p, q = triangles[:, edge], triangles[:, (edge + 1) % 3]
+        sp, sq = scalars[p], scalars[q]
+        crosses = [(sp - t) * (sq - t) < 0 for t in thresholds]
+        rising = sp < sq
+        nearest = np.where(rising, 0, 1)
+        slots.append((p, p, np.zeros_like(nearest), inBand[p]))
+        slots.append((p, q, nearest,
+                      np.where(rising, crosses[0], crosses[1])))
+        slots.append((p, q, 1 - nearest,
+                      np.where(rising, crosses[1], crosses[0])))
+    return [np.stack(arrays, axis=1) for arrays in zip(*slots)]
+
+# Blend Rows Method (rows of values, then the rows interpolated between
+# low and high by weight)
+def blendRows(values, used, low, high, weight):
+    if values.ndim > 1:
+        weight = weight[:, None]
+    start = values[low].astype(np.float64)
+    return np.concatenate((values[used],
+                           start + weight * (values[high] - start)))
+
+# Clip Band Method (polydata of the triangles of polyData kept by the band
+# of its active point scalars, None when polyData is not all triangles)
+def clipBand(polyData, minimum, maximum):
+    polys = polyData.GetPolys()
+    offsets = vtk_to_numpy(polys.GetOffsetsArray())
+    if (polyData.GetNumberOfCells() != polys.GetNumberOfCells()
+            or (np.diff(offsets) != 3).any()):
+        return None
+    triangles = vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3)
+    scalars = vtk_to_numpy(polyData.GetPointData().GetScalars())
+    scalars = scalars.astype(np.float64)
+    thresholds = (float(minimum), float(maximum))
+    side = np.where(scalars < minimum, 0, np.where(scalars > maximum, 2, 1))
+    sides = side[triangles]
+    inside = (sides == 1).all(axis=1)
+    clipped = ~inside & ~(sides == 0).all(axis=1) & ~(sides == 2).all(axis=1)
+
+    # Band polygons of the clipped triangles, in walking order
+    cut = triangles[clipped]
+    starts, ends, thresholdIds, valid = bandSlots(cut, scalars, thresholds)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    starts, ends, thresholdIds, valid = (
+        np.take_along_axis(a, order, axis=1)
+        for a in (starts, ends, thresholdIds, valid))
+    counts = valid.sum(axis=1)
+
+    # Crossing points (shared along their edge) numbered after the points
+    n = scalars.size
+    crossing = valid & (starts != ends)
+    low = np.minimum(starts, ends)[crossing].astype(np.int64)
+    high = np.maximum(starts, ends)[crossing].astype(np.int64)
+    keys = (low * n + high) * 2 + thresholdIds[crossing]
+    keys, first, inverse = np.unique(keys, return_index=True,
+                                     return_inverse=True)
+    vertices = starts.astype(np.int64)
+    vertices[crossing] = n + inverse.ravel()
+    low, high = low[first], high[first]
+    threshold = np.take(thresholds, thresholdIds[crossing][first])
+    weight = (threshold - scalars[low]) / (scalars[high] - scalars[low])
+
+    # Fans of the band polygons, after the triangles kept whole
+    fans = [triangles[inside]]
+    sources = [np.flatnonzero(inside)]
+    cutIds = np.flatnonzero(clipped)
+    for k in range(1, valid.shape[1] - 1):
+        fan = counts > k + 1
+        fans.append(np.stack((vertices[fan, 0], vertices[fan, k],
+                              vertices[fan, k + 1]), axis=1))
+        sources.append(cutIds[fan])
+    connectivity = np.concatenate(fans).ravel()
+    sources = np.concatenate(sources)
+
+    # Compact the points, blending the point data on the crossings
+    mask = np.zeros(n + keys.size, dtype=bool)
+    mask[connectivity] = True
+    used = np.flatnonzero(mask[:n])
+    crossed = mask[n:]
+    low, high, weight = low[crossed], high[crossed], weight[crossed]
+    connectivity = (np.cumsum(mask) - 1)[connectivity]
+    band = vtk.vtkPolyData()
+    bandPoints = vtk.vtkPoints()
+    points = polyData.GetPoints().GetData()
+    bandPoints.SetData(numpy_to_vtk(blendRows(vtk_to_numpy(points), used, low,
+                                              high, weight), deep=True,
+                                    array_type=points.GetDataType()))
+    band.SetPoints(bandPoints)
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_to_vtk(np.arange(0, connectivity.size + 1, 3,
+                                         dtype=np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE),
+                  numpy_to_vtk(connectivity.astype(np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE))
+    band.SetPolys(cells)
+    for data, bandData, rows in ((polyData.GetPointData(),
+                                  band.GetPointData(), None),
+                                 (polyData.GetCellData(),
+                                  band.GetCellData(), sources)):
+        for i in range(data.GetNumberOfArrays()):
+            array = data.GetArray(i)
+            if array is None:
+                continue
+            values = vtk_to_numpy(array)
+            if rows is None:
+                values = blendRows(values, used, low, high, weight)
+            else:
+                values = values[rows]
+            values = numpy_to_vtk(np.ascontiguousarray(values), deep=True,
+                                  array_type=array.GetDataType())
+            values.SetName(array.GetName())
+            bandData.AddArray(values)
+        if data.GetScalars() is not None:
+            bandData.SetActiveScalars(data.GetScalars().GetName())
+        if data.GetNormals() is not None:
+            bandData.SetActiveNormals(data.GetNormals().GetName())
+    return band
+
+
+"""
+- Gradient Band Clipper Class
+"""
+
+class GradientBandClipper(VTKPythonAlgorithmBase):
+
+    # Constructor Method
+    def __init__(self, minimum=0.0, maximum=1.0):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkPolyData',
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+        self.minimum = minimum
+        self.maximum = maximum
+
+    # Set Minimum Method
+    def SetMinimum(self, minimum):
+        if minimum != self.minimum:
+            self.minimum = minimum
+            self.Modified()
+
+    # Set Maximum Method
+    def SetMaximum(self, maximum):
+        if maximum != self.maximum:
+            self.maximum = maximum
+            self.Modified()
+
+    # Set Band Range Method
+    def SetRange(self, minimum, maximum):
+        self.SetMinimum(minimum)
+        self.SetMaximum(maximum)
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        inp = vtk.vtkPolyData.GetData(inInfo[0])
+        output = vtk.vtkPolyData.GetData(outInfo)
+        scalars = inp.GetPointData().GetScalars()
+        if scalars is None or inp.GetNumberOfPoints() == 0:
+            output.ShallowCopy(inp)
+            return 1
+
+        # Nothing to clip when the scalars lie in the band
+        low, high = scalars.GetRange()
+        if self.minimum <= low and high <= self.maximum:
+            output.ShallowCopy(inp)
+            return 1
+
+        # Other cells than triangles are triangulated first
+        band = clipBand(inp, self.minimum, self.maximum)
+        if band is None:
+            triangles = vtk.vtkTriangleFilter()
+            triangles.SetInputData(inp)
+            triangles.PassVertsOff()
+            triangles.PassLinesOff()
+            triangles.Update()
+            band = clipBand(triangles.GetOutput(), self.minimum,
+                            self.maximum)
+        output.ShallowCopy(band)
+        return 1
+
+"""
+- Gradient Band Mask Class
+"""
+
+class GradientBandMask:
+
+    # Constructor Method (table covers the whole scalar range)
+    def __init__(self, colorFunction, rangeMin, rangeMax, size=1024):
+        self.rangeMin = rangeMin
+        self.rangeMax = rangeMax
+        self.lookupTable = vtk.vtkLookupTable()
+        self.lookupTable.SetNumberOfTableValues(size)
+        self.lookupTable.SetTableRange(rangeMin, rangeMax)
+        self.values = np.linspace(rangeMin, rangeMax, size)
+        self.colors = np.array([colorFunction.GetColor(value)
+                                for value in self.values])
+        self.setRange(rangeMin, rangeMax)
+
+    # Set Visible Band Method (only touches the table alpha)
+    def setRange(self, minimum, maximum):
+        visible = (self.values >= minimum) & (self.values <= maximum)
+        for i, (color, alpha) in enumerate(zip(self.colors, visible)):
+            self.lookupTable.SetTableValue(i, *color, float(alpha))
+        self.lookupTable.Modified()
+
+    # Apply Mask Method (fragments outside the band are discarded)
+    def apply(self, mapper, actor):
+        mapper.SetLookupTable(self.lookupTable)
+        mapper.UseLookupTableScalarRangeOn()
+        mapper.InterpolateScalarsBeforeMappingOn()
+        actor.ForceOpaqueOn()
+        actor.GetShaderProperty().AddFragmentShaderReplacement(
+            "//VTK::Color::Impl", True,
+            "//VTK::Color::Impl\n  if (opacity < 0.5) { discard; }\n", False)
+
+
+"""
+- Check Methods
+"""
+
+# Two Stage Clip Method (plain clip above the minimum, then below the maximum)
+def clipTwoStage(port, minimum, maximum):
+    lower = vtk.vtkClipPolyData()
+    lower.SetInputConnection(port)
+    lower.InsideOutOff()
+    lower.SetValue(minimum)
+    upper = vtk.vtkClipPolyData()
+    upper.SetInputConnection(lower.GetOutputPort())
+    upper.InsideOutOn()
+    upper.SetValue(maximum)
+    upper.Update()
+    return upper.GetOutput()
+
+# Surface Area Method
+def surfaceArea(polyData):
+    if polyData.GetNumberOfCells() == 0:
+        return 0.0
+    mass = vtk.vtkMassProperties()
+    mass.SetInputData(polyData)
+    mass.Update()
+    return mass.GetSurfaceArea()
+
+# Triangulate Method (the two stage clip outputs quads)
+def triangulate(polyData):
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputData(polyData)
+    triangles.Update()
+    return triangles.GetOutput()
+
+# Check Surfaces Method (elevation scalars on a sphere, gradient magnitude
+# probed on a contour of the wavelet)
+def checkSurfaces():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(50)
+    sphere.SetThetaResolution(48)
+    sphere.SetPhiResolution(48)
+    elevation = vtk.vtkElevationFilter()
+    elevation.SetInputConnection(sphere.GetOutputPort())
+    elevation.SetLowPoint(0, 0, -50)
+    elevation.SetHighPoint(0, 0, 50)
+    elevation.SetScalarRange(0, 100)
+    wavelet = vtk.vtkRTAnalyticSource()
+    wavelet.SetWholeExtent(-20, 20, -20, 20, -20, 20)
+    contours = vtk.vtkContourFilter()
+    contours.SetInputConnection(wavelet.GetOutputPort())
+    contours.SetValue(0, 150)
+    contours.ComputeNormalsOn()
+    gradient = vtk.vtkImageGradientMagnitude()
+    gradient.SetInputConnection(wavelet.GetOutputPort())
+    gradient.SetDimensionality(3)
+    probe = vtk.vtkProbeFilter()
+    probe.SetInputConnection(contours.GetOutputPort())
+    probe.SetSourceConnection(gradient.GetOutputPort())
+    return (('sphere', elevation), ('wavelet', probe))
+
+# Check Clipper Method (against the two stage clip, on narrow bands too)
+def checkClipper(bands=((40, 42), (40, 40.5), (10, 90), (-10, 110),
+                        (50, 60), (60, 50), (15, 15.5), (-5, 5))):
+    matching = True
+    for name, surface in checkSurfaces():
+        surface.Update()
+        clipper = GradientBandClipper()
+        clipper.SetInputConnection(surface.GetOutputPort())
+        for minimum, maximum in bands:
+            clipper.SetRange(minimum, maximum)
+            clipper.Update()
+            band = clipper.GetOutputDataObject(0)
+            baseline = triangulate(clipTwoStage(surface.GetOutputPort(),
+                                                minimum, maximum))
+            area, baselineArea = surfaceArea(band), surfaceArea(baseline)
+            same = (band.GetNumberOfCells() == baseline.GetNumberOfCells()
+                    and band.GetNumberOfPoints()
+                    == baseline.GetNumberOfPoints()
+                    and np.isclose(area, baselineArea))
+            matching = matching and same
+            print(f"{name} [{minimum:g}, {maximum:g}]: "
+                  f"{band.GetNumberOfCells()} triangles, "
+                  f"{band.GetNumberOfPoints()} points, area {area:.2f} "
+                  f"(two stage {baseline.GetNumberOfCells()}, "
+                  f"{baseline.GetNumberOfPoints()}, {baselineArea:.2f}) "
+                  f"{'ok' if same else 'MISMATCH'}")
+    return matching
+
+if __name__ == "__main__":
+    sys.exit(0 if checkClipper() else 1)
\ No newline at end of file
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch extraction of one isosurface mesh per isovalue.
+
+The data volume (and the gradient magnitude volume, when given) is loaded
+once and shared with a pool of worker processes, each of which contours,
+probes and writes the isovalues handed to it. No window is opened. With
+--stream-mb the workers stream the volumes from the files in slabs instead
+(isostream), for volumes that do not fit in memory. With --bricks the
+isovalues are extracted one after the other, each one contoured and probed
+in bricks across the pool (isobrick), for a few isovalues of large volumes.
+The meshes of a whole volume pass through the same vertex merge as the
+pieces of those two modes, so every mode writes the same mesh.
+"""
+
+import os
+import time
+from multiprocessing import Pool
+
+import vtk
+
+from isobrick import BrickContourFilter, BrickPool
+from isocontour import BACKENDS, configureThreads, createBackendFilter
+from isocrop import mergePoints
+from isogm import readIsovalFile
+from isommap import loadVolume, openVolume
+from isoshared import attachImage, shareVolume
+from isostream import StreamingContourFilter, VolumeStream
+
+
+WRITERS = {'vtp': vtk.vtkXMLPolyDataWriter,
+           'ply': vtk.vtkPLYWriter,
+           'stl': vtk.vtkSTLWriter}
+
+# Get Program Parameters
+def get_program_parameters():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_file', help='isosurface data vti file')
+    parser.add_argument('grad_file', nargs='?',
+                        default=None, help='gradient magnitude vti file')
+    parser.add_argument('isovals_file', nargs='?',
+                        default=None, help='isovalues file')
+    parser.add_argument('--out-dir', dest='out_dir', type=str,
+                        default='.', help='output directory')
+    parser.add_argument('--format', dest='format', choices=sorted(WRITERS),
+                        default='vtp', help='mesh file format')
+    parser.add_argument('--processes', dest='processes', type=int,
+                        default=None, help='worker processes (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true',
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--stream-mb', dest='stream_mb', type=float,
+                        default=None,
+                        help='stream the volumes in slabs within this budget')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS),
+                        default='flying-edges', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int,
+                        default=1, help='contouring threads per worker')
+    parser.add_argument('--bricks', dest='bricks', action='store_true',
+                        help='contour each isovalue in bricks across the pool')
+    parser.add_argument('--brick-size', dest='brick_size', type=int,
+                        default=64, help='cells per brick side')
+    args = parser.parse_args()
+
+    # Gradient File is Optional ("data_file isovals_file")
+    if args.isovals_file is None:
+        args.isovals_file, args.grad_file = args.grad_file, None
+
+    return (args.data_file, args.grad_file, args.isovals_file, args.out_dir,
+            args.format, args.processes, args.backend, args.threads, args.mmap,
+            args.stream_mb, args.bricks, args.brick_size)
+
+
+"""
+- Worker Methods
+"""
+
+# Initialize Worker Method (attaches the shared volumes, builds the pipeline)
+def initWorker(dataDescription, gradDescription, options):
+    global worker
+    configureThreads(options['threads'])
+    worker = dict(options)
+    worker['shared'] = list()
+
+    # Stream the Volumes Slab by Slab (the budget is split among workers)
+    if options['stream_mb']:
+        budget = options['stream_mb'] / options['processes']
+        volume = VolumeStream(openVolume(options['data_file'],
+                                         options['mmap']), budget)
+        gradient = None
+        if options['grad_file'] is not None:
+            gradient = VolumeStream(openVolume(options['grad_file'],
+                                               options['mmap']), budget)
+        contours = StreamingContourFilter(volume, gradient, options['backend'])
+        contours.ComputeNormalsOn()
+        worker['contours'] = contours
+        output = contours
+    else:
+        dataBlock, dataValues, dataImage = attachImage(dataDescription)
+        worker['shared'].append((dataBlock, dataValues))
+        contours = createBackendFilter(options['backend'])
+        contours.SetInputData(dataImage)
+        contours.ComputeNormalsOn()
+        worker['contours'] = contours
+        output = contours
+
+    if gradDescription is not None:
+        gradBlock, gradValues, gradImage = attachImage(gradDescription)
+        worker['shared'].append((gradBlock, gradValues))
+        probe = vtk.vtkProbeFilter()
+        probe.SetInputConnection(contours.GetOutputPort())
+        probe.SetSourceData(gradImage)
+        probe.PassPointArraysOn()
+        output = probe
+
+    worker['output'] = output
+    worker['writer'] = WRITERS[options['format']]()
+
+# Mesh File Name Method
+def meshFileName(outDir, dataFile, isoval, fileFormat):
+    name = os.path.splitext(os.path.basename(dataFile))[0]
+    return os.path.join(outDir, f"{name}-iso{isoval}.{fileFormat}")
+
+# Extract Isovalue Method (runs in a worker)
+def extractIsovalue(isoval):
+    global worker
+    start = time.perf_counter()
+    worker['contours'].SetValue(0, isoval)
+    worker['output'].Update()
+    polyData = worker['output'].GetOutputDataObject(0)
+    if not worker['stream_mb']:
+        polyData = mergePoints(polyData)
+    fileName = meshFileName(worker['out_dir'], worker['data_file'], isoval,
+                            worker['format'])
+    worker['writer'].SetInputData(polyData)
+    worker['writer'].SetFileName(fileName)
+    worker['writer'].Write()
+    cells = polyData.GetNumberOfCells()
+    return isoval, cells, fileName, time.perf_counter() - start
+
+
+"""
+- Brick Methods
+"""
+
+# Extract Isovalues in Bricks Method (one isovalue at a time across the pool)
+def extractBricks(dataReader, gradReader, isovals, options):
+    bricks = BrickPool(options['processes'], options['brick_size'])
+    gradient = None if gradReader is None else gradReader.GetOutput()
+    contours = BrickContourFilter(bricks, options['backend'], gradient)
+    contours.SetInputConnection(dataReader.GetOutputPort())
+    contours.ComputeNormalsOn()
+    writer = WRITERS[options['format']]()
+    writer.SetInputConnection(contours.GetOutputPort())
+    try:
+        for isoval in isovals:
+            start = time.perf_counter()
+            contours.SetValue(0, isoval)
+            contours.Update()
+            fileName = meshFileName(options['out_dir'], options['data_file'],
+                                    isoval, options['format'])
+            writer.SetFileName(fileName)
+            writer.Write()
+            cells = contours.GetOutputDataObject(0).GetNumberOfCells()
+            yield isoval, cells, fileName, time.perf_counter() - start
+    finally:
+        bricks.close()
+
+
+"""
+- Main Method
+"""
+
+def main():
+    (data_file, grad_file, isov_file, out_dir, file_format, processes,
+     backend, threads, mmap, stream_mb, bricks,
+     brick_size) = get_program_parameters()
+
+    start = time.perf_counter()
+
+    # Get Isovalues
+    isovals = readIsovalFile(isov_file)
+    os.makedirs(out_dir, exist_ok=True)
+    if processes is None:
+        processes = os.cpu_count()
+    if stream_mb is not None and bricks:
+        print("--stream-mb streams slabs in every worker, ignoring --bricks")
+        bricks = False
+    if not bricks:
+        processes = max(1, min(processes, len(isovals)))
+
+    # Load the Volumes Once (memory mapped with --mmap), unless Streaming
+    blocks = list()
+    dataDescription, gradDescription = None, None
+    if stream_mb is None:
+        dataReader = loadVolume(data_file, mmap)
+        gradReader = None
+        if grad_file is not None:
+            gradReader = loadVolume(grad_file, mmap)
+
+    # Share the Volumes with the Workers (the brick pool shares its own)
+    if stream_mb is None and not bricks:
+        dataBlock, dataDescription = shareVolume(dataReader, data_file)
+        blocks.append(dataBlock)
+        if gradReader is not None:
+            gradBlock, gradDescription = shareVolume(gradReader, grad_file)
+            blocks.append(gradBlock)
+
+    # Extract Isovalues across the Process Pool
+    options = {'data_file': data_file, 'grad_file': grad_file,
+               'out_dir': out_dir, 'format': file_format, 'backend': backend,
+               'threads': threads, 'mmap': mmap, 'stream_mb': stream_mb,
+               'processes': processes, 'brick_size': brick_size}
+    loaded = time.perf_counter()
+
+    # Extract Isovalues one by one in Bricks across the Pool
+    if bricks:
+        for isoval, cells, fileName, seconds in extractBricks(
+                dataReader, gradReader, isovals, options):
+            print(f"Isovalue {isoval}: {cells} cells in "
+                  f"{1000 * seconds:.1f} ms -> {fileName}")
+        end = time.perf_counter()
+        print(f"{len(isovals)} isovalues in bricks with {processes} processes "
+              f"in {end - loaded:.2f} s (loading {loaded - start:.2f} s)")
+        return
+
+    try:
+        with Pool(processes, initWorker,
+                  (dataDescription, gradDescription, options)) as pool:
+            for isoval, cells, fileName, seconds in pool.imap_unordered(
+                    extractIsovalue, isovals):
+                print(f"Isovalue {isoval}: {cells} cells in "
+                      f"{1000 * seconds:.1f} ms -> {fileName}")
+    finally:
+        for block in blocks:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    end = time.perf_counter()
+    print(f"{len(isovals)} isovalues with {processes} processes in "
+          f"{end - loaded:.2f} s (loading {loaded - start:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
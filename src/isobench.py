@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the isosurface pipelines.
+
+Deterministic synthetic volumes (a sphere, a torus and a smoothed noise
+field, at each requested size) are written once as mappable vti files
+together with their gradient magnitude volumes. The pipelines of
+isosurface.py, isogm.py, iso2dtf.py and isocomplete.py are then built
+headlessly from the same filters and run stage by stage (reading,
+contouring, probing, clipping, gradient band clipping), recording the wall
+time, the triangles produced and the growth of the resident memory of every
+stage (sampled from /proc/self/statm before and after it, so only on Linux).
+Each case runs in a freshly spawned process whose peak resident memory is
+reported with it, so the memory peaks of one case do not carry over to the
+next.
+
+The results are written as JSON and can be compared with a previous run:
+
+    python isobench.py --sizes 64 128 256 --out bench.json
+    python isobench.py --sizes 64 128 256 --compare bench.json
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from multiprocessing import get_context
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from isoband import GradientBandClipper
+from isocontour import BACKENDS, configureThreads, createContourFilter
+from isograd import CACHE_DIR, computeGradientMagnitude
+from isommap import openVolume, writeMappableVolume
+from isoprobe import createProbeFilter
+
+
+VOLUMES = ('sphere', 'torus', 'noise')
+PIPELINES = ('isosurface', 'isogm', 'iso2dtf', 'isocomplete')
+SEED = 2020
+
+
+"""
+- Synthetic Volume Methods
+"""
+
+# Synthetic Field Method (float32 values in [0, 255], z/y/x order)
+def syntheticField(kind, size):
+    c = (size - 1) / 2.0
+    z, y, x = [((axis - c) / c).astype(np.float32)
+               for axis in np.ogrid[0:size, 0:size, 0:size]]
+    if kind == 'sphere':
+        field = 1.0 - np.sqrt(x * x + y * y + z * z)
+    elif kind == 'torus':
+        ring = np.sqrt(x * x + y * y) - 0.6
+        field = 1.0 - 2.5 * np.sqrt(ring * ring + z * z)
+    else:
+        rng = np.random.default_rng(SEED)
+        field = rng.standard_normal((size, size, size), dtype=np.float32)
+    field = np.broadcast_to(field, (size, size, size))
+    if kind == 'noise':
+        field = smoothField(field, size / 32.0)
+    low, high = field.min(), field.max()
+    return (255.0 * (field - low) / (high - low)).astype(np.float32)
+
+# Smooth Field Method (gaussian, so the noise has coherent surfaces)
+def smoothField(field, radius):
+    smooth = vtk.vtkImageGaussianSmooth()
+    smooth.SetInputData(fieldImage(field))
+    smooth.SetDimensionality(3)
+    smooth.SetStandardDeviations(radius, radius, radius)
+    smooth.SetRadiusFactors(2, 2, 2)
+    smooth.Update()
+    values = smooth.GetOutput().GetPointData().GetScalars()
+    return vtk_to_numpy(values).reshape(field.shape)
+
+# Field to Image Method
+def fieldImage(field):
+    nz, ny, nx = field.shape
+    scalars = numpy_to_vtk(np.ascontiguousarray(field).ravel(), deep=True)
+    scalars.SetName('Scalars_')
+    image = vtk.vtkImageData()
+    image.SetDimensions(nx, ny, nz)
+    image.GetPointData().SetScalars(scalars)
+    return image
+
+# Synthetic Files Method (written once, returns data and gradient files)
+def syntheticFiles(kind, size, dataDir):
+    dataFile = os.path.join(dataDir, f"{kind}-{size}.vti")
+    gradFile = os.path.join(dataDir, f"{kind}-{size}-grad.vti")
+    if not (os.path.exists(dataFile) and os.path.exists(gradFile)):
+        os.makedirs(dataDir, exist_ok=True)
+        source = vtk.vtkTrivialProducer()
+        source.SetOutput(fieldImage(syntheticField(kind, size)))
+        gradient = computeGradientMagnitude(source)
+        for port, fileName in ((source.GetOutputPort(), dataFile),
+                               (gradient.GetOutputPort(), gradFile)):
+            if writeMappableVolume(port, fileName + ".part"):
+                os.replace(fileName + ".part", fileName)
+    return dataFile, gradFile
+
+
+"""
+- Pipeline Methods
+"""
+
+# Fraction of Range Method
+def fraction(range_, t):
+    return range_[0] + t * (range_[1] - range_[0])
+
+# Create Clippers Method (X/Y/Z planes at a quarter of the bounds)
+def createClippers(port, bounds):
+    clippers = list()
+    for axis in range(3):
+        plane = vtk.vtkPlane()
+        origin, normal = [0, 0, 0], [0, 0, 0]
+        origin[axis] = fraction(bounds[2 * axis:2 * axis + 2], 0.25)
+        normal[axis] = 1
+        plane.SetOrigin(origin)
+        plane.SetNormal(normal)
+        clipper = vtk.vtkClipPolyData()
+        clipper.SetClipFunction(plane)
+        clipper.SetInputConnection(port)
+        port = clipper.GetOutputPort()
+        clippers.append(clipper)
+    return clippers
+
+# Build Pipeline Method (stages as (name, algorithms) in execution order)
+def buildPipeline(pipeline, dataFile, gradFile, backend, mmap):
+    reader = openVolume(dataFile, mmap)
+    gradReader = openVolume(gradFile, mmap)
+    reader.UpdateInformation()
+    gradReader.UpdateInformation()
+    stages = [('read', [reader])]
+    if pipeline != 'isosurface':
+        stages.append(('read-gradient', [gradReader]))
+
+    # Ranges and bounds from a first read (the stages re-read the files)
+    reader.Update()
+    gradReader.Update()
+    range_ = reader.GetOutputDataObject(0).GetScalarRange()
+    gradRange = gradReader.GetOutputDataObject(0).GetScalarRange()
+    bounds = reader.GetOutputDataObject(0).GetBounds()
+
+    if pipeline == 'isocomplete':
+        layers = [(fraction(range_, 0.3), 0.1, 0.6),
+                  (fraction(range_, 0.7), 0.0, 0.4)]
+        for isoval, low, high in layers:
+            contours = createContourFilter(backend=backend)
+            contours.SetInputConnection(reader.GetOutputPort())
+            contours.ComputeNormalsOn()
+            contours.SetValue(0, isoval)
+            probe = createProbeFilter()
+            probe.SetInputConnection(contours.GetOutputPort())
+            probe.SetSourceConnection(gradReader.GetOutputPort())
+            clippers = createClippers(probe.GetOutputPort(), bounds)
+            band = GradientBandClipper(fraction(gradRange, low),
+                                       fraction(gradRange, high))
+            band.SetInputConnection(clippers[-1].GetOutputPort())
+            stages += [('contour', [contours]), ('probe', [probe]),
+                       ('clip', clippers), ('gradient-band', [band])]
+        return stages
+
+    contours = createContourFilter(backend=backend)
+    contours.SetInputConnection(reader.GetOutputPort())
+    contours.ComputeNormalsOn()
+    if pipeline == 'isogm':
+        for i, t in enumerate((0.25, 0.5, 0.75)):
+            contours.SetValue(i, fraction(range_, t))
+    else:
+        contours.SetValue(0, fraction(range_, 0.5))
+    stages.append(('contour', [contours]))
+    port = contours.GetOutputPort()
+
+    if pipeline != 'isosurface':
+        probe = createProbeFilter()
+        probe.SetInputConnection(port)
+        probe.SetSourceConnection(gradReader.GetOutputPort())
+        stages.append(('probe', [probe]))
+        port = probe.GetOutputPort()
+
+    clippers = createClippers(port, bounds)
+    stages.append(('clip', clippers))
+
+    if pipeline == 'iso2dtf':
+        band = GradientBandClipper(fraction(gradRange, 0.1),
+                                   fraction(gradRange, 0.6))
+        band.SetInputConnection(clippers[-1].GetOutputPort())
+        stages.append(('gradient-band', [band]))
+    return stages
+
+# Peak Resident Memory Method (MiB, of the process so far)
+def peakRSS():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 if sys.platform != 'darwin' else peak / 1048576.0
+
+# Current Resident Memory Method (MiB, None without /proc)
+def currentRSS():
+    try:
+        with open('/proc/self/statm') as fp:
+            pages = int(fp.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() / 1048576.0
+
+# Run Case Method (runs in a fresh process, best of the repeats per stage)
+def runCase(case):
+    configureThreads(case['threads'])
+    stages = buildPipeline(case['pipeline'], case['data_file'],
+                           case['grad_file'], case['backend'], case['mmap'])
+    results = dict()
+    for _ in range(case['repeats']):
+        for _, algorithms in stages:
+            algorithms[0].Modified()
+        totals = dict()
+        for name, algorithms in stages:
+            resident = currentRSS()
+            start = time.perf_counter()
+            for algorithm in algorithms:
+                algorithm.Update()
+            seconds = time.perf_counter() - start
+            growth = None
+            if resident is not None:
+                growth = currentRSS() - resident
+            output = algorithms[-1].GetOutputDataObject(0)
+            triangles = None
+            if isinstance(output, vtk.vtkPolyData):
+                triangles = output.GetNumberOfPolys()
+            total = totals.setdefault(name, {'stage': name, 'seconds': 0.0,
+                                             'triangles': None,
+                                             'rss_growth_mb': None})
+            total['seconds'] += seconds
+            if triangles is not None:
+                total['triangles'] = (total['triangles'] or 0) + triangles
+            if growth is not None:
+                total['rss_growth_mb'] = (total['rss_growth_mb'] or 0) + growth
+        for name, total in totals.items():
+            best = results.get(name)
+            if best is None or total['seconds'] < best['seconds']:
+                results[name] = total
+    return {'volume': case['volume'], 'size': case['size'],
+            'pipeline': case['pipeline'], 'peak_rss_mb': peakRSS(),
+            'stages': list(results.values())}
+
+
+"""
+- Results Methods
+"""
+
+# Get Commit Method (None outside a git checkout)
+def currentCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Compare Results Method (returns the regressions found)
+def compareResults(results, baseline, tolerance, slack=0.005):
+    previous = dict()
+    for case in baseline['results']:
+        for stage in case['stages']:
+            previous[(case['volume'], case['size'], case['pipeline'],
+                      stage['stage'])] = stage
+    regressions = list()
+    for case in results['results']:
+        for stage in case['stages']:
+            key = (case['volume'], case['size'], case['pipeline'],
+                   stage['stage'])
+            old = previous.get(key)
+            if old is None:
+                continue
+            name = f"{key[0]} {key[1]}^3 {key[2]} {key[3]}"
+            if (stage['seconds'] > old['seconds'] * (1 + tolerance)
+                    and stage['seconds'] - old['seconds'] > slack):
+                regressions.append(
+                    f"{name}: {1000 * old['seconds']:.1f} -> "
+                    f"{1000 * stage['seconds']:.1f} ms")
+            if stage['triangles'] != old['triangles']:
+                regressions.append(f"{name}: {old['triangles']} -> "
+                                   f"{stage['triangles']} triangles")
+    return regressions
+
+# Print Case Method
+def printCase(case):
+    print(f"{case['volume']} {case['size']}^3 {case['pipeline']} "
+          f"(peak {case['peak_rss_mb']:.0f} MiB resident):")
+    for stage in case['stages']:
+        triangles = stage['triangles']
+        count = "" if triangles is None else f", {triangles} triangles"
+        growth = stage['rss_growth_mb']
+        memory = "" if growth is None else f", {growth:+.1f} MiB resident"
+        print(f"  {stage['stage']:>14}: {1000 * stage['seconds']:8.1f} ms"
+              f"{count}{memory}")
+
+
+"""
+- Main Method
+"""
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--volumes', dest='volumes', nargs='+',
+                        choices=VOLUMES, default=list(VOLUMES))
+    parser.add_argument('--sizes', dest='sizes', nargs='+', type=int,
+                        default=[64, 128, 256], help='points per axis')
+    parser.add_argument('--pipelines', dest='pipelines', nargs='+',
+                        choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS),
+                        default='contour', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int,
+                        default=None, help='contouring threads (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true',
+                        help='memory map the synthetic volumes')
+    parser.add_argument('--repeats', dest='repeats', type=int,
+                        default=3, help='runs per case (best is kept)')
+    parser.add_argument('--data-dir', dest='data_dir', type=str,
+                        default=os.path.join(CACHE_DIR, 'bench'),
+                        help='synthetic volumes directory')
+    parser.add_argument('--out', dest='out', type=str,
+                        default='isobench.json', help='results file')
+    parser.add_argument('--compare', dest='compare', type=str,
+                        default=None, help='previous results file')
+    parser.add_argument('--tolerance', dest='tolerance', type=float,
+                        default=0.25, help='allowed slow down (fraction)')
+    args = parser.parse_args()
+
+    results = {'commit': currentCommit(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'vtk': vtk.vtkVersion.GetVTKVersion(),
+               'cpus': os.cpu_count(),
+               'backend': args.backend,
+               'threads': args.threads,
+               'results': list()}
+
+    for size in args.sizes:
+        for volume in args.volumes:
+            dataFile, gradFile = syntheticFiles(volume, size, args.data_dir)
+            for pipeline in args.pipelines:
+                case = {'volume': volume, 'size': size, 'pipeline': pipeline,
+                        'data_file': dataFile, 'grad_file': gradFile,
+                        'backend': args.backend, 'threads': args.threads,
+                        'mmap': args.mmap, 'repeats': args.repeats}
+                with get_context('spawn').Pool(1) as pool:
+                    result = pool.apply(runCase, (case,))
+                printCase(result)
+                results['results'].append(result)
+
+    with open(args.out, 'w') as fp:
+        json.dump(results, fp, indent=1)
+    print(f"Results written to {args.out}")
+
+    if args.compare is not None:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        regressions = compareResults(results, baseline, args.tolerance)
+        print(f"{len(regressions)} regressions against "
+              f"{baseline.get('commit') or args.compare}")
+        for regression in regressions:
+            print(f"  {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
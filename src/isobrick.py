@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+Brick parallel contouring across a pool of worker processes.
+
+The volume is split into bricks of cells that are contoured (and sampled
+against the gradient magnitude volume when asked) by a pool of worker
+processes holding the volumes through isoshared. Bricks whose scalar range
+misses every isovalue are never sent. A worker contours its brick padded
+with one ghost layer of cells and keeps only the polygons of the brick's
+own cells, so the normals and edge gradients on the brick faces are
+computed from the same neighbours as in a single pass, with every backend
+(flying edges only looks at the extent it contours). Neighbouring bricks
+share their boundary points: the pieces are joined and coincident vertices
+are merged, giving the triangles of a single pass. Where the isovalue
+passes exactly through grid points, a single pass may list the same
+position more than once; the merged mesh lists it once.
+
+Run as a script to measure the speed-up against the number of processes
+on a synthetic volume:
+
+    python isobrick.py --size 256 --processes 1 2 4 8
+"""
+
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+from isocontour import BACKENDS, configureThreads, createBackendFilter
+from isocrop import cropCells, intersectExtents, mergePoints, padExtent
+from isoprobe import createProbeFilter
+from isoshared import attachImage, shareImage
+from isospan import reduceBricks
+
+
+"""
+- Worker Methods
+"""
+
+# Initialize Worker Method (one contouring thread per process)
+def initWorker():
+    global worker
+    configureThreads(1)
+    worker = {'images': dict(), 'pipelines': dict()}
+
+# Attach Shared Image Method (keeps the last block attached per role)
+def attachShared(role, description):
+    global worker
+    name = description.get('block', description.get('file'))
+    attached = worker['images'].get(role)
+    if attached is None or attached[0] != name:
+        if attached is not None and attached[1] is not None:
+            attached[1].close()
+        block, values, image = attachImage(description)
+        attached = (name, block, values, image)
+        worker['images'][role] = attached
+    return attached[3]
+
+# Get Worker Pipeline Method (built once per backend and probe mode)
+def workerPipeline(backend, probe, passPointArrays):
+    global worker
+    key = (backend, probe, passPointArrays)
+    if key not in worker['pipelines']:
+        clip = vtk.vtkImageClip()
+        clip.ClipDataOff()
+        contours = createBackendFilter(backend)
+        contours.SetInputConnection(clip.GetOutputPort())
+        output = contours
+        if probe is not None:
+            output = createProbeFilter(probe == 'edge')
+            output.SetInputConnection(contours.GetOutputPort())
+            if passPointArrays:
+                output.PassPointArraysOn()
+        worker['pipelines'][key] = (clip, contours, output)
+    return worker['pipelines'][key]
+
+# Contour Brick Method (runs in a worker)
+def contourBrick(task):
+    clip, contours, output = workerPipeline(task['backend'], task['probe'],
+                                            task['passPointArrays'])
+    image = attachShared('volume', task['volume'])
+    clip.SetInputData(image)
+    clip.SetOutputWholeExtent(padExtent(task['extent'], task['bounds']))
+    contours.SetNumberOfContours(len(task['values']))
+    for i, value in enumerate(task['values']):
+        contours.SetValue(i, value)
+    contours.SetComputeNormals(task['normals'])
+    contours.SetComputeGradients(task['gradients'])
+    if task['probe'] == 'volume':
+        output.SetSourceData(attachShared('gradient', task['gradient']))
+    output.Update()
+    return polyDataArrays(cropCells(output.GetOutputDataObject(0), image,
+                                    task['extent'], task['bounds']))
+
+
+"""
+- Mesh Transfer Methods
+"""
+
+# Poly Data to Arrays Method (picklable copy of the points and triangles)
+def polyDataArrays(polyData):
+    pointData = polyData.GetPointData()
+    polys = polyData.GetPolys()
+    arrays = {'points': None, 'offsets': None, 'connectivity': None,
+              'pointData': list(), 'scalars': None, 'normals': None}
+    if polyData.GetNumberOfPoints() == 0 or polys.GetNumberOfCells() == 0:
+        return arrays
+    arrays['points'] = np.array(vtk_to_numpy(polyData.GetPoints().GetData()))
+    arrays['offsets'] = np.array(vtk_to_numpy(polys.GetOffsetsArray()))
+    arrays['connectivity'] = np.array(
+        vtk_to_numpy(polys.GetConnectivityArray()))
+    for i in range(pointData.GetNumberOfArrays()):
+        array = pointData.GetArray(i)
+        if array is not None:
+            arrays['pointData'].append(
+                (array.GetName(), np.array(vtk_to_numpy(array))))
+    if pointData.GetScalars() is not None:
+        arrays['scalars'] = pointData.GetScalars().GetName()
+    if pointData.GetNormals() is not None:
+        arrays['normals'] = pointData.GetNormals().GetName()
+    return arrays
+
+# Join Pieces Method (one poly data, point ids shifted per piece)
+def joinPieces(pieces):
+    polyData = vtk.vtkPolyData()
+    pieces = [piece for piece in pieces if piece['points'] is not None]
+    if not pieces:
+        return polyData
+    counts = np.cumsum([0] + [piece['points'].shape[0] for piece in pieces])
+    cells = np.cumsum([0] + [piece['offsets'][-1] for piece in pieces])
+    offsets = np.concatenate([pieces[0]['offsets'][:1]]
+                             + [piece['offsets'][1:] + cells[i]
+                                for i, piece in enumerate(pieces)])
+    connectivity = np.concatenate([piece['connectivity'] + counts[i]
+                                   for i, piece in enumerate(pieces)])
+
+    points = vtk.vtkPoints()
+    points.SetData(numpy_to_vtk(np.concatenate(
+        [piece['points'] for piece in pieces]), deep=True))
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_to_vtk(offsets.astype(np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE),
+                  numpy_to_vtk(connectivity.astype(np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE))
+    polyData.SetPoints(points)
+    polyData.SetPolys(polys)
+
+    pointData = polyData.GetPointData()
+    for j, (name, _) in enumerate(pieces[0]['pointData']):
+        array = numpy_to_vtk(np.concatenate(
+            [piece['pointData'][j][1] for piece in pieces]), deep=True)
+        array.SetName(name)
+        pointData.AddArray(array)
+    if pieces[0]['scalars'] is not None:
+        pointData.SetActiveScalars(pieces[0]['scalars'])
+    if pieces[0]['normals'] is not None:
+        pointData.SetActiveNormals(pieces[0]['normals'])
+    return polyData
+
+
+"""
+- Brick Pool Class
+"""
+
+class BrickPool:
+
+    # Constructor Method (processes None uses every core, ranges maps whole
+    # extents to their brick min/max when already known from the metadata)
+    def __init__(self, processes=None, brickSize=64, ranges=None):
+        if processes is None:
+            processes = os.cpu_count()
+        self.processes = max(1, processes)
+        self.brickSize = brickSize
+        self.ranges = dict() if ranges is None else ranges
+        self.pool = None
+        self.shared = dict()
+
+    # Get Process Pool Method (started on first use)
+    def getPool(self):
+        if self.pool is None:
+            self.pool = Pool(self.processes, initWorker)
+        return self.pool
+
+    # Share Image Method (once per scalars array and modification)
+    def share(self, image):
+        scalars = image.GetPointData().GetScalars()
+        key = (scalars.GetAddressAsString('vtkObject'), scalars.GetMTime(),
+               tuple(image.GetExtent()))
+        if key not in self.shared:
+            block, description = shareImage(image)
+            self.shared[key] = (block, description, self.brickRanges(image))
+        return self.shared[key]
+
+    # Get Brick Ranges Method (scalar min/max per brick, z/y/x order)
+    def brickRanges(self, image):
+        ranges = self.ranges.get(tuple(image.GetExtent()))
+        if ranges is not None:
+            return ranges
+        nx, ny, nz = image.GetDimensions()
+        points = vtk_to_numpy(image.GetPointData().GetScalars())
+        points = points.reshape(nz, ny, nx)
+        mins, maxs = points, points
+        for axis in (2, 1, 0):
+            mins = reduceBricks(mins, self.brickSize, axis, np.minimum)
+            maxs = reduceBricks(maxs, self.brickSize, axis, np.maximum)
+        return mins, maxs
+
+    # Get Active Brick Extents Method (cells inside extent spanning a value)
+    def brickExtents(self, image, ranges, extent, values):
+        mins, maxs = ranges
+        active = np.zeros(mins.shape, dtype=bool)
+        for value in values:
+            active |= (mins <= value) & (value <= maxs)
+        x0, x1, y0, y1, z0, z1 = image.GetExtent()
+        b = self.brickSize
+        extents = list()
+        for k, j, i in zip(*np.nonzero(active)):
+            brick = (x0 + i * b, min(x0 + (i + 1) * b, x1),
+                     y0 + j * b, min(y0 + (j + 1) * b, y1),
+                     z0 + k * b, min(z0 + (k + 1) * b, z1))
+            brick = intersectExtents(brick, extent)
+            if brick is not None and all(brick[2 * axis] < brick[2 * axis + 1]
+                                         for axis in range(3)):
+                extents.append(brick)
+        return extents
+
+    # Contour Method (tasks sent across the pool, pieces joined and merged)
+    def contour(self, image, extent, values, backend='contour', normals=True,
+                gradients=False, gradient=None, probe=None,
+                passPointArrays=False):
+        _, description, ranges = self.share(image)
+        gradDescription = None
+        if probe == 'volume':
+            gradDescription = self.share(gradient)[1]
+        tasks = [{'volume': description, 'gradient': gradDescription,
+                  'extent': brick, 'bounds': extent, 'values': values,
+                  'backend': backend,
+                  'normals': normals, 'gradients': gradients, 'probe': probe,
+                  'passPointArrays': passPointArrays}
+                 for brick in self.brickExtents(image, ranges, extent, values)]
+        pieces = self.getPool().map(contourBrick, tasks, chunksize=1)
+        polyData = joinPieces(pieces)
+        if polyData.GetNumberOfPoints() == 0:
+            return polyData
+        return mergePoints(polyData)
+
+    # Close Method (stops the workers and frees the shared blocks)
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        for block, _, _ in self.shared.values():
+            block.close()
+            block.unlink()
+        self.shared.clear()
+
+
+"""
+- Brick Contour Filter Class
+"""
+
+class BrickContourFilter(VTKPythonAlgorithmBase):
+
+    # Constructor Method (gradient is the image to probe, None for none)
+    def __init__(self, bricks, backend='contour', gradient=None,
+                 edgeProbe=False):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkImageData',
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+        self.bricks = bricks
+        self.backend = backend
+        self.gradient = gradient
+        self.probe = None
+        if edgeProbe:
+            self.probe = 'edge'
+        elif gradient is not None:
+            self.probe = 'volume'
+        self.values = list()
+        self.normals = False
+        self.gradients = edgeProbe
+        self.passPointArrays = False
+
+    # Set Contour Value Method
+    def SetValue(self, i, value):
+        if i >= len(self.values):
+            self.values += [0.0] * (i + 1 - len(self.values))
+        self.values[i] = value
+        self.Modified()
+
+    # Get Contour Value Method
+    def GetValue(self, i):
+        return self.values[i]
+
+    # Set Number of Contours Method
+    def SetNumberOfContours(self, number):
+        self.values = (self.values + [0.0] * number)[:number]
+        self.Modified()
+
+    # Get Number of Contours Method
+    def GetNumberOfContours(self):
+        return len(self.values)
+
+    # Compute Normals On Method
+    def ComputeNormalsOn(self):
+        self.normals = True
+        self.Modified()
+
+    # Compute Normals Off Method
+    def ComputeNormalsOff(self):
+        self.normals = False
+        self.Modified()
+
+    # Compute Gradients On Method
+    def ComputeGradientsOn(self):
+        self.gradients = True
+        self.Modified()
+
+    # Compute Gradients Off Method
+    def ComputeGradientsOff(self):
+        self.gradients = False
+        self.Modified()
+
+    # Pass Point Arrays On Method (keep the contour arrays when probing)
+    def PassPointArraysOn(self):
+        self.passPointArrays = True
+        self.Modified()
+
+    # Pass Point Arrays Off Method
+    def PassPointArraysOff(self):
+        self.passPointArrays = False
+        self.Modified()
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        image = vtk.vtkImageData.GetData(inInfo[0])
+        output = vtk.vtkPolyData.GetData(outInfo)
+
+        # Requested extent (smaller than the data when cropped upstream)
+        whole = inInfo[0].GetInformationObject(0).Get(
+            vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+        output.ShallowCopy(self.bricks.contour(
+            image, whole, self.values, self.backend, self.normals,
+            self.gradients, self.gradient, self.probe, self.passPointArrays))
+        return 1
+
+
+"""
+- Benchmark Methods
+"""
+
+# Synthetic Volume Method (wavelet source, size points per axis)
+def syntheticVolume(size):
+    half = size // 2
+    source = vtk.vtkRTAnalyticSource()
+    source.SetWholeExtent(-half, size - half - 1, -half, size - half - 1,
+                          -half, size - half - 1)
+    source.Update()
+    image = vtk.vtkImageData()
+    image.ShallowCopy(source.GetOutput())
+    return image
+
+# Benchmark Method (serial filter against brick pools of each size)
+def benchmark(size, processes, brickSize, backend, repeats):
+    image = syntheticVolume(size)
+    low, high = image.GetScalarRange()
+    values = [low + (high - low) * t for t in (0.3, 0.5, 0.7)]
+
+    configureThreads(1)
+    contours = createBackendFilter(backend)
+    contours.SetInputData(image)
+    contours.ComputeNormalsOn()
+    serial = float('inf')
+    for value in values * repeats:
+        contours.SetValue(0, value)
+        start = time.perf_counter()
+        contours.Update()
+        serial = min(serial, time.perf_counter() - start)
+    cells = contours.GetOutput().GetNumberOfCells()
+    print(f"{size}^3 wavelet, {backend}, serial: {1000 * serial:.1f} ms "
+          f"({cells} cells)")
+
+    source = vtk.vtkTrivialProducer()
+    source.SetOutput(image)
+    for n in processes:
+        bricks = BrickPool(n, brickSize)
+        contours = BrickContourFilter(bricks, backend)
+        contours.SetInputConnection(source.GetOutputPort())
+        contours.ComputeNormalsOn()
+        contours.SetValue(0, values[0])
+        best = float('inf')
+        try:
+            contours.Update()
+            for value in values * repeats:
+                contours.SetValue(0, value)
+                start = time.perf_counter()
+                contours.Update()
+                best = min(best, time.perf_counter() - start)
+        finally:
+            bricks.close()
+        cells = contours.GetOutputDataObject(0).GetNumberOfCells()
+        print(f"{size}^3 wavelet, {backend}, {n} processes: "
+              f"{1000 * best:.1f} ms ({cells} cells), "
+              f"{serial / best:.2f}x speed-up")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', dest='size', type=int,
+                        default=256, help='points per axis')
+    parser.add_argument('--processes', dest='processes', nargs='+', type=int,
+                        default=[1, 2, 4, 8], help='pool sizes to measure')
+    parser.add_argument('--brick-size', dest='brick_size', type=int,
+                        default=64, help='cells per brick side')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS),
+                        default='flying-edges', help='contouring algorithm')
+    parser.add_argument('--repeats', dest='repeats', type=int,
+                        default=3, help='runs per isovalue (best is kept)')
+    args = parser.parse_args()
+    benchmark(args.size, args.processes, args.brick_size, args.backend,
+              args.repeats)
\ No newline at end of file
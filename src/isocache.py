@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Isosurface cache shared by the isosurface scripts.
+
+Extracted surfaces are kept in memory keyed by (dataset identity, isovalue)
+and evicted in least recently used order once the memory budget is exceeded.
+"""
+
+import os
+from collections import OrderedDict
+
+import vtk
+
+
+"""
+- Key Methods
+"""
+
+# Get Dataset Identity Method
+def datasetKey(fileName):
+    stat = os.stat(fileName)
+    return (os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns)
+
+# Copy Filter Output Method
+def copyOutput(algorithm):
+    polyData = vtk.vtkPolyData()
+    polyData.ShallowCopy(algorithm.GetOutputDataObject(0))
+    return polyData
+
+
+"""
+- Cache Class
+"""
+
+class IsosurfaceCache:
+
+    # Constructor Method (budget in MiB)
+    def __init__(self, budget=512):
+        self.budget = int(budget * 1024)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Contains Method (does not touch counters nor LRU order)
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Get Cached Surface Method
+    def get(self, key):
+        polyData = self.entries.get(key)
+        if polyData is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return polyData
+
+    # Store Surface Method
+    def put(self, key, polyData):
+        size = polyData.GetActualMemorySize()
+        if size > self.budget:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key).GetActualMemorySize()
+        self.entries[key] = polyData
+        self.size += size
+        while self.size > self.budget:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.GetActualMemorySize()
+            self.evictions += 1
+
+    # Remove Surface Method (returns it, or None when not cached)
+    def pop(self, key):
+        polyData = self.entries.pop(key, None)
+        if polyData is not None:
+            self.size -= polyData.GetActualMemorySize()
+        return polyData
+
+    # Clear Cache Method
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    # Get Statistics Method
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries),
+                'size_mb': self.size / 1024.0,
+                'budget_mb': self.budget / 1024.0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    # Print Statistics Method
+    def printStats(self, name="Isosurface cache"):
+        s = self.stats()
+        print(f"{name}: {s['entries']} entries, "
+              f"{s['size_mb']:.1f} / {s['budget_mb']:.0f} MiB, "
+              f"{s['hits']} hits, {s['misses']} misses, "
+              f"{s['evictions']} evictions "
+              f"({100.0 * s['hit_rate']:.1f}% hit rate)")
\ No newline at end of file
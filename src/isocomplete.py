@@ -8,6 +8,23 @@ Created on Mon Oct 12 14:25:15 2020
 
 import vtk
 
+from isoband import GradientBandClipper
+from isobrick import BrickContourFilter, BrickPool
+from isocontour import (BACKENDS, ContourTimer, configureThreads,
+                        createContourFilter)
+from isocrop import VolumeCrop
+from isograd import loadGradientMagnitude
+from isolatency import LatencyTracer
+from isolod import LevelOfDetail
+from isometa import loadMetadata, metadataBricks
+from isommap import openVolume, readVolume
+from isoprobe import createProbeFilter
+from isoprofile import PipelineProfiler
+from isolayers import MultiLayerExtractor
+from isoschedule import InteractionScheduler
+from isospan import BRICK_SIZE, buildSpanSpaceIndex
+from isostore import MeshStore
+
 # Get Program Parameters
 def get_program_parameters():
     import argparse
@@ -15,13 +32,68 @@ def get_program_parameters():
     parser.add_argument('data_file', nargs='?', 
                         default=None, help='isosurface data vti file')
     parser.add_argument('grad_file', nargs='?', 
-                        default=None, help='gradient magnitude vti file')
+                        default=None, 
+                        help='gradient magnitude vti file (computed if omitted)')
     parser.add_argument('params_file', nargs='?', 
                         default=None, help='parameters file')
     parser.add_argument('--clip', dest='clip', nargs=3, 
                         type=int, default=None)
+    parser.add_argument('--span', dest='span', action='store_true', 
+                        help='contour with a span space index')
+    parser.add_argument('--crop', dest='crop', action='store_true', 
+                        help='crop the volume to the clip box before contouring')
+    parser.add_argument('--render-clip', dest='render_clip', 
+                        action='store_true', 
+                        help='clip with the X/Y/Z planes while rendering')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS), 
+                        default='contour', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int, 
+                        default=None, help='contouring threads (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true', 
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--single-pass', dest='single_pass', 
+                        action='store_true', 
+                        help='contour and probe all layers in one pass')
+    parser.add_argument('--fast-probe', dest='fast_probe', 
+                        action='store_true', 
+                        help='sample the computed gradient along contour edges')
+    parser.add_argument('--grad-cache', dest='grad_cache', type=str, 
+                        default=None, help='computed gradient cache directory')
+    parser.add_argument('--bricks', dest='bricks', type=int, 
+                        default=None, 
+                        help='contour and probe in bricks across this many processes')
+    parser.add_argument('--brick-size', dest='brick_size', type=int, 
+                        default=64, help='cells per brick side')
+    parser.add_argument('--profile', dest='profile', type=str, 
+                        default=None, 
+                        help='write per-stage pipeline timings (.json or .csv)')
+    parser.add_argument('--profile-overlay', dest='profile_overlay', 
+                        action='store_true', 
+                        help='show per-stage pipeline timings on screen')
+    parser.add_argument('--latency-log', dest='latency_log', type=str, 
+                        default=None, 
+                        help='write per-event slider latency records (.csv)')
+    parser.add_argument('--fps', dest='fps', type=float, default=30, 
+                        help='target frame rate of slider updates, skipping '
+                        'the values in between (0 updates on every event)')
+    parser.add_argument('--lod', dest='lod', action='store_true', 
+                        help='draw decimated proxies of the surfaces while '
+                        'the view moves, to hold the --fps frame rate')
+    parser.add_argument('--mesh-cache-mb', dest='mesh_cache_mb', type=float, 
+                        default=1024, 
+                        help='persistent mesh cache budget (MiB, 0 disables)')
     args = parser.parse_args()
-    return args.data_file, args.grad_file, args.params_file, args.clip
+    
+    # Gradient File is Optional ("data_file params_file")
+    if args.params_file is None:
+        args.params_file, args.grad_file = args.grad_file, None
+    
+    return (args.data_file, args.grad_file, args.params_file, args.clip, 
+            args.span, args.crop, args.render_clip, args.single_pass, 
+            args.grad_cache, args.fast_probe, args.backend, args.threads, 
+            args.mmap, args.bricks, args.brick_size, args.profile, 
+            args.profile_overlay, 
+            args.latency_log, args.fps, args.lod, args.mesh_cache_mb)
 
 
 """
@@ -79,13 +151,15 @@ def createSlideBar(min_, max_, val, x1, x2, y, name):
     slideBar.SetLabelHeight(0.02)
     return slideBar
 
-# Create Slider Widget Method
-def createSliderWidget(slideBar, interactor):
+# Create Slider Widget Method (traces its latency when given a tracer)
+def createSliderWidget(slideBar, interactor, tracer=None):
     sliderWidget = vtk.vtkSliderWidget()
     sliderWidget.SetInteractor(interactor)
     sliderWidget.SetRepresentation(slideBar)
     sliderWidget.SetAnimationModeToAnimate()
     sliderWidget.SetEnabled(True)
+    if tracer is not None:
+        tracer.watchSlider(sliderWidget)
     return sliderWidget
 
 
@@ -93,12 +167,29 @@ def createSliderWidget(slideBar, interactor):
 - Callback Methods
 """
 
+# Use Live Layers Method (layers loaded from the mesh store are extracted
+# again once the clip box they were stored with changes)
+def useLiveLayers():
+    global storedLayers
+    for mapper, gradClipper in storedLayers:
+        mapper.SetInputConnection(gradClipper.GetOutputPort())
+    storedLayers = list()
+
+# Move Crop Box Method
+def moveCrop(axis, value):
+    global crop, renderClip
+    if crop is not None or not renderClip:
+        useLiveLayers()
+    if crop is not None:
+        crop.setLower(axis, value)
+
 # X Plane Value Slider Bar Callback Method
 def vtkXSlideBarCallback(obj, event):
     global xPlane
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     xPlane.SetOrigin(value, 0, 0)
+    moveCrop(0, value)
     
 # Y Plane Value Slider Bar Callback Method
 def vtkYSlideBarCallback(obj, event):
@@ -106,6 +197,7 @@ def vtkYSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     yPlane.SetOrigin(0, value, 0)
+    moveCrop(1, value)
 
 # Z Plane Value Slider Bar Callback Method
 def vtkZSlideBarCallback(obj, event):
@@ -113,6 +205,7 @@ def vtkZSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     zPlane.SetOrigin(0, 0, value)
+    moveCrop(2, value)
 
 
 """
@@ -120,19 +213,37 @@ def vtkZSlideBarCallback(obj, event):
 """
 
 def main():
-    global xPlane, yPlane, zPlane
+    global crop, renderClip, storedLayers, xPlane, yPlane, zPlane
+    
+    (data_file, grad_file, params_file, clip, span, crop, render_clip, 
+     single_pass, grad_cache, fast_probe, backend, threads, 
+     mmap, bricks, brick_size, profile, 
+     profile_overlay, latency_log, fps, lod, 
+     mesh_cache_mb) = get_program_parameters()
+    
+    # Pipeline Profiler (does nothing unless profiling)
+    profiler = PipelineProfiler(profile, profile_overlay)
+    
+    # Slider Latency Tracer
+    tracer = LatencyTracer(latency_log)
     
-    data_file, grad_file, params_file, clip = get_program_parameters()
+    # Open Data (memory mapped with --mmap)
+    reader = openVolume(data_file, mmap)
     
-    # Load Data
-    reader = vtk.vtkXMLImageDataReader()
-    reader.SetFileName(data_file)
-    reader.Update()
+    # Volume Metadata (sidecar file, the volume is only read here when it
+    # has to be measured on the first load)
+    meta = loadMetadata(data_file, lambda: readVolume(reader))
     
-    #Load Gradient Magnitude
-    gradReader = vtk.vtkXMLImageDataReader()
-    gradReader.SetFileName(grad_file)
-    gradReader.Update()
+    # Load Data (after the metadata)
+    with profiler.stage('read'):
+        readVolume(reader)
+    profiler.watch(reader, 'read')
+    
+    #Load Gradient Magnitude (computed from the data when no file is given)
+    with profiler.stage('read gradient'):
+        gradReader = loadGradientMagnitude(reader, data_file, grad_file, 
+                                           grad_cache, mmap)
+    profiler.watch(gradReader, 'read gradient')
     
     # Load Parameters File
     params = readParamsFile(params_file)
@@ -142,14 +253,10 @@ def main():
         xVal, yVal, zVal = 0, 0, 0
     else:
         xVal, yVal, zVal = clip[0], clip[1], clip[2]
+    renderClip = render_clip
     
-    # Get Bounds of Input Data Actor
-    m = vtk.vtkDataSetMapper()
-    m.SetInputConnection(reader.GetOutputPort())
-    
-    a = vtk.vtkActor()
-    a.SetMapper(m)
-    aBo = a.GetBounds()
+    # Get Bounds of Input Data (from the metadata)
+    aBo = meta['bounds']
     xMax, yMax, zMax = int(aBo[1] + 1), int(aBo[3] + 1), int(aBo[5] + 1)
     
     # Define Planes Origins
@@ -181,6 +288,34 @@ def main():
     planes.GetPlane(1, yPlane)
     planes.GetPlane(2, zPlane)
     
+    # Crop Volume to Clip Box (shared by every layer)
+    if crop:
+        crop = VolumeCrop((xVal, yVal, zVal))
+        volumePort = crop.addVolume(reader)
+    else:
+        crop = None
+        volumePort = reader.GetOutputPort()
+    
+    # Contouring Backend and Threads
+    configureThreads(threads)
+    timer = ContourTimer(backend)
+    
+    # Span Space Index (shared by every layer, bricks skip inactive bricks)
+    if bricks:
+        span = False
+    index = None
+    if span:
+        index = buildSpanSpaceIndex(reader.GetOutput(), 
+                                    ranges=metadataBricks(meta, BRICK_SIZE))
+    
+    # Brick Pool (shared by every layer, with the brick ranges of the
+    # metadata)
+    brickPool = None
+    if bricks:
+        ranges = metadataBricks(meta, brick_size)
+        brickPool = BrickPool(bricks, brick_size, 
+                              {tuple(meta['extent']): ranges})
+    
     # Create Renderer, Render Window and Render Window Interactor
     ren = vtk.vtkRenderer()
     renWin = vtk.vtkRenderWindow()
@@ -188,52 +323,117 @@ def main():
     iren = vtk.vtkRenderWindowInteractor()
     iren.SetRenderWindow(renWin)
     
+    # Slider Interaction Scheduler (coalesces events to the frame rate)
+    scheduler = InteractionScheduler(iren, fps)
+    tracer.watchScheduler(scheduler)
+    
+    # Level of Detail Proxies while the View Moves (fainter layers coarser)
+    levelOfDetail = LevelOfDetail(iren, fps) if lod else None
+    
+    # Sample Gradient along Contour Edges (only for the computed gradient)
+    edgeProbe = fast_probe and grad_file is None
+    if fast_probe and grad_file is not None:
+        print("--fast-probe needs the gradient computed from the data, "
+              "probing grad_file instead")
+    
+    # Persistent Mesh Store (layers seen before are loaded, not extracted;
+    # the clip corner only keys layers that are cropped or clipped on the CPU)
+    store = MeshStore(grad_cache, mesh_cache_mb)
+    storedLayers = list()
+    if store.enabled:
+        clipCorner = [xVal, yVal, zVal] if crop or not render_clip else None
+        with profiler.stage('hash'):
+            sourceKey = [store.contentHash(data_file), 
+                         store.contentHash(grad_file), 
+                         clipCorner, bool(crop), render_clip, 
+                         single_pass, edgeProbe, backend]
+    
+    # Single Pass Extraction of every Distinct Isovalue
+    if single_pass:
+        clipPlanes = () if crop or render_clip else (xPlane, yPlane, zPlane)
+        layers = MultiLayerExtractor(volumePort, gradReader.GetOutputPort(), 
+                                     [param['isoval'] for param in params], 
+                                     index, clipPlanes, edgeProbe, backend, 
+                                     brickPool)
+        timer.watch(layers.contours)
+    
     for param in params:
-        # Generate Contours
-        contours = vtk.vtkContourFilter()
-        contours.SetInputConnection(reader.GetOutputPort());
-        contours.ComputeNormalsOn()
-        contours.SetValue(0, param['isoval'])
+        if single_pass:
+            clippedPort = layers.outputPort(param['isoval'])
+        else:
+            # Generate Contours (contoured and probed in bricks across a pool)
+            if brickPool is not None:
+                contours = timer.watch(BrickContourFilter(
+                    brickPool, backend, gradReader.GetOutput(), edgeProbe))
+            else:
+                contours = timer.watch(createContourFilter(index, backend))
+            contours.SetInputConnection(volumePort);
+            contours.ComputeNormalsOn()
+            if edgeProbe:
+                contours.ComputeGradientsOn()
+            contours.SetValue(0, param['isoval'])
+            
+            # Apply Probe Filter (already probed in the brick pool)
+            if brickPool is not None:
+                probe = contours
+            else:
+                probe = createProbeFilter(edgeProbe)
+                probe.SetInputConnection(contours.GetOutputPort())
+                if not edgeProbe:
+                    probe.SetSourceConnection(gradReader.GetOutputPort())
+            
+            # Set Clippers
+            xClipper = vtk.vtkClipPolyData()
+            xClipper.SetClipFunction(xPlane)
+            xClipper.SetInputConnection(probe.GetOutputPort())
+            
+            yClipper = vtk.vtkClipPolyData()
+            yClipper.SetClipFunction(yPlane)
+            yClipper.SetInputConnection(xClipper.GetOutputPort())
+            
+            zClipper = vtk.vtkClipPolyData()
+            zClipper.SetClipFunction(zPlane)
+            zClipper.SetInputConnection(yClipper.GetOutputPort())
+            
+            clipped = probe if crop or render_clip else zClipper
+            clippedPort = clipped.GetOutputPort()
         
-        # Apply Probe Filter
-        probe = vtk.vtkProbeFilter()
-        probe.SetInputConnection(contours.GetOutputPort())
-        probe.SetSourceConnection(gradReader.GetOutputPort())
+        # Clip by Gradient Magnitude Range (single pass)
+        gradClipper = GradientBandClipper(param['gradMin'], param['gradMax'])
+        gradClipper.SetInputConnection(clippedPort)
+        profiler.watchUpstream(gradClipper, f" {param['isoval']}")
         
-        # Set Clippers
-        xClipper = vtk.vtkClipPolyData()
-        xClipper.SetClipFunction(xPlane)
-        xClipper.SetInputConnection(probe.GetOutputPort())
-        
-        yClipper = vtk.vtkClipPolyData()
-        yClipper.SetClipFunction(yPlane)
-        yClipper.SetInputConnection(xClipper.GetOutputPort())
-        
-        zClipper = vtk.vtkClipPolyData()
-        zClipper.SetClipFunction(zPlane)
-        zClipper.SetInputConnection(yClipper.GetOutputPort())
-        
-        # Clip by Gradient Magnitude Range
-        gradClipper1 = vtk.vtkClipPolyData()
-        gradClipper1.SetInputConnection(zClipper.GetOutputPort())
-        gradClipper1.InsideOutOff()
-        gradClipper1.SetValue(param['gradMin'])
-        gradClipper1.Update()
-    
-        gradClipper2 = vtk.vtkClipPolyData()
-        gradClipper2.SetInputConnection(gradClipper1.GetOutputPort())
-        gradClipper2.InsideOutOn()
-        gradClipper2.SetValue(param['gradMax'])
-        gradClipper2.Update()
+        # Load the Layer from the Mesh Store, else Extract and Store it
+        key, mesh = None, None
+        if store.enabled:
+            key = store.key(sourceKey, param['isoval'], param['gradMin'], 
+                            param['gradMax'])
+            with profiler.stage('load mesh'):
+                mesh = store.get(key)
+        if mesh is None:
+            gradClipper.Update()
+            store.put(key, gradClipper.GetOutputDataObject(0))
         
         # Create Color Function
         colorFunction = generateCTF(param)
         
         # Create Mapper, Actor and add Actor to Renderer
         mapper = vtk.vtkDataSetMapper()
-        mapper.SetInputConnection(gradClipper2.GetOutputPort())
+        if mesh is None:
+            mapper.SetInputConnection(gradClipper.GetOutputPort())
+        else:
+            stored = vtk.vtkTrivialProducer()
+            stored.SetOutput(mesh)
+            mapper.SetInputConnection(stored.GetOutputPort())
+            storedLayers.append((mapper, gradClipper))
         mapper.SetLookupTable(colorFunction)
         
+        # Clip with the Planes while Rendering
+        if render_clip:
+            mapper.AddClippingPlane(xPlane)
+            mapper.AddClippingPlane(yPlane)
+            mapper.AddClippingPlane(zPlane)
+        
         actor = vtk.vtkActor()
         #actor.GetProperty().SetRepresentationToWireframe()  # Uncomment for Triangles Representation
         actor.SetMapper(mapper)
@@ -241,6 +441,13 @@ def main():
         actor.GetProperty().SetOpacity(param['a'])
         
         ren.AddActor(actor)
+        if levelOfDetail is not None:
+            levelOfDetail.add(actor, param['a'])
+        profiler.watchUpstream(mapper, f" {param['isoval']}")
+        tracer.watchPipeline(mapper)
+    
+    profiler.watchRenderer(ren)
+    tracer.watchWindow(renWin)
     
     # Depth Peeling
     ren.SetUseDepthPeeling(1)
@@ -261,23 +468,41 @@ def main():
     
     # X Plane Value Slider Bar
     xSlideBar = createSlideBar(0, xMax, xVal, 0.05, 0.25, 0.40, "X")
-    xSliderWidget = createSliderWidget(xSlideBar, iren)
-    xSliderWidget.AddObserver("InteractionEvent", vtkXSlideBarCallback)
+    xSliderWidget = createSliderWidget(xSlideBar, iren, tracer)
+    scheduler.observe(xSliderWidget, vtkXSlideBarCallback)
     
     # Y Plane Value Slider Bar
     ySlideBar = createSlideBar(0, yMax, yVal, 0.05, 0.25, 0.25, "Y")
-    ySliderWidget = createSliderWidget(ySlideBar, iren)
-    ySliderWidget.AddObserver("InteractionEvent", vtkYSlideBarCallback)
+    ySliderWidget = createSliderWidget(ySlideBar, iren, tracer)
+    scheduler.observe(ySliderWidget, vtkYSlideBarCallback)
     
     # Z Plane Value Slider Bar
     zSlideBar = createSlideBar(0, zMax, zVal, 0.05, 0.25, 0.10, "Z")
-    zSliderWidget = createSliderWidget(zSlideBar, iren)
-    zSliderWidget.AddObserver("InteractionEvent", vtkZSlideBarCallback)
+    zSliderWidget = createSliderWidget(zSlideBar, iren, tracer)
+    scheduler.observe(zSliderWidget, vtkZSlideBarCallback)
     
     # Initialize Render
     iren.Initialize()
     renWin.Render()
     iren.Start()
+    
+    if brickPool is not None:
+        brickPool.close()
+    
+    profiler.dump()
+    
+    scheduler.printStats()
+    
+    tracer.printStats()
+    tracer.dump()
+    
+    timer.printStats()
+    
+    store.printStats()
+    
+    if levelOfDetail is not None:
+        levelOfDetail.close()
+        levelOfDetail.printStats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Contour filter factory shared by the isosurface scripts.
+
+The backend selects the image contouring algorithm: 'contour' is the
+generic vtkContourFilter, 'flying-edges' the parallel, locator-free
+vtkFlyingEdges3D, which scales with the SMP threads configured here.
+"""
+
+import threading
+import time
+
+import vtk
+
+from isospan import SpanSpaceContourFilter
+
+
+BACKENDS = {'contour': vtk.vtkContourFilter,
+            'flying-edges': vtk.vtkFlyingEdges3D,
+            'synchronized-templates': vtk.vtkSynchronizedTemplates3D}
+
+
+"""
+- Factory Methods
+"""
+
+# Configure Contour Threads Method (all cores when threads is None)
+def configureThreads(threads=None):
+    if threads != 1 and vtk.vtkSMPTools.GetBackend() == 'Sequential':
+        vtk.vtkSMPTools.SetBackend('STDThread')
+    if threads is not None:
+        vtk.vtkSMPTools.Initialize(threads)
+    return vtk.vtkSMPTools.GetEstimatedNumberOfThreads()
+
+# Create Backend Filter Method
+def createBackendFilter(backend='contour'):
+    return BACKENDS[backend]()
+
+# Create Contour Filter Method (index is an optional SpanSpaceIndex)
+def createContourFilter(index=None, backend='contour'):
+    if index is not None:
+        return SpanSpaceContourFilter(index,
+                                      contours=createBackendFilter(backend))
+    return createBackendFilter(backend)
+
+
+"""
+- Contour Timer Class
+"""
+
+class ContourTimer:
+
+    # Constructor Method
+    def __init__(self, backend='contour'):
+        self.backend = backend
+        self.times = list()
+        self.starts = dict()
+        self.lock = threading.Lock()
+
+    # Watch Algorithm Method (times every execution of the algorithm)
+    def watch(self, algorithm):
+        algorithm.AddObserver("StartEvent", self.start)
+        algorithm.AddObserver("EndEvent", self.end)
+        return algorithm
+
+    # Start Event Callback Method (also called on the worker thread)
+    def start(self, obj, event):
+        address = obj.GetAddressAsString('vtkObject')
+        with self.lock:
+            self.starts[address] = time.perf_counter()
+
+    # End Event Callback Method
+    def end(self, obj, event):
+        address = obj.GetAddressAsString('vtkObject')
+        with self.lock:
+            start = self.starts.pop(address, None)
+            if start is not None:
+                self.times.append(time.perf_counter() - start)
+
+    # Print Statistics Method
+    def printStats(self):
+        threads = vtk.vtkSMPTools.GetEstimatedNumberOfThreads()
+        name = f"Contour backend {self.backend} ({threads} threads)"
+        if not self.times:
+            print(f"{name}: no runs")
+            return
+        print(f"{name}: {len(self.times)} runs, "
+              f"{1000 * sum(self.times) / len(self.times):.1f} ms mean, "
+              f"{1000 * max(self.times):.1f} ms max")
\ No newline at end of file
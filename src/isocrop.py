@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Volume of interest cropping shared by the isosurface scripts.
+
+Instead of contouring the whole volume and clipping the surface against the
+X/Y/Z planes afterwards, the image extent handed to the contour filter is
+restricted to the box kept by the planes (x >= X, y >= Y, z >= Z). The crop
+does not copy the data, so gradients at the box faces still see their
+neighbours.
+"""
+
+import math
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+
+"""
+- Extent Methods
+"""
+
+# World Lower Corner to Image Extent Method
+def boxToExtent(image, lower):
+    origin = image.GetOrigin()
+    spacing = image.GetSpacing()
+    extent = list(image.GetExtent())
+    for axis in range(3):
+        first, last = extent[2 * axis], extent[2 * axis + 1]
+        index = math.floor((lower[axis] - origin[axis]) / spacing[axis])
+        extent[2 * axis] = min(max(index, first), last)
+    return extent
+
+# Intersect Extents Method (None when empty)
+def intersectExtents(a, b):
+    extent = list()
+    for axis in range(3):
+        first = max(a[2 * axis], b[2 * axis])
+        last = min(a[2 * axis + 1], b[2 * axis + 1])
+        if first > last:
+            return None
+        extent += [first, last]
+    return extent
+
+# Pad Extent Method (cells more on each side, within bounds)
+def padExtent(extent, bounds, cells=1):
+    return [max(extent[i] - cells, bounds[i]) if i % 2 == 0
+            else min(extent[i] + cells, bounds[i]) for i in range(6)]
+
+
+"""
+- Piece Methods
+"""
+
+# Crop Cells Method (keeps the polygons generated in the cells of extent,
+# found by their centres, and the points they use; the last face of bounds
+# is kept closed)
+def cropCells(polyData, image, extent, bounds):
+    polys = polyData.GetPolys()
+    if polys.GetNumberOfCells() == 0:
+        return polyData
+    offsets = vtk_to_numpy(polys.GetOffsetsArray())
+    connectivity = vtk_to_numpy(polys.GetConnectivityArray())
+    points = vtk_to_numpy(polyData.GetPoints().GetData())
+    counts = np.diff(offsets)
+    if (counts == 3).all():
+        centres = points[connectivity.reshape(-1, 3)].mean(axis=1)
+    else:
+        centres = (np.add.reduceat(points[connectivity], offsets[:-1], axis=0)
+                   / counts[:, None])
+    origin = image.GetOrigin()
+    spacing = image.GetSpacing()
+    keep = np.ones(counts.size, dtype=bool)
+    for axis in range(3):
+        index = (centres[:, axis] - origin[axis]) / spacing[axis]
+        first, last = extent[2 * axis], extent[2 * axis + 1]
+        keep &= index >= first
+        if last == bounds[2 * axis + 1]:
+            keep &= index <= last
+        else:
+            keep &= index < last
+    if keep.all():
+        return polyData
+
+    # Compact the points (the ghost cell points would win the face merge)
+    return compactPolygons(polyData, counts[keep],
+                           connectivity[np.repeat(keep, counts)])
+
+# Merge Coincident Points Method (vertices duplicated along the faces shared
+# by neighbouring pieces become one; every polygon is kept, also those left
+# with a repeated vertex, so the pieces give the triangles of a single pass)
+def mergePoints(polyData):
+    polys = polyData.GetPolys()
+    if polyData.GetNumberOfPoints() == 0 or polys.GetNumberOfCells() == 0:
+        return polyData
+    offsets = vtk_to_numpy(polys.GetOffsetsArray())
+    connectivity = vtk_to_numpy(polys.GetConnectivityArray())
+    points = np.ascontiguousarray(vtk_to_numpy(polyData.GetPoints().GetData()))
+    keys = points.view(np.dtype((np.void, points.strides[0]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True,
+                                  return_inverse=True)
+    return compactPolygons(polyData, np.diff(offsets),
+                           first[inverse.ravel()][connectivity])
+
+# Compact Polygons Method (polydata of the given polygons of polyData, with
+# only the points they use and the point data of those, but the excluded
+# arrays)
+def compactPolygons(polyData, counts, connectivity, exclude=()):
+    points = vtk_to_numpy(polyData.GetPoints().GetData())
+    mask = np.zeros(points.shape[0], dtype=bool)
+    mask[connectivity] = True
+    used = np.flatnonzero(mask)
+    connectivity = (np.cumsum(mask) - 1)[connectivity]
+    compact = vtk.vtkPolyData()
+    compactPoints = vtk.vtkPoints()
+    compactPoints.SetData(numpy_to_vtk(points[used], deep=True))
+    compact.SetPoints(compactPoints)
+    cells = vtk.vtkCellArray()
+    cells.SetData(numpy_to_vtk(np.concatenate(([0], np.cumsum(counts)))
+                               .astype(np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE),
+                  numpy_to_vtk(connectivity.astype(np.int64), deep=True,
+                               array_type=vtk.VTK_ID_TYPE))
+    compact.SetPolys(cells)
+    pointData = polyData.GetPointData()
+    compactData = compact.GetPointData()
+    for i in range(pointData.GetNumberOfArrays()):
+        array = pointData.GetArray(i)
+        if array is None or array.GetName() in exclude:
+            continue
+        values = numpy_to_vtk(vtk_to_numpy(array)[used], deep=True,
+                              array_type=array.GetDataType())
+        values.SetName(array.GetName())
+        compactData.AddArray(values)
+    for active, setActive in ((pointData.GetScalars(),
+                               compactData.SetActiveScalars),
+                              (pointData.GetNormals(),
+                               compactData.SetActiveNormals)):
+        if active is not None and active.GetName() not in exclude:
+            setActive(active.GetName())
+    return compact
+
+
+"""
+- Volume Crop Class
+"""
+
+class VolumeCrop:
+
+    # Constructor Method
+    def __init__(self, lower=(0, 0, 0)):
+        self.lower = list(lower)
+        self.clips = list()
+
+    # Add Volume Method (returns the cropped output port)
+    def addVolume(self, algorithm):
+        clip = vtk.vtkImageClip()
+        clip.ClipDataOff()
+        clip.SetInputConnection(algorithm.GetOutputPort())
+        self.clips.append((clip, algorithm.GetOutputDataObject(0)))
+        clip.SetOutputWholeExtent(self.extentFor(self.clips[-1][1]))
+        return clip.GetOutputPort()
+
+    # Get Crop Extent Method (of another lower corner if given)
+    def extentFor(self, image, lower=None):
+        return boxToExtent(image, self.lower if lower is None else lower)
+
+    # Get Crop Key Method (for caches, of another lower corner if given)
+    def key(self, lower=None):
+        return tuple(tuple(self.extentFor(image, lower)) 
+                     for _, image in self.clips)
+
+    # Set Lower Corner Along Axis Method
+    def setLower(self, axis, value):
+        self.lower[axis] = value
+        for clip, image in self.clips:
+            clip.SetOutputWholeExtent(self.extentFor(image))
+
+    # Crop Image Method (for images outside the pipeline)
+    def crop(self, image):
+        clip = vtk.vtkImageClip()
+        clip.ClipDataOff()
+        clip.SetInputData(image)
+        clip.SetOutputWholeExtent(self.extentFor(image))
+        return clip
\ No newline at end of file
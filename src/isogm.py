@@ -8,6 +8,22 @@ Created on Sun Oct 11 18:02:24 2020
 
 import vtk
 
+from isobrick import BrickContourFilter, BrickPool
+from isocontour import (BACKENDS, ContourTimer, configureThreads,
+                        createContourFilter)
+from isocrop import VolumeCrop
+from isograd import openGradientMagnitude
+from isolatency import LatencyTracer
+from isolod import LevelOfDetail
+from isometa import loadMetadata, metadataBricks
+from isommap import openVolume, readVolume
+from isoprobe import createProbeFilter
+from isoprofile import PipelineProfiler
+from isoschedule import InteractionScheduler
+from isospan import BRICK_SIZE, buildSpanSpaceIndex
+from isostore import MeshStore
+from isoworker import PipelineWorker
+
 # Get Program Parameters
 def get_program_parameters():
     import argparse
@@ -15,15 +31,71 @@ def get_program_parameters():
     parser.add_argument('data_file', nargs='?', 
                         default=None, help='isosurface data vti file')
     parser.add_argument('grad_file', nargs='?', 
-                        default=None, help='gradient magnitude vti file')
+                        default=None, 
+                        help='gradient magnitude vti file (computed if omitted)')
     parser.add_argument('isovals_file', nargs='?', 
                         default=None, help='isovalues file')
     parser.add_argument('--cmap', dest='colours', type=str, 
                         default=None, help='colours file')
     parser.add_argument('--clip', dest='clip', nargs=3, 
                         type=int, default=None)
+    parser.add_argument('--span', dest='span', action='store_true', 
+                        help='contour with a span space index')
+    parser.add_argument('--crop', dest='crop', action='store_true', 
+                        help='crop the volume to the clip box before contouring')
+    parser.add_argument('--render-clip', dest='render_clip', 
+                        action='store_true', 
+                        help='clip with the X/Y/Z planes while rendering')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS), 
+                        default='contour', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int, 
+                        default=None, help='contouring threads (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true', 
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--fast-probe', dest='fast_probe', 
+                        action='store_true', 
+                        help='sample the computed gradient along contour edges')
+    parser.add_argument('--grad-cache', dest='grad_cache', type=str, 
+                        default=None, help='computed gradient cache directory')
+    parser.add_argument('--bricks', dest='bricks', type=int, 
+                        default=None, 
+                        help='contour and probe in bricks across this many processes')
+    parser.add_argument('--brick-size', dest='brick_size', type=int, 
+                        default=64, help='cells per brick side')
+    parser.add_argument('--profile', dest='profile', type=str, 
+                        default=None, 
+                        help='write per-stage pipeline timings (.json or .csv)')
+    parser.add_argument('--profile-overlay', dest='profile_overlay', 
+                        action='store_true', 
+                        help='show per-stage pipeline timings on screen')
+    parser.add_argument('--latency-log', dest='latency_log', type=str, 
+                        default=None, 
+                        help='write per-event slider latency records (.csv)')
+    parser.add_argument('--fps', dest='fps', type=float, default=30, 
+                        help='target frame rate of slider updates, skipping '
+                        'the values in between (0 updates on every event)')
+    parser.add_argument('--lod', dest='lod', action='store_true', 
+                        help='draw decimated proxies of the surfaces while '
+                        'the view moves, to hold the --fps frame rate')
+    parser.add_argument('--background', dest='background', 
+                        action='store_true', 
+                        help='extract on a background thread, keeping the '
+                        'last surface on screen until the new one is ready')
+    parser.add_argument('--mesh-cache-mb', dest='mesh_cache_mb', type=float, 
+                        default=1024, 
+                        help='persistent mesh cache budget (MiB, 0 disables)')
     args = parser.parse_args()
-    return args.data_file, args.grad_file, args.isovals_file, args.colours, args.clip
+    
+    # Gradient File is Optional ("data_file isovals_file")
+    if args.isovals_file is None:
+        args.isovals_file, args.grad_file = args.grad_file, None
+    
+    return (args.data_file, args.grad_file, args.isovals_file, args.colours, 
+            args.clip, args.span, args.crop, args.render_clip, args.grad_cache, 
+            args.fast_probe, args.backend, args.threads, args.mmap, args.bricks, 
+            args.brick_size, args.profile, args.profile_overlay, 
+            args.latency_log, args.fps, args.lod, args.background, 
+            args.mesh_cache_mb)
 
 
 """
@@ -97,13 +169,15 @@ def createSlideBar(min_, max_, val, x1, x2, y, name):
     slideBar.SetLabelHeight(0.02)
     return slideBar
 
-# Create Slider Widget Method
-def createSliderWidget(slideBar, interactor):
+# Create Slider Widget Method (traces its latency when given a tracer)
+def createSliderWidget(slideBar, interactor, tracer=None):
     sliderWidget = vtk.vtkSliderWidget()
     sliderWidget.SetInteractor(interactor)
     sliderWidget.SetRepresentation(slideBar)
     sliderWidget.SetAnimationModeToAnimate()
     sliderWidget.SetEnabled(True)
+    if tracer is not None:
+        tracer.watchSlider(sliderWidget)
     return sliderWidget
 
 # Create Scalar Bar Method
@@ -131,26 +205,74 @@ def createScalarBarWidget(scalarBar, interactor):
 - Callback Methods
 """
 
+# Set Planes Method
+def setPlanes(lower):
+    global xPlane, yPlane, zPlane
+    xPlane.SetOrigin(lower[0], 0, 0)
+    yPlane.SetOrigin(0, lower[1], 0)
+    zPlane.SetOrigin(0, 0, lower[2])
+
+# Set Crop Box Method
+def setCrop(lower):
+    global crop
+    if crop is not None:
+        for axis in range(3):
+            crop.setLower(axis, lower[axis])
+
+# Configure Clip Method (on the worker thread holding its lock, from a
+# snapshot; the render clipping planes stay on the main thread)
+def configureClip(lower):
+    global renderClip
+    if not renderClip:
+        setPlanes(lower)
+    setCrop(lower)
+
+# Deliver Surface Method (on the main thread, swaps the surface in)
+def deliverSurface(lower, polyData):
+    global surface
+    surface.SetOutput(polyData)
+
+# Use Live Pipeline Method (a surface loaded from the mesh store is
+# extracted again once the clip box it was stored with changes)
+def useLivePipeline():
+    global storedMapper, clipped
+    if storedMapper is not None:
+        storedMapper.SetInputConnection(clipped.GetOutputPort())
+        storedMapper = None
+
+# Move Clip Method (submits a snapshot when extracting in the background)
+def moveClip(axis, value):
+    global clipLower, worker, renderClip, crop
+    clipLower[axis] = value
+    if worker is None:
+        if crop is not None or not renderClip:
+            useLivePipeline()
+        setPlanes(clipLower)
+        setCrop(clipLower)
+        return
+    if renderClip:
+        with worker.lock:
+            setPlanes(clipLower)
+    if crop is not None or not renderClip:
+        worker.submit(tuple(clipLower))
+
 # X Plane Value Slider Bar Callback Method
 def vtkXSlideBarCallback(obj, event):
-    global xPlane
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
-    xPlane.SetOrigin(value, 0, 0)
+    moveClip(0, value)
     
 # Y Plane Value Slider Bar Callback Method
 def vtkYSlideBarCallback(obj, event):
-    global yPlane
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
-    yPlane.SetOrigin(0, value, 0)
+    moveClip(1, value)
 
 # Z Plane Value Slider Bar Callback Method
 def vtkZSlideBarCallback(obj, event):
-    global zPlane
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
-    zPlane.SetOrigin(0, 0, value)
+    moveClip(2, value)
 
 
 """
@@ -158,22 +280,38 @@ def vtkZSlideBarCallback(obj, event):
 """
 
 def main():
-    global xPlane, yPlane, zPlane
+    global crop, clipLower, renderClip, xPlane, yPlane, zPlane, surface, worker, clipped, storedMapper
+    
+    (data_file, grad_file, isov_file, cmap_file, clip, span, crop, render_clip, 
+     grad_cache, fast_probe, backend, threads, mmap, bricks, 
+     brick_size, profile, profile_overlay, latency_log, fps, lod, 
+     background, mesh_cache_mb) = get_program_parameters()
+    
+    # Pipeline Profiler (does nothing unless profiling)
+    profiler = PipelineProfiler(profile, profile_overlay)
     
-    data_file, grad_file, isov_file, cmap_file, clip = get_program_parameters()
+    # Slider Latency Tracer
+    tracer = LatencyTracer(latency_log)
     
-    # Load Data
-    dataReader = vtk.vtkXMLImageDataReader()
-    dataReader.SetFileName(data_file)
-    dataReader.Update()
+    # Open Data (memory mapped with --mmap)
+    dataReader = openVolume(data_file, mmap)
     
-    #Load Gradient Magnitude
-    gradReader = vtk.vtkXMLImageDataReader()
-    gradReader.SetFileName(grad_file)
-    gradReader.Update()
+    #Open Gradient Magnitude (computed from the data when no file is given)
+    with profiler.stage('open gradient'):
+        gradReader = openGradientMagnitude(dataReader, data_file, grad_file, 
+                                           grad_cache, mmap)
     
-    # Get Min and Max Gradient Values
-    range_ = gradReader.GetOutput().GetScalarRange()
+    # Volume Metadata (sidecar file, the volumes are only read here when they
+    # have to be measured on the first load)
+    meta = loadMetadata(data_file, lambda: readVolume(dataReader))
+    
+    # Get Min and Max Gradient Values (computed gradient kept with the data)
+    if grad_file is None:
+        gradMeta = loadMetadata(data_file, lambda: readVolume(gradReader), 
+                                'gradient')
+    else:
+        gradMeta = loadMetadata(grad_file, lambda: readVolume(gradReader))
+    range_ = gradMeta['range']
     min_grad = range_[0]
     max_grad = range_[1]
     
@@ -195,30 +333,79 @@ def main():
         xVal, yVal, zVal = 0, 0, 0
     else:
         xVal, yVal, zVal = clip[0], clip[1], clip[2]
+    clipLower = [xVal, yVal, zVal]
+    renderClip = render_clip
     
-    # Get Bounds of Input Data Actor
-    m = vtk.vtkDataSetMapper()
-    m.SetInputConnection(dataReader.GetOutputPort())
-    
-    a = vtk.vtkActor()
-    a.SetMapper(m)
-    aBo = a.GetBounds()
+    # Get Bounds of Input Data (from the metadata)
+    aBo = meta['bounds']
     xMax, yMax, zMax = int(aBo[1] + 1), int(aBo[3] + 1), int(aBo[5] + 1)    
     
-    # Generate Contours
-    contours = vtk.vtkContourFilter()
-    contours.SetInputConnection(dataReader.GetOutputPort())
+    # Load Data (after the colours are set up from the metadata)
+    with profiler.stage('read'):
+        readVolume(dataReader)
+    profiler.watch(dataReader, 'read')
+    with profiler.stage('read gradient'):
+        readVolume(gradReader)
+    profiler.watch(gradReader, 'read gradient')
+    
+    # Contouring Backend and Threads
+    configureThreads(threads)
+    timer = ContourTimer(backend)
+    
+    # Span Space Index (the brick pool skips inactive bricks itself, both
+    # take the brick ranges of the metadata)
+    if bricks:
+        span = False
+    index = None
+    if span:
+        index = buildSpanSpaceIndex(dataReader.GetOutput(), 
+                                    ranges=metadataBricks(meta, BRICK_SIZE))
+    
+    # Crop Volume to Clip Box
+    if crop:
+        crop = VolumeCrop((xVal, yVal, zVal))
+        volumePort = crop.addVolume(dataReader)
+    else:
+        crop = None
+        volumePort = dataReader.GetOutputPort()
+    
+    # Sample Gradient along Contour Edges (only for the computed gradient)
+    edgeProbe = fast_probe and grad_file is None
+    if fast_probe and grad_file is not None:
+        print("--fast-probe needs the gradient computed from the data, "
+              "probing grad_file instead")
+    
+    # Generate Contours (contoured and probed in bricks across a pool)
+    brickPool = None
+    if bricks:
+        ranges = metadataBricks(meta, brick_size)
+        brickPool = BrickPool(bricks, brick_size, 
+                              {tuple(meta['extent']): ranges})
+        contours = timer.watch(BrickContourFilter(brickPool, backend, 
+                                                  gradReader.GetOutput(), 
+                                                  edgeProbe))
+    else:
+        contours = timer.watch(createContourFilter(index, backend))
+    contours.SetInputConnection(volumePort)
     contours.ComputeNormalsOn()
+    if edgeProbe:
+        contours.ComputeGradientsOn()
+    profiler.watch(contours, 'contour')
+    tracer.watch(contours)
     
     i = 0
     for isoval in isovals:
         contours.SetValue(i, isoval)
         i = i + 1
     
-    # Apply Probe Filter
-    probe = vtk.vtkProbeFilter()
-    probe.SetInputConnection(contours.GetOutputPort())
-    probe.SetSourceConnection(gradReader.GetOutputPort())
+    # Apply Probe Filter (already probed in the brick pool)
+    if brickPool is not None:
+        probe = contours
+    else:
+        probe = createProbeFilter(edgeProbe)
+        probe.SetInputConnection(contours.GetOutputPort())
+        if not edgeProbe:
+            probe.SetSourceConnection(gradReader.GetOutputPort())
     
     # Define Planes Origins
     origins = vtk.vtkPoints()
@@ -262,11 +449,41 @@ def main():
     zClipper.SetClipFunction(zPlane)
     zClipper.SetInputConnection(yClipper.GetOutputPort())
     
-    # Create Mapper and Actor
+    # Persistent Mesh Store (a configuration seen before is loaded; the clip
+    # corner only keys meshes that are cropped or clipped on the CPU)
+    store = MeshStore(grad_cache, mesh_cache_mb)
+    key, mesh = None, None
+    if store.enabled:
+        clipCorner = clipLower if crop or not render_clip else None
+        with profiler.stage('hash'):
+            key = store.key(store.contentHash(data_file), 
+                            store.contentHash(grad_file), isovals, clipCorner, 
+                            bool(crop), render_clip, edgeProbe, backend)
+        with profiler.stage('load mesh'):
+            mesh = store.get(key)
+    
+    # Create Mapper and Actor (fed the worker's copies in the background, or
+    # the stored mesh until the clip box moves)
     mapper = vtk.vtkDataSetMapper()
-    mapper.SetInputConnection(zClipper.GetOutputPort())
+    clipped = probe if crop or render_clip else zClipper
+    worker = None
+    storedMapper = None
+    if background or mesh is not None:
+        surface = vtk.vtkTrivialProducer()
+        mapper.SetInputConnection(surface.GetOutputPort())
+    else:
+        mapper.SetInputConnection(clipped.GetOutputPort())
+    if mesh is not None:
+        surface.SetOutput(mesh)
+        storedMapper = None if background else mapper
     mapper.SetLookupTable(colorFunction)
     
+    # Clip with the Planes while Rendering
+    if render_clip:
+        mapper.AddClippingPlane(xPlane)
+        mapper.AddClippingPlane(yPlane)
+        mapper.AddClippingPlane(zPlane)
+    
     actor = vtk.vtkActor()
     actor.SetMapper(mapper)
     
@@ -277,7 +494,35 @@ def main():
     iren = vtk.vtkRenderWindowInteractor()
     iren.SetRenderWindow(renWin)
     
+    # Slider Interaction Scheduler (coalesces events to the frame rate)
+    scheduler = InteractionScheduler(iren, fps)
+    tracer.watchScheduler(scheduler)
+    
+    # Level of Detail Proxies while the View Moves (held to the frame rate)
+    levelOfDetail = LevelOfDetail(iren, fps) if lod else None
+    if levelOfDetail is not None:
+        levelOfDetail.add(actor)
+    
     ren.AddActor(actor)
+    if background or mesh is not None:
+        profiler.watchUpstream(clipped)
+    profiler.watchUpstream(mapper)
+    tracer.watchPipeline(mapper)
+    profiler.watchRenderer(ren)
+    tracer.watchWindow(renWin)
+    
+    # Extract and Store a Configuration not Seen Before
+    if mesh is None and store.enabled:
+        clipped.Update()
+        store.put(key, clipped.GetOutputDataObject(0))
+    
+    # Background Extraction Worker
+    if background:
+        worker = PipelineWorker(iren, clipped, configureClip, deliverSurface)
+        tracer.watchWorker(worker)
+        if mesh is None:
+            worker.update(tuple(clipLower))
+    
     ren.ResetCamera()
     ren.GetActiveCamera().Elevation(270)
     ren.GetActiveCamera().SetRoll(360)
@@ -289,18 +534,18 @@ def main():
     
     # X Plane Value Slider Bar
     xSlideBar = createSlideBar(0, xMax, xVal, 0.05, 0.25, 0.40, "X")
-    xSliderWidget = createSliderWidget(xSlideBar, iren)
-    xSliderWidget.AddObserver("InteractionEvent", vtkXSlideBarCallback)
+    xSliderWidget = createSliderWidget(xSlideBar, iren, tracer)
+    scheduler.observe(xSliderWidget, vtkXSlideBarCallback)
     
     # Y Plane Value Slider Bar
     ySlideBar = createSlideBar(0, yMax, yVal, 0.05, 0.25, 0.25, "Y")
-    ySliderWidget = createSliderWidget(ySlideBar, iren)
-    ySliderWidget.AddObserver("InteractionEvent", vtkYSlideBarCallback)
+    ySliderWidget = createSliderWidget(ySlideBar, iren, tracer)
+    scheduler.observe(ySliderWidget, vtkYSlideBarCallback)
     
     # Z Plane Value Slider Bar
     zSlideBar = createSlideBar(0, zMax, zVal, 0.05, 0.25, 0.1, "Z")
-    zSliderWidget = createSliderWidget(zSlideBar, iren)
-    zSliderWidget.AddObserver("InteractionEvent", vtkZSlideBarCallback)
+    zSliderWidget = createSliderWidget(zSlideBar, iren, tracer)
+    scheduler.observe(zSliderWidget, vtkZSlideBarCallback)
     
     # Gradient Magnitude Scalar Bar
     scalarBar = createScalarBar(mapper, "Gradient Magnitude", 6)
@@ -311,6 +556,28 @@ def main():
     iren.Initialize()
     renWin.Render()
     iren.Start()
+    
+    if worker is not None:
+        worker.close()
+        worker.printStats()
+    
+    if brickPool is not None:
+        brickPool.close()
+    
+    profiler.dump()
+    
+    scheduler.printStats()
+    
+    tracer.printStats()
+    tracer.dump()
+    
+    timer.printStats()
+    
+    store.printStats()
+    
+    if levelOfDetail is not None:
+        levelOfDetail.close()
+        levelOfDetail.printStats()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Gradient magnitude volume computed from the data volume.
+
+Replaces the separate gradient magnitude vti file: the magnitude is
+computed with the multithreaded vtkImageGradientMagnitude filter and cached
+on disk keyed by a hash of the data file contents, so it is only computed
+the first time a dataset is opened. The hash itself is memoized by file
+path, size and modification time, so later launches do not read the data
+file to find the cached gradient.
+"""
+
+import hashlib
+import json
+import os
+
+import vtk
+
+from isommap import openVolume, writeMappableVolume
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'isosurface')
+
+
+"""
+- Cache Methods
+"""
+
+# Hash File Contents Method
+def fileHash(fileName, blockSize=1 << 22):
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as fp:
+        block = fp.read(blockSize)
+        while block:
+            digest.update(block)
+            block = fp.read(blockSize)
+    return digest.hexdigest()
+
+# Content Hash Method (memoized per path, size and modification time)
+def contentHash(fileName, cacheDir=None):
+    if cacheDir is None:
+        cacheDir = CACHE_DIR
+    stat = os.stat(fileName)
+    entry = [stat.st_size, stat.st_mtime_ns]
+    hashesFile = os.path.join(cacheDir, 'hashes.json')
+    try:
+        with open(hashesFile) as fp:
+            hashes = json.load(fp)
+    except (OSError, ValueError):
+        hashes = dict()
+    name = os.path.abspath(fileName)
+    if name in hashes and hashes[name][:2] == entry:
+        return hashes[name][2]
+    digest = fileHash(fileName)
+    hashes[name] = entry + [digest]
+    partFile = hashesFile + f".{os.getpid()}.part"
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        with open(partFile, 'w') as fp:
+            json.dump(hashes, fp)
+        os.replace(partFile, hashesFile)
+    except OSError:
+        if os.path.exists(partFile):
+            os.remove(partFile)
+    return digest
+
+# Get Gradient Cache File Method
+def gradientCacheFile(dataFile, cacheDir=None):
+    if cacheDir is None:
+        cacheDir = CACHE_DIR
+    digest = contentHash(dataFile, cacheDir)
+    return os.path.join(cacheDir, f"grad-{digest}.vti")
+
+
+"""
+- Gradient Methods
+"""
+
+# Compute Gradient Magnitude Method (float output, all threads)
+def computeGradientMagnitude(dataReader):
+    cast = vtk.vtkImageCast()
+    cast.SetInputConnection(dataReader.GetOutputPort())
+    cast.SetOutputScalarTypeToFloat()
+
+    gradient = vtk.vtkImageGradientMagnitude()
+    gradient.SetInputConnection(cast.GetOutputPort())
+    gradient.SetDimensionality(3)
+    gradient.HandleBoundariesOn()
+    gradient.Update()
+    return gradient
+
+# Open Gradient Magnitude Method (opens the file or the cache without
+# reading it, else computes it)
+def openGradientMagnitude(dataReader, dataFile, gradFile=None, cacheDir=None,
+                          mmap=False):
+    if gradFile is None:
+        gradFile = gradientCacheFile(dataFile, cacheDir)
+        if not os.path.exists(gradFile):
+            gradient = computeGradientMagnitude(dataReader)
+            os.makedirs(os.path.dirname(gradFile), exist_ok=True)
+            partFile = gradFile + ".part"
+            if writeMappableVolume(gradient.GetOutputPort(), partFile):
+                os.replace(partFile, gradFile)
+            return gradient
+
+    return openVolume(gradFile, mmap)
+
+# Load Gradient Magnitude Method (reads the file or the cache, else computes)
+def loadGradientMagnitude(dataReader, dataFile, gradFile=None, cacheDir=None,
+                          mmap=False):
+    gradReader = openGradientMagnitude(dataReader, dataFile, gradFile,
+                                       cacheDir, mmap)
+    gradReader.Update()
+    return gradReader
\ No newline at end of file
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Interaction to frame latency of the slider widgets.
+
+Every InteractionEvent of a traced slider opens an event that is closed
+when the next frame has been rendered; events arriving before that frame
+are folded into the open one, which keeps the time of the first. Each
+closed event is split into the draw time (the render minus the pipeline
+executions it triggered) and the update time (everything else: the slider
+callback and every pipeline execution until the frame is done). With a
+background worker the event stays open until the worker has delivered its
+surface, so it is closed by the frame that shows it rather than by the
+first frame after the slider moved. The execution observers also fire on
+the worker thread, so their state is kept under the tracer's lock and only
+executions on the rendering thread count towards the frame. The latency
+percentiles and a histogram are printed on exit, and the per-event records
+can be written to a CSV file.
+"""
+
+import csv
+import threading
+import time
+
+import numpy as np
+
+from isoprofile import upstreamAlgorithms
+
+
+FIELDS = ('slider', 'value', 'time_s', 'events', 'total_ms', 'update_ms',
+          'draw_ms')
+BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+"""
+- Latency Tracer Class
+"""
+
+class LatencyTracer:
+
+    # Constructor Method (logFile is the optional per-event CSV file)
+    def __init__(self, logFile=None):
+        self.logFile = logFile
+        self.records = list()
+        self.sliders = dict()
+        self.starts = dict()
+        self.pending = None
+        self.renderStart = None
+        self.renderThread = None
+        self.renderPipeline = 0.0
+        self.lock = threading.Lock()
+        self.scheduler = None
+        self.worker = None
+        self.created = time.perf_counter()
+
+    # Watch Slider Method (ahead of the slider callbacks)
+    def watchSlider(self, sliderWidget):
+        name = sliderWidget.GetRepresentation().GetTitleText()
+        self.sliders[sliderWidget.GetAddressAsString('vtkObject')] = name
+        sliderWidget.AddObserver("InteractionEvent", self.interaction, 1.0)
+        return sliderWidget
+
+    # Watch Algorithm Method (its executions count as pipeline update)
+    def watch(self, algorithm):
+        address = algorithm.GetAddressAsString('vtkObject')
+        if address not in self.starts:
+            self.starts[address] = None
+            algorithm.AddObserver("StartEvent", self.start)
+            algorithm.AddObserver("EndEvent", self.end)
+        return algorithm
+
+    # Watch Pipeline Method (the algorithm and everything feeding it)
+    def watchPipeline(self, algorithm):
+        for upstream in upstreamAlgorithms(algorithm):
+            self.watch(upstream)
+
+    # Watch Render Window Method (closes the open event after each frame)
+    def watchWindow(self, renderWindow):
+        renderWindow.AddObserver("StartEvent", self.renderBegin)
+        renderWindow.AddObserver("EndEvent", self.renderEnd)
+
+    # Watch Scheduler Method (frames drawn while its updates are still
+    # pending only redraw the sliders and do not close the open event)
+    def watchScheduler(self, scheduler):
+        self.scheduler = scheduler
+
+    # Watch Worker Method (frames drawn while its extraction is in flight
+    # still show the previous surface and do not close the open event)
+    def watchWorker(self, worker):
+        self.worker = worker
+
+    # Interaction Event Callback Method
+    def interaction(self, obj, event):
+        name = self.sliders.get(obj.GetAddressAsString('vtkObject'))
+        value = obj.GetRepresentation().GetValue()
+        if self.pending is None:
+            self.pending = {'slider': name, 'value': value, 'events': 1,
+                            'start': time.perf_counter()}
+        else:
+            self.pending.update(slider=name, value=value)
+            self.pending['events'] += 1
+
+    # Start Event Callback Method (also called on the worker thread)
+    def start(self, obj, event):
+        address = obj.GetAddressAsString('vtkObject')
+        with self.lock:
+            self.starts[address] = time.perf_counter()
+
+    # End Event Callback Method (executions on another thread than the one
+    # rendering are not part of the frame)
+    def end(self, obj, event):
+        address = obj.GetAddressAsString('vtkObject')
+        with self.lock:
+            start = self.starts.get(address)
+            if start is None:
+                return
+            self.starts[address] = None
+            if (self.renderStart is not None
+                    and self.renderThread == threading.get_ident()):
+                self.renderPipeline += time.perf_counter() - start
+
+    # Render Start Callback Method
+    def renderBegin(self, obj, event):
+        with self.lock:
+            self.renderStart = time.perf_counter()
+            self.renderThread = threading.get_ident()
+            self.renderPipeline = 0.0
+
+    # Render End Callback Method
+    def renderEnd(self, obj, event):
+        now = time.perf_counter()
+        deferred = (self.scheduler is not None and self.scheduler.pending
+                    or self.worker is not None and not self.worker.idle())
+        with self.lock:
+            renderStart, self.renderStart = self.renderStart, None
+            renderPipeline = self.renderPipeline
+        if (self.pending is not None and renderStart is not None 
+                and not deferred):
+            start = self.pending['start']
+            total = now - start
+            draw = now - renderStart - renderPipeline
+            self.records.append({'slider': self.pending['slider'],
+                                 'value': self.pending['value'],
+                                 'time_s': start - self.created,
+                                 'events': self.pending['events'],
+                                 'total_ms': 1000 * total,
+                                 'update_ms': 1000 * (total - draw),
+                                 'draw_ms': 1000 * draw})
+            self.pending = None
+
+    # Get Statistics Method (for the records of one slider, or all)
+    def stats(self, slider=None):
+        records = [record for record in self.records
+                   if slider is None or record['slider'] == slider]
+        if not records:
+            return None
+        total = np.array([record['total_ms'] for record in records])
+        p50, p95, p99 = np.percentile(total, (50, 95, 99))
+        return {'events': len(records),
+                'coalesced': sum(record['events'] for record in records),
+                'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                'max_ms': total.max(),
+                'update_ms': np.mean([r['update_ms'] for r in records]),
+                'draw_ms': np.mean([r['draw_ms'] for r in records]),
+                'histogram': np.histogram(
+                    total, (0,) + BUCKETS_MS + (np.inf,))[0]}
+
+    # Print Statistics Method
+    def printStats(self, name="Slider latency"):
+        s = self.stats()
+        if s is None:
+            print(f"{name}: no slider events")
+            return
+        print(f"{name}: {s['events']} frames for {s['coalesced']} events, "
+              f"p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms, "
+              f"p99 {s['p99_ms']:.1f} ms, max {s['max_ms']:.1f} ms "
+              f"(update {s['update_ms']:.1f} ms + "
+              f"draw {s['draw_ms']:.1f} ms mean)")
+        for slider in dict.fromkeys(r['slider'] for r in self.records):
+            t = self.stats(slider)
+            print(f"  {slider:>24}: {t['events']:5d} frames, "
+                  f"p50 {t['p50_ms']:.1f} ms, p95 {t['p95_ms']:.1f} ms, "
+                  f"p99 {t['p99_ms']:.1f} ms (update {t['update_ms']:.1f} "
+                  f"+ draw {t['draw_ms']:.1f} ms)")
+        width = max(s['histogram'].max(), 1)
+        lows = (0,) + BUCKETS_MS
+        highs = BUCKETS_MS + (None,)
+        for low, high, count in zip(lows, highs, s['histogram']):
+            label = f"{low}-{high} ms" if high else f">= {low} ms"
+            bar = '#' * round(40 * count / width)
+            print(f"  {label:>14} {count:6d} {bar}")
+
+    # Dump Method (per-event CSV records)
+    def dump(self):
+        if self.logFile is None:
+            return
+        with open(self.logFile, 'w', newline='') as fp:
+            writer = csv.DictWriter(fp, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+        print(f"Slider latency: {len(self.records)} records written to "
+              f"{self.logFile}")
\ No newline at end of file
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Single pass multi-layer isosurface extraction.
+
+Every distinct isovalue of a parameters file is contoured by one contour
+filter (one pass over the volume), the combined surface is probed against
+the gradient volume once and clipped by the X/Y/Z planes once, and it is
+then split into one surface per isovalue for the per-layer gradient bands.
+Each layer keeps only the points its own polygons use.
+"""
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+from isobrick import BrickContourFilter
+from isocontour import createContourFilter
+from isocrop import compactPolygons
+from isoprobe import createProbeFilter
+
+
+TAG_NAME = 'Isovalue'
+
+
+"""
+- Layer Algorithm Classes
+"""
+
+class IsovalueTagger(VTKPythonAlgorithmBase):
+
+    # Constructor Method
+    def __init__(self):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkPolyData',
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+
+    # Request Data Method (keeps the contour scalars under TAG_NAME)
+    def RequestData(self, request, inInfo, outInfo):
+        inp = vtk.vtkPolyData.GetData(inInfo[0])
+        output = vtk.vtkPolyData.GetData(outInfo)
+        output.ShallowCopy(inp)
+        scalars = inp.GetPointData().GetScalars()
+        if scalars is not None:
+            tag = scalars.NewInstance()
+            tag.ShallowCopy(scalars)
+            tag.SetName(TAG_NAME)
+            output.GetPointData().RemoveArray(scalars.GetName())
+            output.GetPointData().AddArray(tag)
+        return 1
+
+
+class LayerSplitter(VTKPythonAlgorithmBase):
+
+    # Constructor Method (one output port per isovalue)
+    def __init__(self, isovals):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkPolyData',
+                                        nOutputPorts=len(isovals),
+                                        outputType='vtkPolyData')
+        self.isovals = np.array(sorted(isovals), dtype=np.float64)
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        inp = vtk.vtkPolyData.GetData(inInfo[0])
+        polys = inp.GetPolys()
+        offsets = vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int64)
+        connectivity = vtk_to_numpy(polys.GetConnectivityArray())
+        sizes = np.diff(offsets)
+
+        # Layer of each cell from the isovalue of its first point (nearest
+        # isovalue, since clipping interpolates the tag on new points)
+        tag = inp.GetPointData().GetArray(TAG_NAME)
+        if tag is not None and sizes.size > 0:
+            midpoints = np.diff(self.isovals) / 2.0 + self.isovals[:-1]
+            cellTags = vtk_to_numpy(tag)[connectivity[offsets[:-1]]]
+            cellLayers = np.searchsorted(midpoints, cellTags)
+        else:
+            cellLayers = np.zeros(0, dtype=np.int64)
+
+        # Each layer with only the points of its polygons
+        for i in range(len(self.isovals)):
+            output = vtk.vtkPolyData.GetData(outInfo, i)
+            output.Initialize()
+            if inp.GetNumberOfPoints() == 0:
+                continue
+            selected = cellLayers == i
+            output.ShallowCopy(compactPolygons(
+                inp, sizes[selected], connectivity[np.repeat(selected, sizes)],
+                exclude=(TAG_NAME, 'Normals')))
+        return 1
+
+
+"""
+- Multi-Layer Extractor Class
+"""
+
+class MultiLayerExtractor:
+
+    # Constructor Method (planes are applied once to the combined surface,
+    # bricks is an optional BrickPool contouring across processes)
+    def __init__(self, volumePort, gradPort, isovals, index=None, planes=(),
+                 edgeProbe=False, backend='contour', bricks=None):
+        self.isovals = sorted(set(isovals))
+
+        if bricks is not None:
+            self.contours = BrickContourFilter(bricks, backend)
+        else:
+            self.contours = createContourFilter(index, backend)
+        self.contours.SetInputConnection(volumePort)
+        self.contours.ComputeNormalsOn()
+        if edgeProbe:
+            self.contours.ComputeGradientsOn()
+        for i, isoval in enumerate(self.isovals):
+            self.contours.SetValue(i, isoval)
+
+        self.tagger = IsovalueTagger()
+        self.tagger.SetInputConnection(self.contours.GetOutputPort())
+
+        self.probe = createProbeFilter(edgeProbe)
+        self.probe.SetInputConnection(self.tagger.GetOutputPort())
+        if not edgeProbe:
+            self.probe.SetSourceConnection(gradPort)
+        self.probe.PassPointArraysOn()
+
+        port = self.probe.GetOutputPort()
+        self.clippers = list()
+        for plane in planes:
+            clipper = vtk.vtkClipPolyData()
+            clipper.SetClipFunction(plane)
+            clipper.SetInputConnection(port)
+            port = clipper.GetOutputPort()
+            self.clippers.append(clipper)
+
+        self.splitter = LayerSplitter(self.isovals)
+        self.splitter.SetInputConnection(port)
+
+    # Get Layer Output Port Method
+    def outputPort(self, isoval):
+        return self.splitter.GetOutputPort(self.isovals.index(isoval))
\ No newline at end of file
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Decimated level of detail proxies of the rendered surfaces.
+
+A surface of tens of millions of triangles drops the frame rate to a few
+frames per second while the camera rotates. Once a surface has been drawn
+at full resolution with the view still, and drawing everything at full
+resolution misses the target frame rate, a LOD thread builds decimated
+proxies of it: a cascade of quadric clusterings on halving grids, keeping
+the input points and their point data (scalars and normals) so the proxies
+are coloured like the surface. While the camera or a widget moves (the
+render window is asked for the interactive update rate), the actors draw
+the proxies instead. The triangle budget of a frame comes from the drawing
+rate measured on the full resolution frames and the target frame rate. It
+is shared across the surfaces in proportion to their weight: a surface of
+weight 0.25 is decimated four times as hard as one of weight 1. A surface
+whose pipeline output changed since its proxies were built (an isovalue or
+clip slider being dragged) is drawn at full resolution until its new
+proxies are ready. The full resolution surfaces are swapped back in for the
+first frame drawn once the interaction stops.
+"""
+
+import math
+import threading
+import time
+
+import vtk
+
+
+"""
+- Level of Detail Class
+"""
+
+class LevelOfDetail:
+
+    # Constructor Method (fps of 0 disables the proxies, divisions caps the
+    # clustering grid of the finest proxy, minTriangles is the coarsest)
+    def __init__(self, interactor, fps=30.0, divisions=1024,
+                 minTriangles=1000):
+        self.interactor = interactor
+        self.window = interactor.GetRenderWindow()
+        self.period = 1.0 / fps if fps else 0.0
+        self.divisions = divisions
+        self.minTriangles = minTriangles
+        self.surfaces = list()
+        self.rate = None
+        self.drawn = 0
+        self.drawStart = None
+        self.queue = list()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.built = 0
+        self.busy = 0.0
+        self.proxyFrames = 0
+        self.frames = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        # After the other render observers (the latency tracer counts the
+        # pipeline updates run here)
+        self.window.AddObserver("StartEvent", self.renderBegin, -1.0)
+        self.window.AddObserver("EndEvent", self.renderEnd, -1.0)
+
+    # Add Actor Method (weight below 1 allows more aggressive decimation)
+    def add(self, actor, weight=1.0):
+        mapper = actor.GetMapper()
+        proxyMapper = vtk.vtkPolyDataMapper()
+        self.surfaces.append({'actor': actor, 'mapper': mapper,
+                              'proxyMapper': proxyMapper,
+                              'weight': max(weight, 1e-3),
+                              'source': None, 'triangles': 0,
+                              'generation': 0, 'requested': 0,
+                              'levels': list()})
+        return actor
+
+    # Update Input Method (full resolution surface, None unless polydata)
+    def updateInput(self, surface):
+        mapper = surface['mapper']
+        algorithm = mapper.GetInputAlgorithm()
+        if algorithm is not None:
+            algorithm.Update()
+        polyData = mapper.GetInputDataObject(0, 0)
+        if polyData is None or not polyData.IsA('vtkPolyData'):
+            return None
+        source = (polyData.GetAddressAsString('vtkObject'),
+                  polyData.GetMTime())
+        if source != surface['source']:
+            with self.condition:
+                surface['source'] = source
+                surface['triangles'] = polyData.GetNumberOfCells()
+                surface['generation'] += 1
+                surface['levels'] = list()
+        return polyData
+
+    # Select Proxies Method (finest levels within the frame budget)
+    def select(self):
+        visible = [surface for surface in self.surfaces
+                   if surface['actor'].GetVisibility()]
+        total = sum(s['triangles'] for s in visible)
+        budget = self.rate * self.period
+        if total <= budget:
+            return {}
+
+        # Share of each surface kept, min(1, k * weight), summing to budget
+        def kept(k):
+            return sum(s['triangles'] * min(1.0, k * s['weight'])
+                       for s in visible)
+        low, high = 0.0, 1.0 / min(s['weight'] for s in visible)
+        for _ in range(30):
+            k = (low + high) / 2
+            low, high = (k, high) if kept(k) < budget else (low, k)
+
+        proxies = dict()
+        for i, surface in enumerate(self.surfaces):
+            with self.condition:
+                levels = surface['levels']
+            if not surface['actor'].GetVisibility() or not levels:
+                continue
+            target = surface['triangles'] * min(1.0, low * surface['weight'])
+            fitting = [l for l in levels if l.GetNumberOfCells() <= target]
+            proxies[i] = fitting[0] if fitting else levels[-1]
+        return proxies
+
+    # Render Start Callback Method
+    def renderBegin(self, obj, event):
+        interacting = (self.window.GetDesiredUpdateRate()
+                       > self.interactor.GetStillUpdateRate())
+        for surface in self.surfaces:
+            self.updateInput(surface)
+        proxies = dict()
+        if interacting and self.period and self.rate:
+            proxies = self.select()
+        self.drawn = 0
+        for i, surface in enumerate(self.surfaces):
+            actor = surface['actor']
+            if i in proxies:
+                proxyMapper = surface['proxyMapper']
+                proxyMapper.ShallowCopy(surface['mapper'])
+                proxyMapper.SetInputData(proxies[i])
+                if actor.GetMapper() is not proxyMapper:
+                    actor.SetMapper(proxyMapper)
+                triangles = proxies[i].GetNumberOfCells()
+            else:
+                if actor.GetMapper() is not surface['mapper']:
+                    actor.SetMapper(surface['mapper'])
+                triangles = surface['triangles']
+            if actor.GetVisibility():
+                self.drawn += triangles
+        self.frames += 1
+        self.proxyFrames += 1 if proxies else 0
+        self.drawStart = None if proxies else time.perf_counter()
+
+    # Render End Callback Method (measures the drawing rate of the full
+    # resolution frames, queues the proxies of their surfaces)
+    def renderEnd(self, obj, event):
+        if self.drawStart is None:
+            return
+        elapsed = time.perf_counter() - self.drawStart
+        self.drawStart = None
+        if self.drawn and elapsed > 0.0:
+            rate = self.drawn / elapsed
+            self.rate = rate if self.rate is None else 0.5 * (self.rate + rate)
+        interacting = (self.window.GetDesiredUpdateRate()
+                       > self.interactor.GetStillUpdateRate())
+        if interacting or not self.period or not self.rate:
+            return
+        total = sum(s['triangles'] for s in self.surfaces)
+        if total <= self.rate * self.period:
+            return
+        with self.condition:
+            for surface in self.surfaces:
+                if (surface['requested'] == surface['generation']
+                        or surface['triangles'] <= self.minTriangles):
+                    continue
+                surface['requested'] = surface['generation']
+                polyData = vtk.vtkPolyData()
+                polyData.ShallowCopy(
+                    surface['mapper'].GetInputDataObject(0, 0))
+                self.queue.append((surface, surface['generation'], polyData))
+            self.condition.notify()
+
+    # Build Levels Method (halving clustering grids, each level at most half
+    # the triangles of the one before, coarsest last)
+    def build(self, polyData):
+        levels = list()
+        source = polyData
+        side = math.sqrt(max(polyData.GetNumberOfCells(), 16) / 4)
+        divisions = min(self.divisions, 2 ** int(math.log2(side)))
+        while divisions >= 2:
+            clustering = vtk.vtkQuadricClustering()
+            clustering.SetInputData(source)
+            clustering.SetNumberOfDivisions(divisions, divisions, divisions)
+            clustering.UseInputPointsOn()
+            clustering.Update()
+            divisions //= 2
+            if (clustering.GetOutput().GetNumberOfCells()
+                    > source.GetNumberOfCells() // 2):
+                continue
+            interpolator = vtk.vtkPointInterpolator()
+            interpolator.SetInputConnection(clustering.GetOutputPort())
+            interpolator.SetSourceData(source)
+            interpolator.SetKernel(vtk.vtkVoronoiKernel())
+            interpolator.Update()
+            level = vtk.vtkPolyData()
+            level.ShallowCopy(interpolator.GetOutput())
+            levels.append(level)
+            source = level
+            if level.GetNumberOfCells() <= self.minTriangles:
+                break
+        return levels
+
+    # LOD Thread Method
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                surface, generation, polyData = self.queue.pop(0)
+                if generation != surface['generation']:
+                    continue
+            start = time.perf_counter()
+            levels = self.build(polyData)
+            with self.condition:
+                self.busy += time.perf_counter() - start
+                if generation == surface['generation']:
+                    surface['levels'] = levels
+                    self.built += 1
+
+    # Close Method (stops the LOD thread after its current surface)
+    def close(self):
+        with self.condition:
+            self.queue = list()
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    # Print Statistics Method
+    def printStats(self, name="Level of detail"):
+        if not self.period:
+            return
+        rate = 0.0 if self.rate is None else self.rate / 1e6
+        print(f"{name} ({1.0 / self.period:.0f} fps): {self.built} proxy "
+              f"sets built in {self.busy:.2f} s, {self.proxyFrames} / "
+              f"{self.frames} frames drawn with proxies, "
+              f"{rate:.1f} M triangles/s")
\ No newline at end of file
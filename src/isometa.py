@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Sidecar metadata of the volume files for instant startup.
+
+The scripts used to read the whole volume before showing anything, only to
+get its scalar range and bounds. The metadata of a volume (scalar range,
+bounds, dimensions, spacing, origin, a histogram and the scalar min/max of
+its bricks) is now computed once and kept in a json file next to it, or in
+the cache directory when its directory is not writable. The file size and
+modification time are recorded with it, so a changed volume is measured
+again. Derived volumes that are not files themselves (the computed gradient
+magnitude) are kept as further sections of the same file. With --mmap
+opening a volume only parses its header, so the sliders and colour transfer
+functions are set up without the scalars being read at all. The brick
+min/max are kept at the span space index brick size and merged up to the
+brick size of the span space index or the brick pool, which then skip the
+pass over the scalars that measures them.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from vtk.util.numpy_support import vtk_to_numpy
+
+from isograd import CACHE_DIR
+from isospan import BRICK_SIZE, reduceBricks
+
+
+VERSION = 2
+
+
+"""
+- Metadata Methods
+"""
+
+# Get Metadata Files Method (next to the volume, then in the cache)
+def metadataFiles(fileName, cacheDir=None):
+    if cacheDir is None:
+        cacheDir = CACHE_DIR
+    name = os.path.abspath(fileName)
+    digest = hashlib.sha256(name.encode()).hexdigest()
+    return [name + '.meta.json',
+            os.path.join(cacheDir, 'meta', f"meta-{digest}.json")]
+
+# Get File Stamp Method (invalidates the metadata of a changed file)
+def fileStamp(fileName):
+    stat = os.stat(fileName)
+    return [VERSION, stat.st_size, stat.st_mtime_ns]
+
+# Read Metadata Sections Method (empty when missing or out of date)
+def readSections(fileName, cacheDir=None):
+    stamp = fileStamp(fileName)
+    for metaFile in metadataFiles(fileName, cacheDir):
+        try:
+            with open(metaFile) as fp:
+                sections = json.load(fp)
+        except (OSError, ValueError):
+            continue
+        if sections.get('stamp') == stamp:
+            return sections
+    return {'stamp': stamp}
+
+# Read Metadata Method (None when missing or out of date)
+def readMetadata(fileName, section='volume', cacheDir=None):
+    return readSections(fileName, cacheDir).get(section)
+
+# Compute Metadata Method (of the active point scalars of an image)
+def computeMetadata(image, brickSize=BRICK_SIZE, bins=256):
+    nx, ny, nz = image.GetDimensions()
+    scalars = image.GetPointData().GetScalars()
+    points = vtk_to_numpy(scalars).reshape(nz, ny, nx)
+    range_ = [float(points.min()), float(points.max())]
+    counts, edges = np.histogram(points, bins, range_)
+    mins, maxs = points, points
+    for axis in (2, 1, 0):
+        mins = reduceBricks(mins, brickSize, axis, np.minimum)
+        maxs = reduceBricks(maxs, brickSize, axis, np.maximum)
+    return {'range': range_,
+            'bounds': list(image.GetBounds()),
+            'dimensions': [nx, ny, nz],
+            'spacing': list(image.GetSpacing()),
+            'origin': list(image.GetOrigin()),
+            'extent': list(image.GetExtent()),
+            'type': scalars.GetDataTypeAsString(),
+            'histogram': {'counts': counts.tolist(),
+                          'edges': edges.tolist()},
+            'bricks': {'size': brickSize,
+                       'shape': list(mins.shape),
+                       'mins': mins.ravel().tolist(),
+                       'maxs': maxs.ravel().tolist()}}
+
+# Get Metadata Brick Ranges Method (brick min/max merged up to brickSize,
+# z/y/x order, None unless it is a multiple of the stored brick size)
+def metadataBricks(metadata, brickSize):
+    bricks = metadata.get('bricks')
+    if bricks is None or brickSize % bricks['size'] != 0:
+        return None
+    factor = brickSize // bricks['size']
+    mins = np.array(bricks['mins']).reshape(bricks['shape'])
+    maxs = np.array(bricks['maxs']).reshape(bricks['shape'])
+    for axis in range(3):
+        starts = np.arange(0, mins.shape[axis], factor)
+        mins = np.minimum.reduceat(mins, starts, axis=axis)
+        maxs = np.maximum.reduceat(maxs, starts, axis=axis)
+    return mins, maxs
+
+# Write Metadata Method (first writable location, returns it or None)
+def writeMetadata(fileName, sections, cacheDir=None):
+    for metaFile in metadataFiles(fileName, cacheDir):
+        partFile = metaFile + f".{os.getpid()}.part"
+        try:
+            os.makedirs(os.path.dirname(metaFile), exist_ok=True)
+            with open(partFile, 'w') as fp:
+                json.dump(sections, fp)
+            os.replace(partFile, metaFile)
+            return metaFile
+        except OSError:
+            if os.path.exists(partFile):
+                os.remove(partFile)
+    return None
+
+# Load Metadata Method (getImage returns the image to measure and is only
+# called when the metadata is missing or out of date)
+def loadMetadata(fileName, getImage, section='volume', cacheDir=None):
+    sections = readSections(fileName, cacheDir)
+    if section not in sections:
+        sections[section] = computeMetadata(getImage())
+        writeMetadata(fileName, sections, cacheDir)
+    return sections[section]
+
+# Print Metadata Method (one line summary)
+def printMetadata(fileName, metadata):
+    dimensions = 'x'.join(str(n) for n in metadata['dimensions'])
+    spacing = ', '.join(f"{s:g}" for s in metadata['spacing'])
+    print(f"{fileName}: {dimensions} {metadata['type']} points, "
+          f"spacing ({spacing}), range [{metadata['range'][0]:g}, "
+          f"{metadata['range'][1]:g}]")
\ No newline at end of file
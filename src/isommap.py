@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Memory mapped loading of uncompressed vti volumes.
+
+A vti file written with raw appended data and no compressor stores every
+point array as a plain block after the XML header. Those blocks are mapped
+copy-on-write and wrapped as the image arrays without copying, so opening
+a volume only parses the header, pages are read when contouring touches
+them, and processes opening the same file share the page cache. Arrays
+stored in the other byte order than the machine's cannot be wrapped as they
+are, so they are swapped into memory when the volume is opened.
+
+Run as a script to convert a vti file to the mappable layout:
+
+    python isommap.py input.vti output.vti
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+
+DATA_TYPES = {'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2',
+              'Int32': 'i4', 'UInt32': 'u4', 'Int64': 'i8', 'UInt64': 'u8',
+              'Float32': 'f4', 'Float64': 'f8'}
+HEADER_TYPES = {'UInt32': 'u4', 'UInt64': 'u8'}
+
+
+"""
+- Mapping Methods
+"""
+
+# Read VTI Header Method (XML before the appended data and its offset)
+def readHeader(fileName, blockSize=1 << 16):
+    with open(fileName, 'rb') as fp:
+        data = b''
+        block = fp.read(blockSize)
+        while block:
+            data += block
+            start = data.find(b'<AppendedData')
+            if start >= 0:
+                marker = data.find(b'_', data.find(b'>', start))
+                if marker >= 0:
+                    tag = data[start:data.find(b'>', start) + 1].decode()
+                    root = ET.fromstring(data[:start].decode() + '</VTKFile>')
+                    return root, tag, marker + 1
+            block = fp.read(blockSize)
+    return None, None, None
+
+# Map Volume Method (None when the file is not mappable)
+def mapVolume(fileName):
+    root, tag, base = readHeader(fileName)
+    if (root is None or root.get('type') != 'ImageData'
+            or root.get('compressor') or 'encoding="raw"' not in tag):
+        return None
+    order = '<' if root.get('byte_order') == 'LittleEndian' else '>'
+    headerType = np.dtype(order + HEADER_TYPES[root.get('header_type',
+                                                        'UInt32')])
+
+    imageData = root.find('ImageData')
+    pieces = imageData.findall('Piece')
+    if len(pieces) != 1:
+        return None
+    extent = [int(v) for v in pieces[0].get('Extent').split()]
+    points = ((extent[1] - extent[0] + 1) * (extent[3] - extent[2] + 1)
+              * (extent[5] - extent[4] + 1))
+
+    image = vtk.vtkImageData()
+    image.SetExtent(extent)
+    image.SetOrigin([float(v) for v in imageData.get('Origin').split()])
+    image.SetSpacing([float(v) for v in imageData.get('Spacing').split()])
+
+    pointData = pieces[0].find('PointData')
+    for array in pointData.findall('DataArray'):
+        if (array.get('format') != 'appended'
+                or array.get('type') not in DATA_TYPES):
+            return None
+        components = int(array.get('NumberOfComponents', 1))
+        offset = base + int(array.get('offset'))
+        dtype = np.dtype(order + DATA_TYPES[array.get('type')])
+        values = np.memmap(fileName, dtype=dtype, mode='c',
+                           offset=offset + headerType.itemsize,
+                           shape=(points, components) if components > 1
+                           else (points,))
+        if not dtype.isnative:
+            values = values.astype(dtype.newbyteorder('='))
+        scalars = numpy_to_vtk(values, deep=False)
+        scalars.SetName(array.get('Name'))
+        image.GetPointData().AddArray(scalars)
+    name = pointData.get('Scalars')
+    if name is None and image.GetPointData().GetNumberOfArrays() > 0:
+        name = image.GetPointData().GetArrayName(0)
+    image.GetPointData().SetActiveScalars(name)
+    return image
+
+# Write Mappable Volume Method (raw appended data, no compressor)
+def writeMappableVolume(port, fileName):
+    writer = vtk.vtkXMLImageDataWriter()
+    writer.SetFileName(fileName)
+    writer.SetInputConnection(port)
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    writer.SetCompressorTypeToNone()
+    return writer.Write()
+
+
+"""
+- Mapped Volume Reader Class
+"""
+
+class MappedVolumeReader(VTKPythonAlgorithmBase):
+
+    # Constructor Method
+    def __init__(self, image):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=0,
+                                        nOutputPorts=1,
+                                        outputType='vtkImageData')
+        self.image = image
+
+    # Get Output Method
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+    # Request Information Method
+    def RequestInformation(self, request, inInfo, outInfo):
+        info = outInfo.GetInformationObject(0)
+        info.Set(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT(),
+                 self.image.GetExtent(), 6)
+        info.Set(vtk.vtkDataObject.ORIGIN(), self.image.GetOrigin(), 3)
+        info.Set(vtk.vtkDataObject.SPACING(), self.image.GetSpacing(), 3)
+        return 1
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        output = vtk.vtkImageData.GetData(outInfo)
+        output.ShallowCopy(self.image)
+        return 1
+
+
+"""
+- Loader Methods
+"""
+
+# Open Volume Method (maps the file when asked and possible, reads nothing)
+def openVolume(fileName, mmap=False):
+    if mmap:
+        image = mapVolume(fileName)
+        if image is not None:
+            return MappedVolumeReader(image)
+        print(f"{fileName} is not an uncompressed appended vti, reading it "
+              f"(convert it with isommap.py)")
+    reader = vtk.vtkXMLImageDataReader()
+    reader.SetFileName(fileName)
+    return reader
+
+# Read Volume Method (reads an opened volume, returns its image)
+def readVolume(reader):
+    reader.Update()
+    return reader.GetOutput()
+
+# Load Volume Method
+def loadVolume(fileName, mmap=False):
+    reader = openVolume(fileName, mmap)
+    reader.Update()
+    return reader
+
+
+if __name__ == "__main__":
+    import sys
+    reader = loadVolume(sys.argv[1])
+    if not writeMappableVolume(reader.GetOutputPort(), sys.argv[2] + ".part"):
+        sys.exit(1)
+    os.replace(sys.argv[2] + ".part", sys.argv[2])
\ No newline at end of file
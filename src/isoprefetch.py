@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Speculative prefetch of the isovalues next to the slider position.
+
+After every extraction the prefetcher predicts the next few isovalues the
+slider will reach: steps at the stride of the recent slider motion (rounded
+to the slider's step granularity), ahead in the direction of that motion,
+plus one step behind. Those not cached yet are contoured in idle time on a
+prefetch thread, with a private contour pipeline on a shallow copy of the
+volume, so the main pipeline and the prefetch thread share no data object
+or span space index, only the scalars both of them read. The results are
+kept within their own memory budget, least recently prefetched first out,
+until a cache miss takes them over into the isosurface cache. A new
+prediction replaces the queue of the previous one, and an isovalue whose
+extraction raises is reported and skipped. The prefetch hit rate is the
+share of isosurface cache misses that the prefetch served.
+"""
+
+import threading
+import traceback
+
+import vtk
+
+from isocache import IsosurfaceCache, copyOutput
+from isocrop import VolumeCrop
+
+
+"""
+- Isovalue Prefetcher Class
+"""
+
+class IsovaluePrefetcher:
+
+    # Constructor Method (contours is an unconnected contour filter with no
+    # span space index in common with the main pipeline, keyFor builds the
+    # cache key of an isovalue and crop lower corner, step is the slider's
+    # step granularity, budget in MiB)
+    def __init__(self, image, contours, keyFor, range_, steps=4, step=1,
+                 budget=128, lower=None):
+        self.keyFor = keyFor
+        self.range = range_
+        self.steps = steps
+        self.step = step
+        self.cache = IsosurfaceCache(budget)
+        self.history = list()
+        self.direction = 1
+        self.queue = list()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.prefetched = 0
+        self.volume = vtk.vtkImageData()
+        self.volume.ShallowCopy(image)
+        self.producer = vtk.vtkTrivialProducer()
+        self.producer.SetOutput(self.volume)
+        if lower is None:
+            self.crop = None
+            port = self.producer.GetOutputPort()
+        else:
+            self.crop = VolumeCrop(lower)
+            port = self.crop.addVolume(self.producer)
+        self.contours = contours
+        self.contours.SetInputConnection(port)
+        self.contours.ComputeNormalsOn()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # Get Stride Method (median of the recent slider moves, in steps)
+    def stride(self):
+        moves = sorted(abs(b - a) for a, b in zip(self.history,
+                                                  self.history[1:]) if b != a)
+        if not moves:
+            return self.step
+        return max(self.step,
+                   self.step * round(moves[len(moves) // 2] / self.step))
+
+    # Predict Method (queues the neighbours of the isovalue shown)
+    def predict(self, value, lower=None, cached=()):
+        if not self.history or value != self.history[-1]:
+            if self.history:
+                self.direction = 1 if value > self.history[-1] else -1
+            self.history = (self.history + [value])[-5:]
+        stride = self.stride()
+        ahead = [value + self.direction * stride * k
+                 for k in range(1, self.steps + 1)]
+        behind = [value - self.direction * stride]
+        queue = list()
+        for candidate in ahead + behind:
+            if not self.range[0] <= candidate <= self.range[1]:
+                continue
+            key = self.keyFor(candidate, lower)
+            if key not in cached:
+                queue.append((candidate, lower, key))
+        with self.condition:
+            self.queue = queue
+            self.condition.notify()
+
+    # Contains Method (prefetched and not taken yet)
+    def __contains__(self, key):
+        with self.condition:
+            return key in self.cache
+
+    # Take Method (moves a prefetched surface out, None when not prefetched)
+    def take(self, key):
+        with self.condition:
+            polyData = self.cache.get(key)
+            if polyData is not None:
+                self.cache.pop(key)
+            return polyData
+
+    # Extract Method (contours an isovalue with the private pipeline)
+    def extract(self, value, lower):
+        if self.crop is not None:
+            for axis in range(3):
+                self.crop.setLower(axis, lower[axis])
+        self.contours.SetValue(0, value)
+        self.contours.Update()
+        return copyOutput(self.contours)
+
+    # Prefetch Thread Method
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                value, lower, key = self.queue.pop(0)
+                if key in self.cache:
+                    continue
+            try:
+                polyData = self.extract(value, lower)
+            except Exception:
+                print(f"Prefetch of isovalue {value} failed:")
+                traceback.print_exc()
+                continue
+            with self.condition:
+                self.cache.put(key, polyData)
+                self.prefetched += 1
+
+    # Close Method (stops the prefetch thread after its current surface)
+    def close(self):
+        with self.condition:
+            self.queue = list()
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    # Get Statistics Method
+    def stats(self):
+        s = self.cache.stats()
+        return {'prefetched': self.prefetched,
+                'used': s['hits'],
+                'evicted': s['evictions'],
+                'lookups': s['hits'] + s['misses'],
+                'hit_rate': s['hit_rate']}
+
+    # Print Statistics Method
+    def printStats(self, name="Isovalue prefetch"):
+        s = self.stats()
+        print(f"{name}: {s['prefetched']} surfaces prefetched, "
+              f"{s['used']} used, {s['evicted']} evicted unused, "
+              f"{s['used']} / {s['lookups']} cache misses served "
+              f"({100.0 * s['hit_rate']:.1f}% prefetch hit rate)")
\ No newline at end of file
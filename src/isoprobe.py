@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Gradient magnitude sampling for isosurface vertices.
+
+When the gradient magnitude volume is computed from the data volume itself,
+probing it at the contour vertices is redundant: the contour filter already
+interpolates the data gradient along the cell edge each vertex is generated
+on (ComputeGradientsOn). EdgeGradientMagnitude turns those gradients into
+the magnitude scalars the probe would have produced, without any lookup in
+the gradient volume. It takes no gradient source: connecting one raises,
+so a precomputed gradient is never silently ignored.
+"""
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+
+GRADIENTS_NAME = 'Gradients'
+MAGNITUDE_NAME = 'GradientMagnitude'
+
+
+"""
+- Edge Gradient Magnitude Class
+"""
+
+class EdgeGradientMagnitude(VTKPythonAlgorithmBase):
+
+    # Constructor Method
+    def __init__(self):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkPolyData',
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+        self.passPointArrays = False
+
+    # Set Source Connection Method (the gradient comes with the contour, so
+    # a gradient source would be ignored)
+    def SetSourceConnection(self, port):
+        raise ValueError("edge gradient sampling takes no gradient source, "
+                         "probe it with createProbeFilter(edge=False)")
+
+    # Pass Point Arrays On Method
+    def PassPointArraysOn(self):
+        self.passPointArrays = True
+        self.Modified()
+
+    # Pass Point Arrays Off Method
+    def PassPointArraysOff(self):
+        self.passPointArrays = False
+        self.Modified()
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        inp = vtk.vtkPolyData.GetData(inInfo[0])
+        output = vtk.vtkPolyData.GetData(outInfo)
+        output.ShallowCopy(inp)
+        pointData = output.GetPointData()
+        if not self.passPointArrays:
+            pointData.Initialize()
+        pointData.RemoveArray(GRADIENTS_NAME)
+
+        gradients = inp.GetPointData().GetArray(GRADIENTS_NAME)
+        if gradients is None:
+            return 1
+        vectors = vtk_to_numpy(gradients)
+        magnitude = numpy_to_vtk(np.sqrt(np.einsum('ij,ij->i', vectors,
+                                                   vectors)), deep=True,
+                                 array_type=vtk.VTK_FLOAT)
+        magnitude.SetName(MAGNITUDE_NAME)
+        pointData.AddArray(magnitude)
+        pointData.SetActiveScalars(MAGNITUDE_NAME)
+        return 1
+
+
+"""
+- Factory Methods
+"""
+
+# Create Probe Filter Method (edge sampling needs contour gradients and
+# takes no source, the probe samples the source connected to it)
+def createProbeFilter(edge=False):
+    if edge:
+        return EdgeGradientMagnitude()
+    return vtk.vtkProbeFilter()
\ No newline at end of file
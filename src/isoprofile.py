@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Per-stage pipeline profiling shared by the isosurface scripts.
+
+Every algorithm upstream of the mappers (readers, contour and probe
+filters, each clipper, the gradient band clipper and the mappers
+themselves) is watched through its StartEvent/EndEvent, and so is the
+renderer. Each stage records how many times it executed, its cumulative and
+last run time and the size of its last output. Loading, which happens
+before the pipeline is assembled, is timed with stage(). The records are
+written as JSON or CSV (by file extension) on exit and can be shown as an
+on-screen overlay that is refreshed after every render.
+"""
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+import vtk
+
+
+FIELDS = ('stage', 'runs', 'total_ms', 'last_ms', 'mean_ms', 'points',
+          'cells', 'size_kb')
+
+
+"""
+- Pipeline Methods
+"""
+
+# Upstream Algorithms Method (the algorithm and its inputs, sources first)
+def upstreamAlgorithms(algorithm):
+    found = [algorithm]
+    for algorithm in found:
+        for port in range(algorithm.GetNumberOfInputPorts()):
+            for i in range(algorithm.GetNumberOfInputConnections(port)):
+                found.append(algorithm.GetInputAlgorithm(port, i))
+    return found[::-1]
+
+
+"""
+- Stage Record Class
+"""
+
+class StageRecord:
+
+    # Constructor Method
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.start = None
+        self.points = None
+        self.cells = None
+        self.size = None
+
+    # Add Run Method (seconds)
+    def addRun(self, seconds):
+        self.runs += 1
+        self.total += seconds
+        self.last = seconds
+
+    # Set Output Method (size of the last output data object)
+    def setOutput(self, output):
+        if output is None:
+            return
+        if isinstance(output, vtk.vtkDataSet):
+            self.points = output.GetNumberOfPoints()
+            self.cells = output.GetNumberOfCells()
+        self.size = output.GetActualMemorySize()
+
+    # To Dictionary Method
+    def toDict(self):
+        return {'stage': self.name,
+                'runs': self.runs,
+                'total_ms': 1000 * self.total,
+                'last_ms': 1000 * self.last,
+                'mean_ms': 1000 * self.total / self.runs if self.runs else 0.0,
+                'points': self.points,
+                'cells': self.cells,
+                'size_kb': self.size}
+
+
+"""
+- Pipeline Profiler Class
+"""
+
+class PipelineProfiler:
+
+    # Constructor Method (disabled when there is no file and no overlay)
+    def __init__(self, fileName=None, overlay=False):
+        self.fileName = fileName
+        self.overlay = overlay
+        self.enabled = fileName is not None or overlay
+        self.records = dict()
+        self.watched = dict()
+        self.text = None
+
+    # Get Stage Record Method
+    def record(self, name):
+        if name not in self.records:
+            self.records[name] = StageRecord(name)
+        return self.records[name]
+
+    # Unique Stage Name Method
+    def uniqueName(self, name):
+        if name not in self.records:
+            return name
+        i = 2
+        while f"{name} {i}" in self.records:
+            i += 1
+        return f"{name} {i}"
+
+    # Time Stage Block Method (for work done outside the pipeline)
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        yield
+        if self.enabled:
+            self.record(name).addRun(time.perf_counter() - start)
+
+    # Watch Algorithm Method (once per algorithm, returns it)
+    def watch(self, algorithm, name=None):
+        if not self.enabled:
+            return algorithm
+        address = algorithm.GetAddressAsString('vtkObject')
+        if address in self.watched:
+            return algorithm
+        if name is None:
+            name = self.uniqueName(type(algorithm).__name__)
+        record = self.record(name)
+        self.watched[address] = record
+        algorithm.AddObserver("StartEvent", self.start)
+        algorithm.AddObserver("EndEvent", self.end)
+        if algorithm.GetNumberOfOutputPorts() > 0:
+            record.setOutput(algorithm.GetOutputDataObject(0))
+        return algorithm
+
+    # Watch Upstream Method (the algorithm and everything feeding it, named
+    # in pipeline order so chained filters are numbered source to sink)
+    def watchUpstream(self, algorithm, suffix=''):
+        if not self.enabled:
+            return
+        for algorithm in upstreamAlgorithms(algorithm):
+            if algorithm.GetAddressAsString('vtkObject') not in self.watched:
+                name = self.uniqueName(type(algorithm).__name__ + suffix)
+                self.watch(algorithm, name)
+
+    # Watch Renderer Method (render time, and the overlay when enabled)
+    def watchRenderer(self, renderer):
+        if not self.enabled:
+            return
+        record = self.record('render')
+        self.watched[renderer.GetAddressAsString('vtkObject')] = record
+        renderer.AddObserver("StartEvent", self.start)
+        renderer.AddObserver("EndEvent", self.end)
+        if self.overlay:
+            self.text = vtk.vtkTextActor()
+            self.text.GetTextProperty().SetFontFamilyToCourier()
+            self.text.GetTextProperty().SetFontSize(12)
+            self.text.GetTextProperty().SetJustificationToRight()
+            self.text.GetTextProperty().SetVerticalJustificationToTop()
+            self.text.GetPositionCoordinate(
+                ).SetCoordinateSystemToNormalizedDisplay()
+            self.text.SetPosition(0.98, 0.98)
+            renderer.AddViewProp(self.text)
+            renderer.AddObserver("EndEvent", self.updateOverlay)
+
+    # Start Event Callback Method
+    def start(self, obj, event):
+        record = self.watched.get(obj.GetAddressAsString('vtkObject'))
+        if record is not None:
+            record.start = time.perf_counter()
+
+    # End Event Callback Method
+    def end(self, obj, event):
+        record = self.watched.get(obj.GetAddressAsString('vtkObject'))
+        if record is None or record.start is None:
+            return
+        record.addRun(time.perf_counter() - record.start)
+        record.start = None
+        if isinstance(obj, vtk.vtkAlgorithm) and obj.GetNumberOfOutputPorts():
+            record.setOutput(obj.GetOutputDataObject(0))
+
+    # Update Overlay Method (shown on the next render)
+    def updateOverlay(self, obj, event):
+        lines = [f"{'stage':<24} {'runs':>5} {'last':>9} {'total':>10}"]
+        for record in self.records.values():
+            lines.append(f"{record.name[:24]:<24} {record.runs:>5} "
+                         f"{1000 * record.last:>7.1f}ms "
+                         f"{1000 * record.total:>8.1f}ms")
+        self.text.SetInput("\n".join(lines))
+
+    # Get Statistics Method
+    def stats(self):
+        return [record.toDict() for record in self.records.values()]
+
+    # Dump Method (JSON, or CSV for .csv files)
+    def dump(self):
+        if self.fileName is None:
+            return
+        stats = self.stats()
+        with open(self.fileName, 'w', newline='') as fp:
+            if self.fileName.lower().endswith('.csv'):
+                writer = csv.DictWriter(fp, fieldnames=FIELDS)
+                writer.writeheader()
+                writer.writerows(stats)
+            else:
+                json.dump(stats, fp, indent=1)
+        print(f"Pipeline profile: {len(stats)} stages written to "
+              f"{self.fileName}")
\ No newline at end of file
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Multiresolution volume pyramid for progressive contouring.
+
+Level l holds the volume averaged down by 2^l along each axis and is built
+lazily the first time it is requested. While a slider is dragged the finest
+level whose estimated contouring time fits the target frame time is used;
+the full resolution surface is extracted once the interaction ends.
+"""
+
+import time
+
+import vtk
+
+from isocache import copyOutput
+from isocontour import createBackendFilter
+
+
+"""
+- Volume Pyramid Class
+"""
+
+class VolumePyramid:
+
+    # Constructor Method
+    def __init__(self, image, maxLevel=3):
+        self.maxLevel = maxLevel
+        self.levels = [image]
+
+    # Get Pyramid Level Method (builds missing levels one by one)
+    def getLevel(self, level):
+        level = min(level, self.maxLevel)
+        while len(self.levels) <= level:
+            shrink = vtk.vtkImageShrink3D()
+            shrink.SetInputData(self.levels[-1])
+            shrink.SetShrinkFactors(2, 2, 2)
+            shrink.AveragingOn()
+            shrink.Update()
+            self.levels.append(shrink.GetOutput())
+        return self.levels[level]
+
+
+"""
+- Progressive Contour Class
+"""
+
+class ProgressiveContour:
+
+    # Constructor Method (target frame time in seconds)
+    def __init__(self, image, targetTime=0.05, maxLevel=3, crop=None,
+                 computeGradients=False, backend='contour'):
+        self.pyramid = VolumePyramid(image, maxLevel)
+        self.crop = crop
+        self.targetTime = targetTime
+        self.times = dict()
+        self.contours = createBackendFilter(backend)
+        self.contours.ComputeNormalsOn()
+        self.contours.SetComputeGradients(computeGradients)
+
+    # Record Extraction Time Method
+    def recordTime(self, level, seconds):
+        self.times[level] = seconds
+
+    # Estimate Extraction Time Method (cells shrink 8x per level)
+    def estimateTime(self, level):
+        if level in self.times:
+            return self.times[level]
+        if not self.times:
+            return float('inf')
+        measured = min(self.times, key=lambda m: abs(m - level))
+        return self.times[measured] * 8.0 ** (measured - level)
+
+    # Choose Pyramid Level Method
+    def chooseLevel(self):
+        for level in range(self.pyramid.maxLevel + 1):
+            if self.estimateTime(level) <= self.targetTime:
+                return level
+        return self.pyramid.maxLevel
+
+    # Extract Surface at Pyramid Level Method
+    def extract(self, value, level):
+        image = self.pyramid.getLevel(level)
+        start = time.perf_counter()
+        if self.crop is None:
+            self.contours.SetInputData(image)
+        else:
+            self.contours.SetInputConnection(
+                self.crop.crop(image).GetOutputPort())
+        self.contours.SetValue(0, value)
+        self.contours.Update()
+        polyData = copyOutput(self.contours)
+        self.recordTime(level, time.perf_counter() - start)
+        return polyData
\ No newline at end of file
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Slider interaction scheduling with event coalescing and a frame-rate governor.
+
+In animate mode every InteractionEvent of a slider ran a full pipeline
+update and render, so while the pipeline was slower than the mouse the
+events piled up and the surface lagged far behind the slider. Scheduled
+sliders only record their latest value instead, and the pending updates of
+all sliders are applied together by a one-shot interactor timer, at most
+once per frame period. Events that arrive while a frame is pending, or that
+were queued while the last frame was being computed, are coalesced to the
+latest value and the intermediate values are skipped. The slider itself is
+still redrawn on every event. On EndInteractionEvent the pending update is
+applied at once, so the final value is never skipped.
+"""
+
+import time
+
+
+"""
+- Interaction Scheduler Class
+"""
+
+class InteractionScheduler:
+
+    # Constructor Method (fps of 0 applies every event immediately)
+    def __init__(self, interactor, fps=30.0):
+        self.interactor = interactor
+        self.period = 1.0 / fps if fps else 0.0
+        self.pending = dict()
+        self.timer = None
+        self.lastFrame = None
+        self.events = 0
+        self.skipped = 0
+        self.frames = 0
+        interactor.AddObserver("TimerEvent", self.tick)
+
+    # Observe Slider Method (endCallback, if any, supersedes the pending
+    # update of this slider when the interaction ends)
+    def observe(self, sliderWidget, callback, endCallback=None):
+        address = sliderWidget.GetAddressAsString('vtkObject')
+
+        def interaction(obj, event):
+            self.post(address, obj, callback)
+
+        def endInteraction(obj, event):
+            if endCallback is not None:
+                self.pending.pop(address, None)
+            self.flush(render=False)
+            if endCallback is not None:
+                endCallback(obj, event)
+
+        sliderWidget.AddObserver("InteractionEvent", interaction)
+        sliderWidget.AddObserver("EndInteractionEvent", endInteraction, 1.0)
+        return sliderWidget
+
+    # Post Update Method (coalesced to the latest event of each slider)
+    def post(self, address, sliderWidget, callback):
+        self.events += 1
+        if address in self.pending:
+            self.skipped += 1
+        self.pending[address] = (sliderWidget, callback)
+        if self.period == 0.0:
+            self.flush(render=False)
+        elif self.timer is None:
+            delay = 0.0
+            if self.lastFrame is not None:
+                delay = self.lastFrame + self.period - time.perf_counter()
+            self.timer = self.interactor.CreateOneShotTimer(
+                max(1, round(1000 * delay)))
+
+    # Timer Event Callback Method
+    def tick(self, obj, event):
+        if self.timer is None or obj.GetTimerEventId() != self.timer:
+            return
+        self.timer = None
+        self.flush()
+
+    # Flush Method (applies every pending update, then renders the frame)
+    def flush(self, render=True):
+        if not self.pending:
+            return
+        pending = list(self.pending.values())
+        self.pending.clear()
+        self.lastFrame = time.perf_counter()
+        for sliderWidget, callback in pending:
+            callback(sliderWidget, "InteractionEvent")
+        self.frames += 1
+        if render:
+            self.interactor.Render()
+
+    # Print Statistics Method
+    def printStats(self, name="Interaction scheduler"):
+        if self.period == 0.0:
+            rate = "ungoverned"
+        else:
+            rate = f"{1.0 / self.period:.0f} fps"
+        print(f"{name} ({rate}): {self.events} events, {self.frames} updates, "
+              f"{self.skipped} intermediate values skipped")
\ No newline at end of file
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Image volumes shared between worker processes.
+
+The parent copies the point scalars of a volume into a shared memory block
+once; workers attach to the block and wrap it as a vtkImageData without
+copying, so a pool of N workers holds a single copy of the volume. Memory
+mapped volumes are not copied at all, workers map the same file instead.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from isommap import MappedVolumeReader, mapVolume
+
+
+"""
+- Shared Image Methods
+"""
+
+# Share Image Method (returns the block and its picklable description)
+def shareImage(image):
+    scalars = image.GetPointData().GetScalars()
+    values = vtk_to_numpy(scalars)
+    block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    np.ndarray(values.shape, values.dtype, buffer=block.buf)[...] = values
+    description = {'block': block.name,
+                   'shape': values.shape,
+                   'dtype': values.dtype.str,
+                   'name': scalars.GetName(),
+                   'extent': image.GetExtent(),
+                   'origin': image.GetOrigin(),
+                   'spacing': image.GetSpacing()}
+    return block, description
+
+# Share Volume Method (memory mapped volumes are shared by file name)
+def shareVolume(reader, fileName):
+    if isinstance(reader, MappedVolumeReader):
+        return None, {'file': fileName}
+    return shareImage(reader.GetOutput())
+
+# Attach Image Method (keep the block open while the image is in use)
+def attachImage(description):
+    if 'file' in description:
+        return None, None, mapVolume(description['file'])
+    block = shared_memory.SharedMemory(name=description['block'])
+    values = np.ndarray(description['shape'], np.dtype(description['dtype']),
+                        buffer=block.buf)
+    scalars = numpy_to_vtk(values, deep=False)
+    scalars.SetName(description['name'])
+    image = vtk.vtkImageData()
+    image.SetExtent(description['extent'])
+    image.SetOrigin(description['origin'])
+    image.SetSpacing(description['spacing'])
+    image.GetPointData().SetScalars(scalars)
+    return block, values, image
\ No newline at end of file
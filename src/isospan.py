@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Span space index for isosurface extraction.
+
+The volume is split into bricks of cells whose scalar min/max are computed
+once after loading. Bricks are kept sorted by their minimum so the active
+bricks for an isovalue (min <= value <= max) are found with a binary search,
+and only those bricks are handed to the contouring algorithm.
+"""
+
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+from isocrop import cropCells, intersectExtents, mergePoints, padExtent
+
+# Brick Size of the Index (in cells along each axis)
+BRICK_SIZE = 16
+
+
+"""
+- Index Methods
+"""
+
+# Reduce Point Blocks Along Axis Method (brick b covers points [b*s, b*s+s])
+def reduceBricks(points, size, axis, ufunc):
+    n = points.shape[axis]
+    starts = np.arange(0, max(n - 1, 1), size)
+    ends = np.minimum(starts + size, n - 1)
+    reduced = ufunc.reduceat(points, starts, axis=axis)
+    return ufunc(reduced, np.take(points, ends, axis=axis))
+
+
+"""
+- Span Space Index Class
+"""
+
+class SpanSpaceIndex:
+
+    # Constructor Method (ranges are the brick min/max in z/y/x order when
+    # already known, from the volume metadata)
+    def __init__(self, image, brickSize=BRICK_SIZE, ranges=None):
+        start = time.perf_counter()
+        self.brickSize = brickSize
+        self.scalars = image.GetPointData().GetScalars()
+        self.scalarsTime = self.scalars.GetMTime()
+        self.extent = image.GetExtent()
+        nx, ny, nz = image.GetDimensions()
+        if ranges is None:
+            points = vtk_to_numpy(self.scalars).reshape(nz, ny, nx)
+            mins, maxs = points, points
+            for axis in (2, 1, 0):
+                mins = reduceBricks(mins, brickSize, axis, np.minimum)
+                maxs = reduceBricks(maxs, brickSize, axis, np.maximum)
+        else:
+            mins, maxs = ranges
+        self.shape = mins.shape
+
+        # Cells per brick (last bricks along each axis may be smaller)
+        cells = [np.diff(np.minimum(np.arange(0, s + 1) * brickSize, d - 1))
+                 for s, d in zip(self.shape, (nz, ny, nx))]
+        self.cells = (cells[0][:, None, None] * cells[1][None, :, None]
+                      * cells[2][None, None, :]).ravel()
+        self.totalCells = int(self.cells.sum())
+
+        # Sorted buckets by brick minimum
+        self.order = np.argsort(mins.ravel(), kind='stable')
+        self.sortedMins = mins.ravel()[self.order]
+        self.sortedMaxs = maxs.ravel()[self.order]
+        self.buildTime = time.perf_counter() - start
+
+    # Is Index Up To Date Method (cropped views share the scalars)
+    def isValidFor(self, image):
+        scalars = image.GetPointData().GetScalars()
+        return (scalars is self.scalars
+                and scalars.GetMTime() == self.scalarsTime
+                and self.extent == image.GetExtent())
+
+    # Number of Bricks Method
+    def numberOfBricks(self):
+        return self.order.size
+
+    # Get Active Bricks Mask Method
+    def activeBricks(self, values):
+        active = np.zeros(self.order.size, dtype=bool)
+        for value in values:
+            last = np.searchsorted(self.sortedMins, value, side='right')
+            candidates = self.order[:last]
+            active[candidates[self.sortedMaxs[:last] >= value]] = True
+        return active.reshape(self.shape)
+
+    # Get Bricks Inside Extent Mask Method
+    def bricksInExtent(self, extent):
+        b = self.brickSize
+        mask = np.zeros(self.shape, dtype=bool)
+        lo = [(extent[2 * a] - self.extent[2 * a]) // b for a in range(3)]
+        hi = [-(-(extent[2 * a + 1] - self.extent[2 * a]) // b)
+              for a in range(3)]
+        mask[lo[2]:hi[2], lo[1]:hi[1], lo[0]:hi[0]] = True
+        return mask
+
+    # Get Visited Cells Fraction Method
+    def visitedFraction(self, active):
+        if self.totalCells == 0:
+            return 0.0
+        return float(self.cells[active.ravel()].sum()) / self.totalCells
+
+    # Get Active Extents Method (runs of active bricks along x)
+    def activeExtents(self, active):
+        x0, x1, y0, y1, z0, z1 = self.extent
+        b = self.brickSize
+        extents = list()
+        for k, j in zip(*np.nonzero(active.any(axis=2))):
+            row = np.concatenate(([False], active[k, j], [False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+            for first, last in zip(edges[::2], edges[1::2]):
+                extents.append((x0 + first * b, min(x0 + last * b, x1),
+                                y0 + j * b, min(y0 + (j + 1) * b, y1),
+                                z0 + k * b, min(z0 + (k + 1) * b, z1)))
+        return extents
+
+
+# Build Span Space Index Method
+def buildSpanSpaceIndex(image, brickSize=BRICK_SIZE, verbose=True,
+                        ranges=None):
+    index = SpanSpaceIndex(image, brickSize, ranges)
+    if verbose:
+        print(f"Span space index: {index.numberOfBricks()} bricks "
+              f"built in {1000 * index.buildTime:.1f} ms")
+    return index
+
+
+"""
+- Span Space Contour Filter Class
+"""
+
+class SpanSpaceContourFilter(VTKPythonAlgorithmBase):
+
+    # Constructor Method (contours is the image contour filter to run,
+    # verbose prints the share of cells visited by every execution, which
+    # lastFraction keeps either way)
+    def __init__(self, index=None, brickSize=BRICK_SIZE, verbose=False,
+                 contours=None):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=1,
+                                        inputType='vtkImageData',
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+        self.brickSize = brickSize
+        self.verbose = verbose
+        self.index = index
+        self.lastFraction = 0.0
+
+        # Contour each run of bricks padded by a ghost layer of cells and
+        # crop back to its own cells, so the normals and gradients on the
+        # brick faces match a single pass with every backend
+        self.voi = vtk.vtkImageClip()
+        self.voi.ClipDataOff()
+        if contours is None:
+            contours = vtk.vtkContourFilter()
+        self.contours = contours
+        self.contours.SetInputConnection(self.voi.GetOutputPort())
+
+    # Set Contour Value Method
+    def SetValue(self, i, value):
+        self.contours.SetValue(i, value)
+        self.Modified()
+
+    # Get Contour Value Method
+    def GetValue(self, i):
+        return self.contours.GetValue(i)
+
+    # Set Number of Contours Method
+    def SetNumberOfContours(self, number):
+        self.contours.SetNumberOfContours(number)
+        self.Modified()
+
+    # Get Number of Contours Method
+    def GetNumberOfContours(self):
+        return self.contours.GetNumberOfContours()
+
+    # Compute Normals On Method
+    def ComputeNormalsOn(self):
+        self.contours.ComputeNormalsOn()
+        self.Modified()
+
+    # Compute Normals Off Method
+    def ComputeNormalsOff(self):
+        self.contours.ComputeNormalsOff()
+        self.Modified()
+
+    # Compute Gradients On Method
+    def ComputeGradientsOn(self):
+        self.contours.ComputeGradientsOn()
+        self.Modified()
+
+    # Compute Gradients Off Method
+    def ComputeGradientsOff(self):
+        self.contours.ComputeGradientsOff()
+        self.Modified()
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        image = vtk.vtkImageData.GetData(inInfo[0])
+        output = vtk.vtkPolyData.GetData(outInfo)
+        if self.index is None or not self.index.isValidFor(image):
+            self.index = buildSpanSpaceIndex(image, self.brickSize,
+                                             self.verbose)
+
+        # Requested extent (smaller than the data when cropped upstream)
+        whole = inInfo[0].GetInformationObject(0).Get(
+            vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+
+        n = self.contours.GetNumberOfContours()
+        values = [self.contours.GetValue(i) for i in range(n)]
+        active = self.index.activeBricks(values)
+        active &= self.index.bricksInExtent(whole)
+        self.lastFraction = self.index.visitedFraction(active)
+
+        append = vtk.vtkAppendPolyData()
+        volume = vtk.vtkImageData()
+        volume.ShallowCopy(image)
+        self.voi.SetInputData(volume)
+        for extent in self.index.activeExtents(active):
+            extent = intersectExtents(extent, whole)
+            if extent is None:
+                continue
+            self.voi.SetOutputWholeExtent(padExtent(extent, whole))
+            self.contours.Update()
+            piece = cropCells(self.contours.GetOutput(), image, extent, whole)
+            if piece is self.contours.GetOutput():
+                piece = vtk.vtkPolyData()
+                piece.ShallowCopy(self.contours.GetOutput())
+            append.AddInputData(piece)
+        self.voi.SetInputData(None)
+
+        # Merge the vertices duplicated along the faces between runs (every
+        # triangle is kept, also those the merge leaves degenerate)
+        if append.GetNumberOfInputConnections(0) > 0:
+            append.Update()
+            output.ShallowCopy(mergePoints(append.GetOutput()))
+        else:
+            output.Initialize()
+        if self.verbose:
+            print(f"Span space contour: visited "
+                  f"{100 * self.lastFraction:.1f}% of cells")
+        return 1
\ No newline at end of file
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent content addressed mesh cache shared across sessions.
+
+Extracted surfaces are stored on disk as LZ4 compressed binary vtp files
+named by a hash of the data and gradient file contents and of every
+extraction parameter (isovalues, gradient band, clip box, cropping and
+backend), so a configuration seen before is loaded instead of extracted
+again. File contents are hashed once per (size, mtime), in the hashes the
+gradient cache keeps in the cache directory. The meshes are evicted in
+least recently used order (by modification time, touched on every load)
+once their total size exceeds the budget.
+"""
+
+import hashlib
+import json
+import os
+
+import vtk
+
+from isograd import CACHE_DIR, contentHash
+
+
+VERSION = 1
+
+
+"""
+- Mesh Store Class
+"""
+
+class MeshStore:
+
+    # Constructor Method (budget in MiB, disabled when 0)
+    def __init__(self, cacheDir=None, budget=1024):
+        if cacheDir is None:
+            cacheDir = CACHE_DIR
+        self.cacheDir = cacheDir
+        self.directory = os.path.join(cacheDir, 'meshes')
+        self.budget = int(budget * 1024 * 1024)
+        self.enabled = self.budget > 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    # Content Hash Method (of a file, None for no file)
+    def contentHash(self, fileName):
+        if fileName is None:
+            return None
+        return contentHash(fileName, self.cacheDir)
+
+    # Get Key Method (of any JSON serializable extraction parameters)
+    def key(self, *parts):
+        text = json.dumps([VERSION] + list(parts), sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    # Get Mesh File Method
+    def meshFile(self, key):
+        return os.path.join(self.directory, f"mesh-{key}.vtp")
+
+    # Get Stored Mesh Method (None when not stored)
+    def get(self, key):
+        fileName = self.meshFile(key)
+        if not self.enabled or not os.path.exists(fileName):
+            self.misses += 1
+            return None
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(fileName)
+        reader.Update()
+        if reader.GetErrorCode():
+            self.misses += 1
+            return None
+        os.utime(fileName)
+        self.hits += 1
+        return reader.GetOutput()
+
+    # Store Mesh Method
+    def put(self, key, polyData):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fileName = self.meshFile(key)
+        partFile = fileName + f".{os.getpid()}.part"
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(partFile)
+        writer.SetInputData(polyData)
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToLZ4()
+        writer.SetHeaderTypeToUInt64()
+        if writer.Write():
+            os.replace(partFile, fileName)
+            self.writes += 1
+            self.evict()
+        elif os.path.exists(partFile):
+            os.remove(partFile)
+
+    # Evict Method (least recently used meshes beyond the budget)
+    def evict(self):
+        meshes = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('mesh-') and entry.name.endswith('.vtp'):
+                stat = entry.stat()
+                meshes.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        meshes.sort()
+        size = sum(mesh[1] for mesh in meshes)
+        for _, meshSize, path in meshes[:-1]:
+            if size <= self.budget:
+                break
+            os.remove(path)
+            size -= meshSize
+            self.evictions += 1
+
+    # Print Statistics Method
+    def printStats(self, name="Mesh store"):
+        if not self.enabled:
+            return
+        print(f"{name}: {self.hits} loaded, {self.misses} extracted, "
+              f"{self.writes} stored, {self.evictions} evicted "
+              f"({self.directory})")
\ No newline at end of file
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core contouring of volumes streamed in slabs.
+
+The volume is never loaded whole: VolumeStream reads z slabs through
+vtkExtractVOI, so the reader upstream (vtkXMLImageDataReader or a memory
+mapped volume) only produces the requested extent. Each slab is read with
+one ghost slice on each side and consecutive slabs share their boundary
+slice. StreamingContourFilter contours each slab with its ghost slices and
+keeps only the polygons of the slab's own cells, so the normals along the
+seams are computed as in a single pass with every backend, and coincident
+vertices are merged when the pieces are appended, giving the triangles of
+the in-memory mesh (a position that mesh repeats, where the isovalue
+passes exactly through grid points, is listed once). The slab thickness
+keeps the volume data held at once under the memory budget; the output
+mesh is not counted in it.
+"""
+
+import vtk
+from vtk.util.vtkAlgorithm import VTKPythonAlgorithmBase
+
+from isocontour import createBackendFilter
+from isocrop import cropCells, mergePoints
+
+
+"""
+- Volume Stream Class
+"""
+
+class VolumeStream:
+
+    # Constructor Method (budget in MiB, the reader is only informed)
+    def __init__(self, algorithm, budget=256):
+        self.algorithm = algorithm
+        self.algorithm.UpdateInformation()
+        info = algorithm.GetOutputInformation(0)
+        sddp = vtk.vtkStreamingDemandDrivenPipeline
+        self.extent = list(info.Get(sddp.WHOLE_EXTENT()))
+        self.origin = info.Get(vtk.vtkDataObject.ORIGIN())
+        self.spacing = info.Get(vtk.vtkDataObject.SPACING())
+        self.budget = budget * 1024 * 1024
+
+        self.voi = vtk.vtkExtractVOI()
+        self.voi.SetInputConnection(algorithm.GetOutputPort())
+
+        # Bytes per z slice from a single slice sample
+        first = self.extent[4]
+        sample = self.read(self.extent[:4] + [first, first])
+        self.sliceBytes = max(sample.GetActualMemorySize() * 1024, 1)
+
+    # Get Bounds Method
+    def bounds(self):
+        return [self.origin[axis // 2]
+                + self.extent[axis] * self.spacing[axis // 2]
+                for axis in range(6)]
+
+    # Get Slices per Slab Method (reader output and extracted copy per stream)
+    def slabSlices(self, streams=1):
+        return max(2, int(self.budget // (2 * self.sliceBytes * streams)))
+
+    # Read Extent Method (detached from the next read)
+    def read(self, extent):
+        self.voi.SetVOI(extent)
+        self.voi.Update()
+        image = vtk.vtkImageData()
+        image.ShallowCopy(self.voi.GetOutput())
+        return image
+
+    # Slab Extents Method (inner extents sharing boundary slices)
+    def slabExtents(self, slices):
+        first, last = self.extent[4], self.extent[5]
+        for z in range(first, max(last, first + 1), slices - 1):
+            yield self.extent[:4] + [z, min(z + slices - 1, last)]
+
+    # Ghost Extent Method (one more slice on each side)
+    def ghostExtent(self, inner):
+        return inner[:4] + [max(inner[4] - 1, self.extent[4]),
+                            min(inner[5] + 1, self.extent[5])]
+
+    # Get Scalar Range Method (from the file header, else a streamed pass)
+    def scalarRange(self):
+        info = vtk.vtkDataObject.GetActiveFieldInformation(
+            self.algorithm.GetOutputInformation(0),
+            vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS,
+            vtk.vtkDataSetAttributes.SCALARS)
+        if info is not None and info.Has(vtk.vtkDataObject.FIELD_RANGE()):
+            return info.Get(vtk.vtkDataObject.FIELD_RANGE())
+        low, high = float('inf'), float('-inf')
+        for inner in self.slabExtents(self.slabSlices()):
+            range_ = self.read(inner).GetScalarRange()
+            low, high = min(low, range_[0]), max(high, range_[1])
+        return low, high
+
+
+"""
+- Streaming Contour Filter Class
+"""
+
+class StreamingContourFilter(VTKPythonAlgorithmBase):
+
+    # Constructor Method (gradient is an optional VolumeStream to probe)
+    def __init__(self, volume, gradient=None, backend='contour'):
+        VTKPythonAlgorithmBase.__init__(self, nInputPorts=0,
+                                        nOutputPorts=1,
+                                        outputType='vtkPolyData')
+        self.volume = volume
+        self.gradient = gradient
+
+        # Contour the ghost extent, cropped to the inner cells afterwards
+        self.clip = vtk.vtkImageClip()
+        self.clip.ClipDataOff()
+        self.contours = createBackendFilter(backend)
+        self.contours.SetInputConnection(self.clip.GetOutputPort())
+        self.probe = vtk.vtkProbeFilter()
+        self.probe.SetInputConnection(self.contours.GetOutputPort())
+        self.probe.PassPointArraysOn()
+
+    # Set Contour Value Method
+    def SetValue(self, i, value):
+        self.contours.SetValue(i, value)
+        self.Modified()
+
+    # Get Contour Value Method
+    def GetValue(self, i):
+        return self.contours.GetValue(i)
+
+    # Set Number of Contours Method
+    def SetNumberOfContours(self, number):
+        self.contours.SetNumberOfContours(number)
+        self.Modified()
+
+    # Get Number of Contours Method
+    def GetNumberOfContours(self):
+        return self.contours.GetNumberOfContours()
+
+    # Compute Normals On Method
+    def ComputeNormalsOn(self):
+        self.contours.ComputeNormalsOn()
+        self.Modified()
+
+    # Compute Normals Off Method
+    def ComputeNormalsOff(self):
+        self.contours.ComputeNormalsOff()
+        self.Modified()
+
+    # Request Data Method
+    def RequestData(self, request, inInfo, outInfo):
+        output = vtk.vtkPolyData.GetData(outInfo)
+        n = self.contours.GetNumberOfContours()
+        values = [self.contours.GetValue(i) for i in range(n)]
+        streams = 1 if self.gradient is None else 2
+        slices = self.volume.slabSlices(streams)
+
+        append = vtk.vtkAppendPolyData()
+        for inner in self.volume.slabExtents(slices):
+            ghost = self.volume.ghostExtent(inner)
+            image = self.volume.read(ghost)
+            low, high = image.GetScalarRange()
+            if not any(low <= value <= high for value in values):
+                continue
+            self.clip.SetInputData(image)
+            self.clip.SetOutputWholeExtent(ghost)
+            if self.gradient is None:
+                self.contours.Update()
+                piece = self.contours.GetOutput()
+            else:
+                self.probe.SetSourceData(self.gradient.read(ghost))
+                self.probe.Update()
+                piece = self.probe.GetOutput()
+            copy = vtk.vtkPolyData()
+            copy.ShallowCopy(cropCells(piece, image, inner,
+                                       self.volume.extent))
+            append.AddInputData(copy)
+        self.clip.SetInputData(None)
+        self.probe.SetSourceData(None)
+
+        # Merge the vertices duplicated on the slices shared by slabs
+        if append.GetNumberOfInputConnections(0) > 0:
+            append.Update()
+            output.ShallowCopy(mergePoints(append.GetOutput()))
+        else:
+            output.Initialize()
+        return 1
\ No newline at end of file
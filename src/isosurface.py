@@ -6,8 +6,30 @@ Created on Sat Oct 10 10:58:28 2020
 @author: Camila Lozano
 """
 
+import time
+
 import vtk
 
+from isobrick import BrickContourFilter, BrickPool
+from isocache import IsosurfaceCache, datasetKey, copyOutput
+from isocontour import (BACKENDS, ContourTimer, configureThreads,
+                        createContourFilter)
+from isocrop import VolumeCrop
+from isolatency import LatencyTracer
+from isolod import LevelOfDetail
+from isometa import loadMetadata, metadataBricks, printMetadata, readMetadata
+from isommap import openVolume, readVolume
+from isoprefetch import IsovaluePrefetcher
+from isoprofile import PipelineProfiler
+from isopyramid import ProgressiveContour
+from isoschedule import InteractionScheduler
+from isospan import BRICK_SIZE, buildSpanSpaceIndex
+from isostream import StreamingContourFilter, VolumeStream
+from isoworker import PipelineWorker
+
+# Isovalue Slider Step (the isovalue slider snaps to its multiples)
+ISOVALUE_STEP = 1
+
 # Get Program Parameters
 def get_program_parameters():
     import argparse
@@ -18,8 +40,72 @@ def get_program_parameters():
                         default=None, help='initial isovalue')
     parser.add_argument('--clip', dest='clip', nargs=3, 
                         type=int, default=None)
+    parser.add_argument('--cache-mb', dest='cache_mb', type=float, 
+                        default=512, help='isosurface cache budget (MiB)')
+    parser.add_argument('--span', dest='span', action='store_true', 
+                        help='contour with a span space index')
+    parser.add_argument('--progressive', dest='progressive', 
+                        action='store_true', 
+                        help='contour a coarser volume while dragging')
+    parser.add_argument('--frame-ms', dest='frame_ms', type=float, 
+                        default=50, help='target drag frame time (ms)')
+    parser.add_argument('--crop', dest='crop', action='store_true', 
+                        help='crop the volume to the clip box before contouring')
+    parser.add_argument('--render-clip', dest='render_clip', 
+                        action='store_true', 
+                        help='clip with the X/Y/Z planes while rendering')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS), 
+                        default='contour', help='contouring algorithm')
+    parser.add_argument('--threads', dest='threads', type=int, 
+                        default=None, help='contouring threads (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true', 
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--stream-mb', dest='stream_mb', type=float, 
+                        default=None, 
+                        help='stream the volume in slabs within this budget (MiB)')
+    parser.add_argument('--bricks', dest='bricks', type=int, 
+                        default=None, 
+                        help='contour in bricks across this many processes')
+    parser.add_argument('--brick-size', dest='brick_size', type=int, 
+                        default=64, help='cells per brick side')
+    parser.add_argument('--profile', dest='profile', type=str, 
+                        default=None, 
+                        help='write per-stage pipeline timings (.json or .csv)')
+    parser.add_argument('--profile-overlay', dest='profile_overlay', 
+                        action='store_true', 
+                        help='show per-stage pipeline timings on screen')
+    parser.add_argument('--latency-log', dest='latency_log', type=str, 
+                        default=None, 
+                        help='write per-event slider latency records (.csv)')
+    parser.add_argument('--fps', dest='fps', type=float, default=30, 
+                        help='target frame rate of slider updates, skipping '
+                        'the values in between (0 updates on every event)')
+    parser.add_argument('--lod', dest='lod', action='store_true', 
+                        help='draw decimated proxies of the surfaces while '
+                        'the view moves, to hold the --fps frame rate')
+    parser.add_argument('--background', dest='background', 
+                        action='store_true', 
+                        help='contour on a background thread, keeping the '
+                        'last surface on screen until the new one is ready')
+    parser.add_argument('--prefetch', dest='prefetch', type=int, default=0, 
+                        help='contour this many isovalue steps ahead of the '
+                        'slider in idle time')
+    parser.add_argument('--prefetch-step', dest='prefetch_step', type=int, 
+                        default=ISOVALUE_STEP, 
+                        help='finest isovalue stride of the prefetch, a '
+                        'multiple of the slider step (the slider step)')
+    parser.add_argument('--prefetch-mb', dest='prefetch_mb', type=float, 
+                        default=128, help='prefetched surface budget (MiB)')
     args = parser.parse_args()
-    return args.data_file, args.value, args.clip
+    if args.prefetch_step < 1 or args.prefetch_step % ISOVALUE_STEP:
+        parser.error(f"--prefetch-step must be a positive multiple of the "
+                     f"slider step ({ISOVALUE_STEP})")
+    return (args.data_file, args.value, args.clip, args.cache_mb, args.span, 
+            args.progressive, args.frame_ms, args.crop, args.render_clip, 
+            args.backend, args.threads, args.mmap, args.stream_mb, args.bricks, 
+            args.brick_size, args.profile, args.profile_overlay, 
+            args.latency_log, args.fps, args.lod, args.background, 
+            args.prefetch, args.prefetch_step, args.prefetch_mb)
 
 
 """
@@ -42,13 +128,15 @@ def createSlideBar(min_, max_, val, x1, x2, y, name):
     slideBar.SetLabelHeight(0.02)
     return slideBar
 
-# Create Slider Widget Method
-def createSliderWidget(slideBar, interactor):
+# Create Slider Widget Method (traces its latency when given a tracer)
+def createSliderWidget(slideBar, interactor, tracer=None):
     sliderWidget = vtk.vtkSliderWidget()
     sliderWidget.SetInteractor(interactor)
     sliderWidget.SetRepresentation(slideBar)
     sliderWidget.SetAnimationModeToAnimate()
     sliderWidget.SetEnabled(True)
+    if tracer is not None:
+        tracer.watchSlider(sliderWidget)
     return sliderWidget
 
 # Create Scalar Bar Method
@@ -72,16 +160,108 @@ def createScalarBarWidget(scalarBar, interactor):
     return scalarBarWidget
 
 
+"""
+- Pipeline Methods
+"""
+
+# Get Cache Key Method (for the current crop box unless given)
+def cacheKey(value, lower=None):
+    global dataKey, crop, cropLower
+    if crop is None:
+        return (dataKey, value, None)
+    return (dataKey, value, crop.key(cropLower if lower is None else lower))
+
+# Extract Isosurface Method (consults the cache and the prefetched surfaces
+# before contouring, on the background worker when there is one)
+def extractIsosurface(value):
+    global contours, surface, cache, progressive, isovalue, worker, cropLower, prefetcher
+    isovalue = value
+    key = cacheKey(value)
+    polyData = cache.get(key)
+    if polyData is None and prefetcher is not None:
+        polyData = prefetcher.take(key)
+        if polyData is not None:
+            cache.put(key, polyData)
+    if polyData is None and worker is not None:
+        worker.submit((value, tuple(cropLower)))
+        return
+    if worker is not None:
+        worker.cancel()
+    if polyData is None:
+        start = time.perf_counter()
+        contours.SetValue(0, value)
+        contours.Update()
+        polyData = copyOutput(contours)
+        cache.put(key, polyData)
+        if progressive is not None:
+            progressive.recordTime(0, time.perf_counter() - start)
+    surface.SetOutput(polyData)
+    prefetchNeighbours(value, cropLower)
+
+# Extract Draft Isosurface Method (coarser pyramid level while dragging)
+def extractDraftIsosurface(value):
+    global surface, cache, progressive, isovalue, prefetcher
+    level = progressive.chooseLevel()
+    key = cacheKey(value)
+    if (level == 0 or key in cache 
+            or prefetcher is not None and key in prefetcher):
+        extractIsosurface(value)
+    else:
+        isovalue = value
+        surface.SetOutput(progressive.extract(value, level))
+
+# Configure Isosurface Method (on the worker thread, from a snapshot)
+def configureIsosurface(parameters):
+    global contours, crop
+    value, lower = parameters
+    if crop is not None:
+        for axis in range(3):
+            crop.setLower(axis, lower[axis])
+    contours.SetValue(0, value)
+
+# Deliver Isosurface Method (on the main thread, swaps the surface in)
+def deliverIsosurface(parameters, polyData):
+    global surface, cache
+    value, lower = parameters
+    cache.put(cacheKey(value, lower), polyData)
+    surface.SetOutput(polyData)
+    prefetchNeighbours(value, lower)
+
+# Prefetch Neighbours Method (of the isovalue on screen, in idle time)
+def prefetchNeighbours(value, lower):
+    global prefetcher, cache
+    if prefetcher is not None:
+        prefetcher.predict(value, tuple(lower), cache)
+
+# Move Crop Box Method (re-extracts the isosurface when cropping)
+def moveCrop(axis, value):
+    global crop, isovalue, worker, cropLower
+    if crop is not None:
+        cropLower[axis] = value
+        if worker is None:
+            crop.setLower(axis, value)
+        extractIsosurface(isovalue)
+
+
 """
 - Callback Methods
 """
 
 # Isovalue Slide Bar Callback Method
 def vtkIsovalueSlideBarCallback(obj, event):
-    global contours
+    global progressive
     slideBar = obj.GetRepresentation()
-    value = slideBar.GetValue()
-    contours.SetValue(0, value)
+    value = ISOVALUE_STEP * round(slideBar.GetValue() / ISOVALUE_STEP)
+    if progressive is None:
+        extractIsosurface(value)
+    else:
+        extractDraftIsosurface(value)
+
+# Isovalue Slide Bar End Callback Method (refine to full resolution)
+def vtkIsovalueSlideBarEndCallback(obj, event):
+    slideBar = obj.GetRepresentation()
+    value = ISOVALUE_STEP * round(slideBar.GetValue() / ISOVALUE_STEP)
+    extractIsosurface(value)
 
 # X Plane Value Slider Bar Callback Method
 def vtkXSlideBarCallback(obj, event):
@@ -89,6 +269,7 @@ def vtkXSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     xPlane.SetOrigin(value, 0, 0)
+    moveCrop(0, value)
     
 # Y Plane Value Slider Bar Callback Method
 def vtkYSlideBarCallback(obj, event):
@@ -96,6 +277,7 @@ def vtkYSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     yPlane.SetOrigin(0, value, 0)
+    moveCrop(1, value)
 
 # Z Plane Value Slider Bar Callback Method
 def vtkZSlideBarCallback(obj, event):
@@ -103,6 +285,7 @@ def vtkZSlideBarCallback(obj, event):
     slideBar = obj.GetRepresentation()
     value = slideBar.GetValue()
     zPlane.SetOrigin(0, 0, value)
+    moveCrop(2, value)
 
 
 """
@@ -110,18 +293,47 @@ def vtkZSlideBarCallback(obj, event):
 """
 
 def main():
-    global contours, xPlane, yPlane, zPlane
+    global contours, surface, cache, dataKey, progressive, crop, cropLower, xPlane, yPlane, zPlane, worker, prefetcher
     
-    data_file, val, clip = get_program_parameters()
+    (data_file, val, clip, cache_mb, span, progressive, frame_ms, crop, 
+     render_clip, backend, threads, mmap, stream_mb, bricks, 
+     brick_size, profile, profile_overlay, latency_log, fps, lod, 
+     background, prefetch, prefetch_step, prefetch_mb) = get_program_parameters()
     
-    # Load Data
-    reader = vtk.vtkXMLImageDataReader()
-    reader.SetFileName(data_file)
-    reader.Update()
-    print(reader.GetOutput())
+    # Pipeline Profiler (does nothing unless profiling)
+    profiler = PipelineProfiler(profile, profile_overlay)
+    
+    # Slider Latency Tracer
+    tracer = LatencyTracer(latency_log)
+    
+    # Open Data (memory mapped with --mmap, streamed in slabs with --stream-mb)
+    reader = openVolume(data_file, mmap)
+    if stream_mb:
+        volume = VolumeStream(reader, stream_mb)
+        if span or crop or progressive:
+            print("--stream-mb contours the whole volume slab by slab, "
+                  "ignoring --span, --crop and --progressive")
+            span, crop, progressive = False, False, False
+        if bricks:
+            print("--stream-mb contours slab by slab, ignoring --bricks")
+            bricks = None
+    else:
+        volume = None
+    
+    # Volume Metadata (sidecar file, the volume is only read here when it
+    # has to be measured on the first load)
+    if volume is None:
+        meta = loadMetadata(data_file, lambda: readVolume(reader))
+    else:
+        meta = readMetadata(data_file)
+    if meta is not None:
+        printMetadata(data_file, meta)
     
     # Get Min and Max Values
-    range_ = reader.GetOutput().GetScalarRange()
+    if meta is None:
+        range_ = volume.scalarRange()
+    else:
+        range_ = meta['range']
     min_val = int(range_[0])
     max_val = int(range_[1])
     mid_val = (min_val + max_val) // 2
@@ -136,13 +348,11 @@ def main():
     else:
         xVal, yVal, zVal = clip[0], clip[1], clip[2]
     
-    # Get Bounds of Input Data Actor
-    m = vtk.vtkDataSetMapper()
-    m.SetInputConnection(reader.GetOutputPort())
-    
-    a = vtk.vtkActor()
-    a.SetMapper(m)
-    aBo = a.GetBounds()
+    # Get Bounds of Input Data
+    if meta is None:
+        aBo = volume.bounds()
+    else:
+        aBo = meta['bounds']
     xMax, yMax, zMax = int(aBo[1] + 1), int(aBo[3] + 1), int(aBo[5] + 1)    
     
     # Isovalue Color Transfer Function
@@ -153,11 +363,90 @@ def main():
     colorFunction.AddRGBPoint((mid_val + max_val) // 2, 0, 1, 1)
     colorFunction.AddRGBPoint(max_val, 0, 0, 1)
     
-    # Generate Contours
-    contours = vtk.vtkContourFilter()
-    contours.SetInputConnection(reader.GetOutputPort())
+    # Load Data (after the sliders and colours are set up from the metadata)
+    if volume is None:
+        with profiler.stage('read'):
+            readVolume(reader)
+        profiler.watch(reader, 'read')
+    
+    # Contouring Backend and Threads
+    configureThreads(threads)
+    timer = ContourTimer(backend)
+    
+    # Span Space Index (the brick pool skips inactive bricks itself, both
+    # take the brick ranges of the metadata)
+    if bricks:
+        span = False
+    index = None
+    if span:
+        index = buildSpanSpaceIndex(reader.GetOutput(), 
+                                    ranges=metadataBricks(meta, BRICK_SIZE))
+    
+    # Crop Volume to Clip Box
+    cropLower = [xVal, yVal, zVal]
+    if crop:
+        crop = VolumeCrop(cropLower)
+        volumePort = crop.addVolume(reader)
+    else:
+        crop = None
+        volumePort = reader.GetOutputPort()
+    
+    # Generate Contours (slab by slab when streaming, in bricks across a pool)
+    brickPool = None
+    if volume is not None:
+        contours = timer.watch(StreamingContourFilter(volume, backend=backend))
+    elif bricks:
+        ranges = metadataBricks(meta, brick_size)
+        brickPool = BrickPool(bricks, brick_size, 
+                              {tuple(meta['extent']): ranges})
+        contours = timer.watch(BrickContourFilter(brickPool, backend))
+        contours.SetInputConnection(volumePort)
+    else:
+        contours = timer.watch(createContourFilter(index, backend))
+        contours.SetInputConnection(volumePort)
     contours.ComputeNormalsOn()
-    contours.SetValue(0, val)
+    profiler.watch(contours, 'contour')
+    tracer.watch(contours)
+    
+    # Isosurface Cache
+    cache = IsosurfaceCache(cache_mb)
+    dataKey = datasetKey(data_file)
+    surface = vtk.vtkTrivialProducer()
+    
+    # Prefetch of Neighbouring Isovalues (with a contour filter and span
+    # space index of its own, nothing is shared with the prefetch thread)
+    prefetcher = None
+    if prefetch and volume is not None:
+        print("--stream-mb keeps no volume in memory, ignoring --prefetch")
+    elif prefetch:
+        prefetchIndex = None
+        if span:
+            prefetchIndex = buildSpanSpaceIndex(
+                reader.GetOutput(), verbose=False, 
+                ranges=metadataBricks(meta, BRICK_SIZE))
+        prefetcher = IsovaluePrefetcher(reader.GetOutput(), 
+                                        createContourFilter(prefetchIndex, 
+                                                            backend), 
+                                        cacheKey, (min_val, max_val), 
+                                        prefetch, prefetch_step, prefetch_mb, 
+                                        cropLower if crop else None)
+    
+    # Progressive Contouring while Dragging (the background worker keeps the
+    # last full resolution surface on screen instead)
+    worker = None
+    if progressive and background:
+        print("--background keeps the last surface while contouring, "
+              "ignoring --progressive")
+        progressive = False
+    if progressive:
+        progressive = ProgressiveContour(reader.GetOutput(), frame_ms / 1000.0, 
+                                         crop=crop, backend=backend)
+        profiler.watch(progressive.contours, 'contour draft')
+        tracer.watch(progressive.contours)
+    else:
+        progressive = None
+    
+    extractIsosurface(val)
     
     # Define Planes Origins
     origins = vtk.vtkPoints()
@@ -191,7 +480,7 @@ def main():
     # Set Clippers
     xClipper = vtk.vtkClipPolyData()
     xClipper.SetClipFunction(xPlane)
-    xClipper.SetInputConnection(contours.GetOutputPort())
+    xClipper.SetInputConnection(surface.GetOutputPort())
     
     yClipper = vtk.vtkClipPolyData()
     yClipper.SetClipFunction(yPlane)
@@ -202,10 +491,17 @@ def main():
     zClipper.SetInputConnection(yClipper.GetOutputPort())
     
     # Create Mapper and Actor
+    clipped = surface if crop or render_clip else zClipper
     mapper = vtk.vtkDataSetMapper()
-    mapper.SetInputConnection(zClipper.GetOutputPort())
+    mapper.SetInputConnection(clipped.GetOutputPort())
     mapper.SetLookupTable(colorFunction)
     
+    # Clip with the Planes while Rendering
+    if render_clip:
+        mapper.AddClippingPlane(xPlane)
+        mapper.AddClippingPlane(yPlane)
+        mapper.AddClippingPlane(zPlane)
+    
     actor = vtk.vtkActor()
     actor.SetMapper(mapper)
     
@@ -216,7 +512,26 @@ def main():
     iren = vtk.vtkRenderWindowInteractor()
     iren.SetRenderWindow(renWin)
     
+    # Slider Interaction Scheduler (coalesces events to the frame rate)
+    scheduler = InteractionScheduler(iren, fps)
+    tracer.watchScheduler(scheduler)
+    
+    # Level of Detail Proxies while the View Moves (held to the frame rate)
+    levelOfDetail = LevelOfDetail(iren, fps) if lod else None
+    if levelOfDetail is not None:
+        levelOfDetail.add(actor)
+    
+    # Background Contouring Worker
+    if background:
+        worker = PipelineWorker(iren, contours, configureIsosurface, 
+                                deliverIsosurface)
+        tracer.watchWorker(worker)
+    
     ren.AddActor(actor)
+    profiler.watchUpstream(mapper)
+    tracer.watchPipeline(mapper)
+    profiler.watchRenderer(ren)
+    tracer.watchWindow(renWin)
     ren.ResetCamera()
     ren.GetActiveCamera().Elevation(270)
     ren.GetActiveCamera().SetRoll(360)
@@ -229,24 +544,24 @@ def main():
     # Isovalue Slider Bar
     isovalueSlideBar = createSlideBar(min_val, max_val, val, 
                                       0.05, 0.25, 0.55, "Isovalue")
-    isovalueSliderWidget = createSliderWidget(isovalueSlideBar, iren)
-    isovalueSliderWidget.AddObserver("InteractionEvent", 
-                                     vtkIsovalueSlideBarCallback)
+    isovalueSliderWidget = createSliderWidget(isovalueSlideBar, iren, tracer)
+    scheduler.observe(isovalueSliderWidget, vtkIsovalueSlideBarCallback, 
+                      vtkIsovalueSlideBarEndCallback)
     
     # X Plane Value Slider Bar
     xSlideBar = createSlideBar(0, xMax, xVal, 0.05, 0.25, 0.40, "X")
-    xSliderWidget = createSliderWidget(xSlideBar, iren)
-    xSliderWidget.AddObserver("InteractionEvent", vtkXSlideBarCallback)
+    xSliderWidget = createSliderWidget(xSlideBar, iren, tracer)
+    scheduler.observe(xSliderWidget, vtkXSlideBarCallback)
     
     # Y Plane Value Slider Bar
     ySlideBar = createSlideBar(0, yMax, yVal, 0.05, 0.25, 0.25, "Y")
-    ySliderWidget = createSliderWidget(ySlideBar, iren)
-    ySliderWidget.AddObserver("InteractionEvent", vtkYSlideBarCallback)
+    ySliderWidget = createSliderWidget(ySlideBar, iren, tracer)
+    scheduler.observe(ySliderWidget, vtkYSlideBarCallback)
     
     # Z Plane Value Slider Bar
     zSlideBar = createSlideBar(0, zMax, zVal, 0.05, 0.25, 0.1, "Z")
-    zSliderWidget = createSliderWidget(zSlideBar, iren)
-    zSliderWidget.AddObserver("InteractionEvent", vtkZSlideBarCallback)
+    zSliderWidget = createSliderWidget(zSlideBar, iren, tracer)
+    scheduler.observe(zSliderWidget, vtkZSlideBarCallback)
     
     # Isovalue Scalar Bar
     scalarBar = createScalarBar(mapper, "Isovalue", 5)
@@ -257,6 +572,32 @@ def main():
     iren.Initialize()
     renWin.Render()
     iren.Start()
+    
+    if worker is not None:
+        worker.close()
+        worker.printStats()
+    
+    if brickPool is not None:
+        brickPool.close()
+    
+    profiler.dump()
+    
+    scheduler.printStats()
+    
+    tracer.printStats()
+    tracer.dump()
+    
+    timer.printStats()
+    
+    cache.printStats()
+    
+    if prefetcher is not None:
+        prefetcher.close()
+        prefetcher.printStats()
+    
+    if levelOfDetail is not None:
+        levelOfDetail.close()
+        levelOfDetail.printStats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Offscreen rendering of isovalue and camera azimuth sweeps to PNG frames.
+
+Frame i of n renders the isovalue and the azimuth interpolated at i/(n-1)
+along the requested ranges. The frames are split into contiguous runs over
+a pool of worker processes, each one with its own offscreen render window
+and the volumes shared through isoshared, so a pure camera sweep contours
+once per worker.
+"""
+
+import math
+import os
+import time
+from multiprocessing import Pool
+
+import vtk
+
+from iso2dtf import defaultCTF
+from isocontour import BACKENDS, configureThreads, createBackendFilter
+from isometa import loadMetadata
+from isommap import loadVolume
+from isoshared import attachImage, shareVolume
+
+# Get Program Parameters
+def get_program_parameters():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_file', help='isosurface data vti file')
+    parser.add_argument('grad_file', nargs='?',
+                        default=None, help='gradient magnitude vti file')
+    parser.add_argument('--isovalues', dest='isovalues', nargs=2, type=float,
+                        default=None, help='first and last isovalue')
+    parser.add_argument('--azimuth', dest='azimuth', nargs=2, type=float,
+                        default=(0, 0), help='first and last azimuth (deg)')
+    parser.add_argument('--frames', dest='frames', type=int,
+                        default=36, help='number of frames')
+    parser.add_argument('--size', dest='size', nargs=2, type=int,
+                        default=(800, 600), help='frame width and height')
+    parser.add_argument('--out-dir', dest='out_dir', type=str,
+                        default='.', help='output directory')
+    parser.add_argument('--processes', dest='processes', type=int,
+                        default=None, help='worker processes (all cores)')
+    parser.add_argument('--mmap', dest='mmap', action='store_true',
+                        help='memory map uncompressed appended vti files')
+    parser.add_argument('--backend', dest='backend', choices=sorted(BACKENDS),
+                        default='flying-edges', help='contouring algorithm')
+    args = parser.parse_args()
+    if args.frames < 1:
+        parser.error("--frames must be at least 1")
+    return (args.data_file, args.grad_file, args.isovalues, args.azimuth,
+            args.frames, args.size, args.out_dir, args.processes, args.backend,
+            args.mmap)
+
+
+"""
+- Sweep Methods
+"""
+
+# Interpolate Range Method
+def interpolate(range_, i, frames):
+    t = i / (frames - 1) if frames > 1 else 0.0
+    return range_[0] + t * (range_[1] - range_[0])
+
+# Frame File Name Method
+def frameFileName(outDir, dataFile, i):
+    name = os.path.splitext(os.path.basename(dataFile))[0]
+    return os.path.join(outDir, f"{name}-{i:05d}.png")
+
+
+"""
+- Worker Methods
+"""
+
+# Initialize Worker Method (one offscreen render window per worker)
+def initWorker(dataDescription, gradDescription, options):
+    global worker
+    configureThreads(1)
+    worker = dict(options)
+    worker['shared'] = list()
+
+    dataBlock, dataValues, dataImage = attachImage(dataDescription)
+    worker['shared'].append((dataBlock, dataValues))
+    contours = createBackendFilter(options['backend'])
+    contours.SetInputData(dataImage)
+    contours.ComputeNormalsOn()
+    worker['contours'] = contours
+    output = contours
+
+    # Colour by Gradient Magnitude when given, else by Isovalue
+    if gradDescription is None:
+        range_ = dataImage.GetScalarRange()
+    else:
+        gradBlock, gradValues, gradImage = attachImage(gradDescription)
+        worker['shared'].append((gradBlock, gradValues))
+        probe = vtk.vtkProbeFilter()
+        probe.SetInputConnection(contours.GetOutputPort())
+        probe.SetSourceData(gradImage)
+        output = probe
+        range_ = gradImage.GetScalarRange()
+
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputConnection(output.GetOutputPort())
+    mapper.SetLookupTable(defaultCTF(range_[0], range_[1]))
+
+    actor = vtk.vtkActor()
+    actor.SetMapper(mapper)
+
+    ren = vtk.vtkRenderer()
+    ren.AddActor(actor)
+    ren.SetBackground(0.25, 0.25, 0.25)
+    ren.ResetCamera(dataImage.GetBounds())
+    ren.GetActiveCamera().Elevation(270)
+    ren.GetActiveCamera().SetRoll(360)
+    renWin = vtk.vtkRenderWindow()
+    renWin.SetOffScreenRendering(1)
+    renWin.AddRenderer(ren)
+    renWin.SetSize(*options['size'])
+
+    grabber = vtk.vtkWindowToImageFilter()
+    grabber.SetInput(renWin)
+    writer = vtk.vtkPNGWriter()
+    writer.SetInputConnection(grabber.GetOutputPort())
+
+    camera = ren.GetActiveCamera()
+    worker['camera'] = (camera.GetPosition(), camera.GetFocalPoint(),
+                        camera.GetViewUp())
+    worker.update(ren=ren, renWin=renWin, grabber=grabber, writer=writer)
+
+# Render Frame Method (runs in a worker)
+def renderFrame(i):
+    global worker
+    start = time.perf_counter()
+    frames = worker['frames']
+    worker['contours'].SetValue(0, interpolate(worker['isovalues'], i,
+                                               frames))
+
+    camera = worker['ren'].GetActiveCamera()
+    position, focalPoint, viewUp = worker['camera']
+    camera.SetPosition(position)
+    camera.SetFocalPoint(focalPoint)
+    camera.SetViewUp(viewUp)
+    camera.Azimuth(interpolate(worker['azimuth'], i, frames))
+    worker['ren'].ResetCameraClippingRange()
+
+    worker['renWin'].Render()
+    worker['grabber'].Modified()
+    fileName = frameFileName(worker['out_dir'], worker['data_file'], i)
+    worker['writer'].SetFileName(fileName)
+    worker['writer'].Write()
+    return i, time.perf_counter() - start
+
+
+"""
+- Main Method
+"""
+
+def main():
+    (data_file, grad_file, isovalues, azimuth, frames, size, out_dir,
+     processes, backend, mmap) = get_program_parameters()
+
+    # Load Data (memory mapped with --mmap)
+    dataReader = loadVolume(data_file, mmap)
+
+    # Load Gradient Magnitude
+    if grad_file is None:
+        gradReader = None
+    else:
+        gradReader = loadVolume(grad_file, mmap)
+
+    # Default Isovalue is the Middle of the Data Range
+    if isovalues is None:
+        range_ = loadMetadata(data_file, dataReader.GetOutput)['range']
+        isovalues = ((range_[0] + range_[1]) / 2,) * 2
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Share Volumes with the Workers (mapped files share the page cache)
+    blocks = list()
+    dataBlock, dataDescription = shareVolume(dataReader, data_file)
+    blocks.append(dataBlock)
+    if gradReader is None:
+        gradDescription = None
+    else:
+        gradBlock, gradDescription = shareVolume(gradReader, grad_file)
+        blocks.append(gradBlock)
+
+    # Render Contiguous Runs of Frames across the Process Pool
+    options = {'data_file': data_file, 'out_dir': out_dir,
+               'isovalues': isovalues, 'azimuth': azimuth, 'frames': frames,
+               'size': size, 'backend': backend}
+    if processes is None:
+        processes = os.cpu_count()
+    processes = max(1, min(processes, frames))
+    chunk = math.ceil(frames / processes)
+    start = time.perf_counter()
+    try:
+        with Pool(processes, initWorker,
+                  (dataDescription, gradDescription, options)) as pool:
+            times = [seconds for i, seconds in pool.imap_unordered(
+                renderFrame, range(frames), chunk)]
+    finally:
+        for block in blocks:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    seconds = time.perf_counter() - start
+    fps = frames / seconds
+    print(f"{frames} frames with {processes} processes in {seconds:.2f} s: "
+          f"{fps:.1f} fps, {fps / processes:.1f} fps per core "
+          f"({1000 * sum(times) / frames:.1f} ms per frame)")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Background extraction of the pipeline feeding the renderer.
+
+The slider callbacks used to run the contour, probe and clip filters
+synchronously inside the render loop, so the window froze while a large
+extraction ran. With the worker the callbacks only submit a snapshot of
+their parameters. A worker thread applies the latest snapshot to the
+extraction pipeline (which nothing on the main thread touches), updates it
+and hands a copy of its output back. An interactor timer then swaps that
+output in on the main thread, so the previous surface stays on screen until
+the new one is complete. A submission supersedes the job waiting before it
+and aborts the one running, whose output is discarded. VTK releases the GIL
+while a filter executes, so the camera keeps rotating during extraction.
+Snapshots are applied holding the worker's lock, which the main thread takes
+too before changing any object the pipeline shares with the renderer. A job
+that raises is reported and dropped, and the worker keeps serving the next.
+"""
+
+import threading
+import time
+import traceback
+
+from isocache import copyOutput
+from isoprofile import upstreamAlgorithms
+
+
+"""
+- Pipeline Worker Class
+"""
+
+class PipelineWorker:
+
+    # Constructor Method (configure applies a parameter snapshot to the
+    # pipeline ending at algorithm on the worker thread, deliver receives
+    # the snapshot and the copied output on the main thread)
+    def __init__(self, interactor, algorithm, configure, deliver, pollMs=15):
+        self.interactor = interactor
+        self.algorithm = algorithm
+        self.configure = configure
+        self.deliver = deliver
+        self.pollMs = pollMs
+        self.condition = threading.Condition()
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.job = None
+        self.running = None
+        self.result = None
+        self.timer = None
+        self.closed = False
+        self.submitted = 0
+        self.delivered = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        interactor.AddObserver("TimerEvent", self.poll)
+
+    # Update Method (synchronous, before any job has been submitted)
+    def update(self, parameters):
+        self.cancel()
+        self.deliver(parameters, self.extract(parameters))
+
+    # Submit Method (snapshot of the parameters to extract with)
+    def submit(self, parameters):
+        with self.condition:
+            self.cancel()
+            self.job = (self.generation, parameters)
+            self.submitted += 1
+            self.condition.notify()
+        if self.timer is None:
+            self.timer = self.interactor.CreateRepeatingTimer(self.pollMs)
+
+    # Idle Method (no job waiting, running or waiting to be swapped in)
+    def idle(self):
+        with self.condition:
+            return (self.job is None and self.running is None
+                    and self.result is None)
+
+    # Cancel Method (drops the waiting job and aborts the running one)
+    def cancel(self):
+        with self.condition:
+            if self.job is not None:
+                self.job = None
+                self.cancelled += 1
+            if self.running == self.generation:
+                self.abort(1)
+                self.cancelled += 1
+            self.generation += 1
+            self.result = None
+
+    # Abort Method (sets the abort flag of every filter of the pipeline)
+    def abort(self, flag):
+        for algorithm in upstreamAlgorithms(self.algorithm):
+            algorithm.SetAbortExecute(flag)
+
+    # Extract Method (configures and updates the pipeline, copies the output)
+    def extract(self, parameters):
+        with self.lock:
+            self.configure(parameters)
+        self.algorithm.Update()
+        return copyOutput(self.algorithm)
+
+    # Worker Thread Method
+    def run(self):
+        while True:
+            with self.condition:
+                while self.job is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                generation, parameters = self.job
+                self.job = None
+                self.running = generation
+                self.abort(0)
+            start = time.perf_counter()
+            try:
+                polyData = self.extract(parameters)
+            except Exception:
+                print(f"Background extraction of {parameters} failed:")
+                traceback.print_exc()
+                polyData = None
+            with self.condition:
+                self.running = None
+                self.busy += time.perf_counter() - start
+                if polyData is None:
+                    self.failed += 1
+                    self.reset()
+                elif generation == self.generation:
+                    self.result = (parameters, polyData)
+                else:
+                    self.reset()
+
+    # Reset Method (aborted filters execute again on the next update)
+    def reset(self):
+        for algorithm in upstreamAlgorithms(self.algorithm):
+            if algorithm.GetAbortExecute():
+                algorithm.SetAbortExecute(0)
+                if algorithm.GetNumberOfInputPorts() > 0:
+                    algorithm.Modified()
+
+    # Timer Event Callback Method (swaps the finished output in)
+    def poll(self, obj, event):
+        if self.timer is None or obj.GetTimerEventId() != self.timer:
+            return
+        with self.condition:
+            result = self.result
+            self.result = None
+            idle = self.job is None and self.running is None
+        if result is not None:
+            self.deliver(*result)
+            self.delivered += 1
+            self.interactor.Render()
+        if idle:
+            self.interactor.DestroyTimer(self.timer)
+            self.timer = None
+
+    # Close Method (stops the worker thread)
+    def close(self):
+        self.cancel()
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    # Print Statistics Method
+    def printStats(self, name="Background worker"):
+        print(f"{name}: {self.submitted} jobs, {self.delivered} swapped in, "
+              f"{self.cancelled} stale jobs cancelled, "
+              f"{self.failed} failed, {self.busy:.2f} s busy")
\ No newline at end of file